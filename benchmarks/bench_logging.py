@@ -0,0 +1,94 @@
+"""
+Замер накладных расходов на одну запись лога в режимах rich и json.
+
+    cd src && python ../benchmarks/bench_logging.py [N]
+
+Вывод логов уходит в /dev/null, измеряется время вызова logger.info
+в горячем цикле (включая форматирование для rich и постановку в очередь для json).
+"""
+
+import importlib.util
+import logging
+import os
+import queue
+import sys
+import time
+from logging.handlers import QueueListener
+from pathlib import Path
+
+from rich.console import Console
+from rich.logging import RichHandler
+
+
+def _load_logger_config():
+    """
+    cli/logger_config.py без пакета cli: его __init__ подключает все команды.
+    Режим rich — чтобы модуль не вешал свой JSON-обработчик на root.
+    """
+    os.environ["MDP_LOG_FORMAT"] = "rich"
+    path = Path(__file__).resolve().parent.parent / "src" / "cli" / "logger_config.py"
+    spec = importlib.util.spec_from_file_location("bench_logger_config", path)
+    assert spec and spec.loader
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+logger_config = _load_logger_config()
+
+FMT = "%(asctime)s [%(levelname)s] %(name)s:%(lineno)d — %(funcName)s() — %(message)s"
+
+
+def _bench(logger: logging.Logger, n: int, lazy: bool) -> float:
+    path, url = Path("img/picture.png"), "https://i.ibb.co/abc/picture.png"
+    start = time.perf_counter()
+    for _ in range(n):
+        if lazy:
+            logger.info("Загружено %s → %s", path, url)
+        else:
+            logger.info(f"Загружено {path} → {url}")
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def _make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+def main(n: int = 20000) -> None:
+    with open(os.devnull, "w") as sink:
+        rich = RichHandler(console=Console(file=sink, width=120), show_path=False)
+        rich.setFormatter(logger_config.ColorFormatter(FMT, datefmt="%H:%M:%S"))
+        rich_logger = _make_logger("bench.rich", rich)
+
+        stream = logging.StreamHandler(sink)
+        stream.setFormatter(logger_config.JsonFormatter())
+        q: queue.SimpleQueue = queue.SimpleQueue()
+        listener = QueueListener(q, stream)
+        json_logger = _make_logger("bench.json", logger_config.JsonQueueHandler(q))
+        listener.start()
+
+        disabled_logger = _make_logger("bench.disabled", logging.NullHandler())
+        disabled_logger.setLevel(logging.WARNING)
+
+        results = [
+            ("rich, f-string", _bench(rich_logger, n, lazy=False)),
+            ("rich, %-format", _bench(rich_logger, n, lazy=True)),
+            ("json+queue, f-string", _bench(json_logger, n, lazy=False)),
+            ("json+queue, %-format", _bench(json_logger, n, lazy=True)),
+            ("отключённый уровень, f-string", _bench(disabled_logger, n, lazy=False)),
+            ("отключённый уровень, %-format", _bench(disabled_logger, n, lazy=True)),
+        ]
+        listener.stop()
+
+    print(f"Записей: {n}")
+    for name, us in results:
+        print(f"{name:<32} {us:8.2f} мкс/запись")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
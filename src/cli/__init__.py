@@ -11,6 +11,34 @@ app = typer.Typer(help="Главное CLI-приложение")
 @app.callback()
 def main():
     """Главная точка входа для CLI."""
+    from config import settings
+    from core import build, metrics, preflight, retry
+    from utils import block_cache, upload_img
+    from utils.image_hosts import build_hosts
+
+    if settings.METRICS_FILE:
+        metrics.enable_textfile(settings.METRICS_FILE)
+    retry.configure(
+        retry.RetryPolicy(
+            max_attempts=settings.RETRY_MAX_ATTEMPTS,
+            base_delay=settings.RETRY_BASE_DELAY,
+            max_delay=settings.RETRY_MAX_DELAY,
+        ),
+        failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=settings.BREAKER_RESET_TIMEOUT,
+    )
+    build.configure(settings.BUILD_DIR)
+    block_cache.configure(settings.BLOCK_CACHE_DB)
+    preflight.configure(settings.PREFLIGHT)
+    upload_img.configure(
+        build_hosts(
+            settings.IMAGE_HOSTS,
+            imgbb_api_key=settings.IMGBB_API_KEY,
+            http_upload_url=settings.IMAGE_HTTP_UPLOAD_URL,
+            http_public_url=settings.IMAGE_HTTP_PUBLIC_URL,
+            http_token=settings.IMAGE_HTTP_TOKEN,
+        )
+    )
     logger.debug("Контекст приложения инициализирован")
 
 
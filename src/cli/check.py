@@ -0,0 +1,112 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from cli.links import check_links
+from cli.logger_config import logger
+from config import settings
+from core.build import iter_sources
+from core.preflight import ERROR, WARNING, Problem, check_files
+
+app = typer.Typer(help="Проверка исходников до публикации")
+console = Console()
+
+TARGETS = ("tg", "gr")
+
+
+@app.command()
+def run(
+    paths: List[Path] = typer.Argument(..., help="Markdown-файлы или каталоги"),
+    target: Optional[List[str]] = typer.Option(
+        None, "--target", "-t", help="Что проверять: tg, gr (по умолчанию оба)"
+    ),
+    jobs: int = typer.Option(
+        os.cpu_count() or 1, "--jobs", "-j", help="Количество процессов"
+    ),
+    as_json: bool = typer.Option(False, "--json", help="Вывести результат в JSON"),
+    strict: bool = typer.Option(
+        False, "--strict", help="Считать предупреждения ошибками"
+    ),
+    links: bool = typer.Option(
+        False, "--links", help="Проверить и внешние ссылки (нужна сеть)"
+    ),
+):
+    """
+    Офлайн-проверка того, что уйдёт в API: баланс и допустимость тегов,
+    лимиты длины Telegram (в UTF-16), структура страницы Telegraph,
+    наличие и размер локальных изображений. Сеть не используется,
+    кроме проверки ссылок с --links (как `mdp links run`).
+    """
+    targets = target or list(TARGETS)
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        logger.error(f"❌Неизвестная цель: {', '.join(sorted(unknown))}")
+        raise typer.Exit(1)
+    md_paths = [str(src) for path in paths for src in iter_sources(path.expanduser())]
+    if not md_paths:
+        logger.warning("Нет Markdown-файлов для проверки")
+        raise typer.Exit(1)
+
+    start = time.perf_counter()
+    reports = check_files(md_paths, targets, settings.TELEGRAM_FORMAT, jobs=jobs)
+    if links:
+        for report, checked in zip(reports, check_links(md_paths)):
+            for link in checked.results:
+                if link.result != "ok":
+                    severity = ERROR if link.result == "broken" else WARNING
+                    message = f"{link.url}: {link.error or link.status}"
+                    report.problems.append(Problem(severity, "link", message))
+    elapsed = time.perf_counter() - start
+
+    def failed(problems) -> bool:
+        return any(strict or p.severity == ERROR for p in problems)
+
+    if as_json:
+        print(
+            json.dumps(
+                [
+                    {
+                        "md_path": r.md_path,
+                        "ok": not failed(r.problems),
+                        "problems": [
+                            {
+                                "severity": p.severity,
+                                "where": p.where,
+                                "message": p.message,
+                            }
+                            for p in r.problems
+                        ],
+                    }
+                    for r in reports
+                ],
+                ensure_ascii=False,
+                indent=1,
+            )
+        )
+    else:
+        table = Table(title="Проверка перед публикацией")
+        table.add_column("Файл", style="magenta")
+        table.add_column("Где")
+        table.add_column("Проблема")
+        for report in reports:
+            for p in report.problems:
+                style = "red" if p.severity == ERROR else "yellow"
+                table.add_row(report.md_path, p.where, f"[{style}]{p.message}[/]")
+        if table.row_count:
+            console.print(table)
+
+    bad = [r for r in reports if failed(r.problems)]
+    logger.info(
+        f"Проверено {len(reports)} файлов за {elapsed:.2f} сек., с ошибками {len(bad)}"
+    )
+    if bad:
+        raise typer.Exit(1)
+
+
+app.command("c", help="Алиас для run")(run)
@@ -2,6 +2,7 @@ import json
 import sys
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 import pandas as pd
 import typer
@@ -10,7 +11,10 @@ from rich.table import Table
 
 from cli.logger_config import logger
 from config import settings
-from core.telegraph import TelegraphClient
+from core.credentials import PinStore, TelegraphPool
+from core.telegraph_mirror import pull_pages
+from core.views_history import ViewsStore
+from utils.manifest import save_manifest
 
 app = typer.Typer(help="Команды для TeleGraph")
 console = Console()
@@ -21,7 +25,11 @@ if not settings.TELEGRAM_BOT_TOKEN:
 if not settings.TELEGRAM_CHANNEL:
     logger.warning("❌ Tg канал отсутствует")
 
-client = TelegraphClient(settings.TELEGRAPH_ACCESS_TOKEN or "None")
+client = TelegraphPool.from_tokens(
+    settings.TELEGRAPH_ACCESS_TOKENS,
+    pins=PinStore(settings.CREDENTIALS_DB),
+    imgbb_api_key=settings.IMGBB_API_KEY,
+)
 channel = settings.TELEGRAM_CHANNEL or "None"
 
 
@@ -44,13 +52,22 @@ def edit(page_path: str, md_path: str):
 
 
 @app.command()
-def post(md_path: str, title=None):
+def post(
+    md_path: str,
+    title=None,
+    manifest: Optional[Path] = typer.Option(
+        None, help="Сохранить URL страницы в JSON-файл (для mdp reconcile)"
+    ),
+):
     """
     Пост страницы в Telegraph
     """
     result = client.create_page(md_path=md_path, title=title)
     if result.get("url"):
         logger.info(f"Страница доступна по адресу: {result["url"]}")
+        if manifest:
+            out = save_manifest(manifest, {"md_path": md_path, "url": result["url"]})
+            logger.info(f"Манифест сохранён: {out}")
     else:
         logger.warning(f"Ошибка создания страницы из: {md_path}")
 
@@ -68,37 +85,13 @@ def get_pages_list(
     Если указан параметр --output-path, сохраняет результат в Excel-файл (с добавлением timestamp).
     Иначе — печатает краткую таблицу в консоль.
     """
-    all_pages: list[dict] = []
-    offset = 0
-
-    # пагинация: запрашиваем пока не соберём total_count страниц
-    while True:
-        try:
-            data = client.get_pages_list(limit=limit, offset=offset)
-        except Exception as e:
-            logger.critical(f"Ошибка при запросе к Telegraph API: {e}")
-            sys.exit(1)
-
-        if not isinstance(data, dict):
-            logger.critical(
-                "Ошибка: ответ API не является словарём (ожидалось .json())."
-            )
-            sys.exit(1)
-
-        if not data.get("ok"):
-            logger.critical(f"Ошибка Telegraph API: {data}")
-            sys.exit(1)
-
-        result = data.get("result", {})
-        pages = result.get("pages", [])
-        # pages — список словарей; добавляем их в общий список
-        all_pages.extend(pages)
-
-        total_count = result.get("total_count", 0) or 0
-        offset += limit
-
-        if offset >= total_count:
-            break
+    # пагинация по всем аккаунтам пула: total_count узнаём первым запросом,
+    # остальные страницы списка запрашиваются параллельно
+    try:
+        all_pages: list[dict] = client.list_all_pages(limit=limit)
+    except Exception as e:
+        logger.critical(f"Ошибка при запросе к Telegraph API: {e}")
+        sys.exit(1)
 
     # Нет данных
     if not all_pages:
@@ -174,6 +167,120 @@ def rm(path: str):
     logger.info(f"{path} - {result["title"]}")
 
 
+@app.command()
+def pull(
+    output_dir: Path = typer.Argument(..., help="Каталог локального зеркала"),
+    jobs: int = typer.Option(8, help="Количество параллельных загрузок"),
+    limit: int = typer.Option(50, help="Количество элементов за один запрос к API"),
+):
+    """
+    Резервная копия страниц Telegraph в Markdown.
+    Неизменившиеся страницы (по хешу содержимого) не перезаписываются.
+    """
+    try:
+        stats = pull_pages(client, output_dir, jobs=jobs, limit=limit)
+    except Exception as e:
+        logger.critical(f"Ошибка при запросе к Telegraph API: {e}")
+        sys.exit(1)
+
+    logger.info(
+        f"Зеркало {output_dir}: записано {stats.written}, "
+        f"без изменений {stats.skipped}, ошибок {len(stats.failed)}"
+    )
+    if stats.failed:
+        logger.warning(f"Не скачаны: {', '.join(stats.failed)}")
+        raise typer.Exit(1)
+
+
+@app.command()
+def snapshot(
+    jobs: int = typer.Option(4, help="Количество параллельных запросов"),
+    limit: int = typer.Option(200, help="Количество элементов за один запрос к API"),
+):
+    """
+    Сохраняет текущие просмотры всех страниц в историю (для запуска по cron).
+    """
+    try:
+        pages = client.list_all_pages(limit=limit, jobs=jobs)
+    except Exception as e:
+        logger.critical(f"Ошибка при запросе к Telegraph API: {e}")
+        sys.exit(1)
+
+    store = ViewsStore(settings.VIEWS_DB)
+    try:
+        run_id = store.add_snapshot(pages)
+    finally:
+        store.close()
+    logger.info(
+        f"Снимок {run_id}: {len(pages)} страниц сохранено в {settings.VIEWS_DB}"
+    )
+
+
+@app.command()
+def stats(
+    days: float = typer.Option(7.0, help="Окно в днях"),
+    top: int = typer.Option(10, help="Сколько страниц показать"),
+):
+    """
+    Прирост просмотров за окно: итог, по дням и страницы с наибольшим ростом.
+    """
+    store = ViewsStore(settings.VIEWS_DB)
+    try:
+        result = store.stats(days=days)
+    finally:
+        store.close()
+
+    if result.runs < 2:
+        logger.warning(
+            "Недостаточно снимков для расчёта прироста, запустите gr snapshot"
+        )
+        return
+
+    start = datetime.fromtimestamp(result.start or 0).isoformat(timespec="minutes")
+    end = datetime.fromtimestamp(result.end or 0).isoformat(timespec="minutes")
+    pages = result.pages.to_dict("records")
+    views = sum(int(page["views"]) for page in pages)
+    delta = sum(int(page["delta"]) for page in pages)
+    console.print(
+        f"Снимков: {result.runs} ({start} — {end}), страниц: {len(pages)}, "
+        f"просмотров: {views} (+{delta})"
+    )
+
+    daily = Table(title="Просмотры по дням")
+    daily.add_column("День", style="cyan")
+    daily.add_column("Всего", justify="right")
+    daily.add_column("Прирост", justify="right", style="green")
+    dates = pd.DatetimeIndex(result.daily.index)
+    for day, total, diff in zip(
+        dates, result.daily.tolist(), result.daily.diff().tolist()
+    ):
+        daily.add_row(
+            day.strftime("%Y-%m-%d"),
+            str(total),
+            "-" if pd.isna(diff) else f"{int(diff):+d}",
+        )
+    console.print(daily)
+
+    table = Table(title=f"Топ-{top} по приросту")
+    table.add_column("№", justify="right", style="cyan")
+    table.add_column("Заголовок", style="bold")
+    table.add_column("Путь", style="magenta")
+    table.add_column("Просмотры", justify="right")
+    table.add_column("Прирост", justify="right", style="green")
+    table.add_column("%", justify="right")
+    for i, page in enumerate(pages[:top], start=1):
+        growth = "-" if pd.isna(page["growth"]) else f"{page['growth']:.0%}"
+        table.add_row(
+            str(i),
+            str(page["title"]),
+            str(page["path"]),
+            str(page["views"]),
+            f"{int(page['delta']):+d}",
+            growth,
+        )
+    console.print(table)
+
+
 app.command("e", help="Алиас для edit")(edit)
 app.command("p", help="Алиас для post")(post)
 app.command("gpl", help="Алиас для get_pages_list")(get_pages_list)
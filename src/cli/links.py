@@ -0,0 +1,132 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import List, Sequence
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from cli.logger_config import logger
+from config import settings
+from core.build import iter_sources
+from core.links import LinkCache, LinkChecker, LinkReport, check_files
+
+app = typer.Typer(help="Проверка внешних ссылок в исходниках")
+console = Console()
+
+_STYLES = {"ok": "green", "unknown": "yellow", "broken": "red"}
+
+
+def check_links(
+    md_paths: Sequence[str], jobs: int = 16, refresh: bool = False
+) -> List[LinkReport]:
+    """Проверка ссылок файлов с настройками и кешем из settings."""
+    cache = (
+        LinkCache(settings.LINK_CACHE_DB, settings.LINK_CACHE_TTL)
+        if settings.LINK_CACHE_DB
+        else None
+    )
+    checker = LinkChecker(
+        jobs=jobs,
+        per_host=settings.LINK_PER_HOST,
+        delay=settings.LINK_HOST_DELAY,
+        timeout=settings.LINK_TIMEOUT,
+        cache=cache,
+    )
+    try:
+        return asyncio.run(check_files(md_paths, checker, refresh))
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+@app.command()
+def run(
+    paths: List[Path] = typer.Argument(..., help="Markdown-файлы или каталоги"),
+    jobs: int = typer.Option(16, "--jobs", "-j", help="Параллельных запросов"),
+    refresh: bool = typer.Option(
+        False, "--refresh", help="Не брать результаты из кеша"
+    ),
+    as_json: bool = typer.Option(False, "--json", help="Вывести результат в JSON"),
+    show_all: bool = typer.Option(False, "--all", help="Показать и рабочие ссылки"),
+    strict: bool = typer.Option(
+        False,
+        "--strict",
+        help="Считать неопределённые ссылки (429, 503, таймаут) битыми",
+    ),
+):
+    """
+    Проверяет внешние ссылки отрендеренных документов: HEAD (при отказе — GET)
+    параллельно, с ограничением запросов к одному хосту. Рабочие ссылки
+    кешируются на MDP_LINK_CACHE_TTL секунд. Код выхода 1 — есть битые ссылки.
+    """
+    md_paths = [str(src) for path in paths for src in iter_sources(path.expanduser())]
+    if not md_paths:
+        logger.warning("Нет Markdown-файлов для проверки")
+        raise typer.Exit(1)
+
+    start = time.perf_counter()
+    reports = check_links(md_paths, jobs, refresh)
+    elapsed = time.perf_counter() - start
+
+    def bad(result) -> bool:
+        return result.result == "broken" or (strict and result.result == "unknown")
+
+    if as_json:
+        print(
+            json.dumps(
+                [
+                    {
+                        "md_path": r.md_path,
+                        "error": r.error,
+                        "links": [
+                            {
+                                "url": link.url,
+                                "result": link.result,
+                                "status": link.status,
+                                "final_url": link.final_url,
+                                "error": link.error,
+                                "cached": link.cached,
+                            }
+                            for link in r.results
+                        ],
+                    }
+                    for r in reports
+                ],
+                ensure_ascii=False,
+                indent=1,
+            )
+        )
+    else:
+        table = Table(title="Проверка ссылок")
+        table.add_column("Файл", style="magenta")
+        table.add_column("Ссылка")
+        table.add_column("Результат")
+        for report in reports:
+            if report.error:
+                table.add_row(report.md_path, "", f"[red]{report.error}[/]")
+            for link in report.results:
+                if link.result == "ok" and not show_all:
+                    continue
+                note = link.error or str(link.status)
+                if link.cached:
+                    note += " (кеш)"
+                style = _STYLES[link.result]
+                table.add_row(report.md_path, link.url, f"[{style}]{note}[/]")
+        if table.row_count:
+            console.print(table)
+
+    links = {link.url: link for r in reports for link in r.results}
+    broken = [link for link in links.values() if bad(link)]
+    failed = [r for r in reports if r.error]
+    logger.info(
+        f"Ссылок: {len(links)} в {len(reports)} файлах за {elapsed:.2f} сек., "
+        f"из кеша {sum(link.cached for link in links.values())}, битых {len(broken)}"
+    )
+    if broken or failed:
+        raise typer.Exit(1)
+
+
+app.command("l", help="Алиас для run")(run)
@@ -1,6 +1,14 @@
 from __future__ import annotations
 
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
 from rich.console import Console
 from rich.logging import RichHandler
@@ -8,6 +16,11 @@ from rich.text import Text
 
 console = Console()
 
+# rich — цветной вывод для терминала, json — JSON lines для CI / cron / пайпов.
+# По умолчанию выбирается автоматически: json, если stdout не терминал.
+LOG_FORMAT = os.getenv("MDP_LOG_FORMAT") or ("rich" if sys.stdout.isatty() else "json")
+LOG_LEVEL = os.getenv("MDP_LOG_LEVEL", "INFO").upper()
+
 
 class ColorFormatter(logging.Formatter):
     LEVEL_STYLES = {
@@ -26,14 +39,84 @@ class ColorFormatter(logging.Formatter):
         return message
 
 
-handler = RichHandler(console=console, show_path=False)
-handler.setFormatter(
-    ColorFormatter(
-        "%(asctime)s [%(levelname)s] %(name)s:%(lineno)d — %(funcName)s() — %(message)s",
-        datefmt="%H:%M:%S",
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON, трассировка исключения — в поле exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "line": record.lineno,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class JsonQueueHandler(QueueHandler):
+    """
+    QueueHandler.prepare() склеивает трассировку с сообщением и сбрасывает
+    exc_info (его нельзя передать в другой поток). Здесь сообщение и
+    трассировка готовятся по отдельности: трассировка остаётся в exc_text,
+    и JsonFormatter в потоке QueueListener выводит её в поле exc.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+def _rich_handler() -> logging.Handler:
+    handler = RichHandler(console=console, show_path=False)
+    handler.setFormatter(
+        ColorFormatter(
+            "%(asctime)s [%(levelname)s] %(name)s:%(lineno)d — %(funcName)s() — %(message)s",
+            datefmt="%H:%M:%S",
+        )
     )
-)
+    return handler
+
+
+def _json_queue_handler() -> tuple[logging.Handler, QueueListener]:
+    """
+    QueueHandler кладёт запись в очередь (подставив аргументы в сообщение),
+    а JSON и запись в поток готовит отдельный поток QueueListener —
+    ввод-вывод не тормозит горячий путь.
+    """
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    return JsonQueueHandler(log_queue), listener
+
 
 logger = logging.getLogger("cli")
-logger.setLevel(logging.INFO)
-logger.addHandler(handler)
+logger.setLevel(LOG_LEVEL)
+
+if LOG_FORMAT == "json":
+    queue_handler, listener = _json_queue_handler()
+    # Вешаем на root, чтобы логи core/* и utils/* тоже шли в JSON
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+    # httpx пишет в INFO строку на каждый запрос — это шум, а не события
+    for name in ("httpx", "httpcore"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    listener.start()
+    atexit.register(listener.stop)
+else:
+    handler = _rich_handler()
+    logger.addHandler(handler)
@@ -0,0 +1,296 @@
+import asyncio
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from cli.logger_config import logger
+from config import settings
+from core.credentials import PinStore, TelegramPool, TelegraphPool
+from core.reconcile import (
+    DRIFTED,
+    ERROR,
+    IN_SYNC,
+    MISSING,
+    ReconcileItem,
+    Target,
+    check_messages,
+    check_pages,
+    load_manifest_targets,
+    push_drifted,
+    targets_from_record,
+)
+from core.scanner import save_index, scan
+from core.scheduler import ScheduleStore
+from core.telegram import TransportConfig
+
+app = typer.Typer(help="Сверка опубликованного с локальными исходниками")
+console = Console()
+
+_STYLES = {IN_SYNC: "green", DRIFTED: "yellow", MISSING: "red", ERROR: "red"}
+
+
+def _schedule_targets() -> List[Target]:
+    if not settings.SCHEDULE_DB.exists():
+        return []
+    store = ScheduleStore(settings.SCHEDULE_DB)
+    try:
+        return [
+            target
+            for status in ("done", "partial")
+            for job in store.list(status)
+            for target in targets_from_record(job.md_path, job.result or {})
+        ]
+    finally:
+        store.close()
+
+
+@app.command()
+def run(
+    manifests: Optional[List[Path]] = typer.Argument(
+        None, help="Манифесты публикаций (--manifest) или каталоги с ними"
+    ),
+    schedule: bool = typer.Option(
+        True, help="Учитывать публикации, выполненные планировщиком"
+    ),
+    jobs: int = typer.Option(8, "--jobs", "-j", help="Параллельных запросов"),
+    push: bool = typer.Option(
+        False, "--push", help="Перезаписать разошедшиеся публикации локальной версией"
+    ),
+    as_json: bool = typer.Option(False, "--json", help="Вывести результат в JSON"),
+    show_all: bool = typer.Option(
+        False, "--all", help="Показать и совпадающие публикации"
+    ),
+):
+    """
+    Находит публикации, содержимое которых разошлось с локальным рендером
+    (правки в браузере или вручную в канале), и пропавшие публикации.
+    Сообщения сравниваются по копиям, пересланным в TELEGRAM_RECONCILE_CHAT.
+    """
+    targets: Dict[str, Target] = {}
+    for target in _schedule_targets() if schedule else []:
+        targets[target.key] = target
+    for target in load_manifest_targets(manifests or []):
+        targets[target.key] = target
+    if not targets:
+        logger.warning("Нет публикаций для сверки: укажите манифесты")
+        return
+
+    pages = [t for t in targets.values() if t.kind == "gr"]
+    messages = [t for t in targets.values() if t.kind != "gr"]
+    if messages and not settings.TELEGRAM_RECONCILE_CHAT:
+        logger.warning(
+            f"Сообщения пропущены ({len(messages)}): не задан TELEGRAM_RECONCILE_CHAT"
+        )
+        messages = []
+
+    pins = PinStore(settings.CREDENTIALS_DB)
+    gr = TelegraphPool.from_tokens(
+        settings.TELEGRAPH_ACCESS_TOKENS,
+        pins=pins,
+        imgbb_api_key=settings.IMGBB_API_KEY,
+    )
+    tg = TelegramPool.from_tokens(
+        settings.TELEGRAM_BOT_TOKENS,
+        pins=pins,
+        per_chat_interval=settings.TELEGRAM_PER_CHAT_INTERVAL,
+        transport=TransportConfig(**settings.TELEGRAM_TRANSPORT),
+        imgbb_api_key=settings.IMGBB_API_KEY,
+    )
+
+    async def main() -> tuple[List[ReconcileItem], Dict[str, bool]]:
+        async with tg:
+            page_items, message_items = await asyncio.gather(
+                asyncio.to_thread(check_pages, gr, pages, jobs),
+                check_messages(
+                    tg,
+                    messages,
+                    settings.TELEGRAM_RECONCILE_CHAT or "",
+                    concurrency=max(1, jobs // 2),
+                    telegram_format=settings.TELEGRAM_FORMAT,
+                    add_id=settings.ADD_ID,
+                ),
+            )
+            items = page_items + message_items
+            pushed: Dict[str, bool] = {}
+            if push:
+                pushed = await push_drifted(
+                    items,
+                    tg,
+                    gr,
+                    author_name=settings.AUTHOR_NAME,
+                    author_url=settings.AUTHOR_URL,
+                    add_id=settings.ADD_ID,
+                    imgbb_api_key=settings.IMGBB_API_KEY,
+                    telegram_format=settings.TELEGRAM_FORMAT,
+                )
+        return items, pushed
+
+    items, pushed = asyncio.run(main())
+    counts = Counter(item.status for item in items)
+
+    if as_json:
+        print(
+            json.dumps(
+                [
+                    {
+                        "key": item.target.key,
+                        "md_path": item.target.md_path,
+                        "status": item.status,
+                        "error": item.error,
+                        "pushed": pushed.get(item.target.key),
+                    }
+                    for item in items
+                ],
+                ensure_ascii=False,
+                indent=1,
+            )
+        )
+    else:
+        table = Table(title="Сверка публикаций")
+        table.add_column("Статус")
+        table.add_column("Публикация", style="magenta")
+        table.add_column("Исходник")
+        table.add_column("Примечание")
+        for item in sorted(items, key=lambda i: (i.status, i.target.key)):
+            if item.status == IN_SYNC and not show_all:
+                continue
+            note = item.error or ""
+            if item.target.key in pushed:
+                note = "обновлено" if pushed[item.target.key] else "не обновлено"
+            table.add_row(
+                f"[{_STYLES.get(item.status, '')}]{item.status}[/]",
+                item.target.key,
+                item.target.md_path,
+                note,
+            )
+        if table.row_count:
+            console.print(table)
+
+    logger.info(
+        f"Публикаций: {len(items)}, совпадают {counts[IN_SYNC]}, "
+        f"разошлись {counts[DRIFTED]}, пропали {counts[MISSING]}, "
+        f"ошибок {counts[ERROR]}"
+    )
+    if pushed:
+        logger.info(f"Обновлено: {sum(pushed.values())} из {len(pushed)}")
+    drifted = counts[DRIFTED] if not push else list(pushed.values()).count(False)
+    if drifted or counts[MISSING] or counts[ERROR]:
+        raise typer.Exit(1)
+
+
+app.command("r", help="Алиас для run")(run)
+
+
+@app.command()
+def changed(
+    root: Path = typer.Argument(..., help="Каталог исходников (посты и сниппеты)"),
+    manifests: Optional[List[Path]] = typer.Argument(
+        None, help="Манифесты публикаций (--manifest) или каталоги с ними"
+    ),
+    schedule: bool = typer.Option(
+        True, help="Учитывать публикации, выполненные планировщиком"
+    ),
+    index: Optional[Path] = typer.Option(
+        None, help="Файл индекса зависимостей (по умолчанию <root>/.mdp-deps.json)"
+    ),
+    dry_run: bool = typer.Option(
+        False, "--dry-run", help="Только показать, что будет обновлено"
+    ),
+):
+    """
+    Обновляет публикации, исходники которых изменились с прошлого запуска,
+    в том числе через включаемые файлы `{!path!}` и изображения: правка
+    сниппета переиздаёт только зависящие от него посты. Первый запуск
+    лишь запоминает состояние дерева.
+    """
+    index = index or root / ".mdp-deps.json"
+    baseline = not index.exists()
+    scanned = scan(root, index, save=False)
+    if baseline:
+        if not dry_run:
+            save_index(index, scanned.files)
+        logger.info(
+            f"Индекс зависимостей создан: {index} ({len(scanned.files)} файлов)"
+        )
+        return
+
+    dirty = {str(Path(p).resolve()) for p in scanned.dirty}
+    targets: Dict[str, Target] = {}
+    for target in _schedule_targets() if schedule else []:
+        targets[target.key] = target
+    for target in load_manifest_targets(manifests or []):
+        targets[target.key] = target
+    # Сообщение-ссылка на страницу не зависит от содержимого исходника
+    affected = [
+        t
+        for t in targets.values()
+        if t.kind != "link" and str(Path(t.md_path).expanduser().resolve()) in dirty
+    ]
+    logger.info(
+        f"Изменено исходников: {len(dirty)}, затронуто публикаций: {len(affected)}"
+    )
+
+    pushed: Dict[str, bool] = {}
+    if affected and not dry_run:
+        pins = PinStore(settings.CREDENTIALS_DB)
+        gr = TelegraphPool.from_tokens(
+            settings.TELEGRAPH_ACCESS_TOKENS,
+            pins=pins,
+            imgbb_api_key=settings.IMGBB_API_KEY,
+        )
+        tg = TelegramPool.from_tokens(
+            settings.TELEGRAM_BOT_TOKENS,
+            pins=pins,
+            per_chat_interval=settings.TELEGRAM_PER_CHAT_INTERVAL,
+            transport=TransportConfig(**settings.TELEGRAM_TRANSPORT),
+            imgbb_api_key=settings.IMGBB_API_KEY,
+        )
+
+        async def main() -> Dict[str, bool]:
+            async with tg:
+                return await push_drifted(
+                    [ReconcileItem(t, DRIFTED) for t in affected],
+                    tg,
+                    gr,
+                    author_name=settings.AUTHOR_NAME,
+                    author_url=settings.AUTHOR_URL,
+                    add_id=settings.ADD_ID,
+                    imgbb_api_key=settings.IMGBB_API_KEY,
+                    telegram_format=settings.TELEGRAM_FORMAT,
+                )
+
+        pushed = asyncio.run(main())
+
+    if affected:
+        table = Table(title="Публикации изменённых исходников")
+        table.add_column("Публикация", style="magenta")
+        table.add_column("Исходник")
+        table.add_column("Результат")
+        for target in sorted(affected, key=lambda t: t.key):
+            if target.key not in pushed:
+                note = "будет обновлено"
+            else:
+                note = "[green]обновлено[/]" if pushed[target.key] else "[red]ошибка[/]"
+            table.add_row(target.key, target.md_path, note)
+        console.print(table)
+
+    if dry_run:
+        return
+    # Необновлённые исходники забываем, чтобы попробовать снова в следующий раз
+    failed = {
+        str(Path(t.md_path).expanduser().resolve())
+        for t in affected
+        if not pushed.get(t.key)
+    }
+    for path in list(scanned.files):
+        if str(Path(path).resolve()) in failed:
+            del scanned.files[path]
+    save_index(index, scanned.files)
+    if failed:
+        logger.warning(f"Не обновлено: {len(failed)} исходников")
+        raise typer.Exit(1)
@@ -0,0 +1,96 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+import typer
+
+from cli.logger_config import logger
+from config import settings
+from core.build import build_tree
+from core.scanner import scan as scan_tree
+
+app = typer.Typer(help="Офлайн-сборка артефактов для публикации")
+
+
+@app.command()
+def build(
+    src: Path = typer.Argument(..., help="Markdown-файл или каталог с исходниками"),
+    out: Optional[Path] = typer.Option(
+        None,
+        "--out",
+        "-o",
+        help="Каталог артефактов (по умолчанию MDP_BUILD_DIR или ./build)",
+    ),
+    jobs: int = typer.Option(
+        os.cpu_count() or 1, "--jobs", "-j", help="Количество процессов рендера"
+    ),
+    force: bool = typer.Option(
+        False, "--force", help="Пересобрать даже неизменившиеся файлы"
+    ),
+):
+    """
+    Рендерит все Markdown-файлы в HTML для Telegram и узлы Telegraph.
+    Публикация с MDP_BUILD_DIR=<out> берёт готовые артефакты вместо рендера.
+    """
+    if not src.exists():
+        logger.error(f"❌Не найдено: {src}")
+        raise typer.Exit(1)
+    out_dir = out or Path(settings.BUILD_DIR or "build")
+
+    start = time.perf_counter()
+    stats = build_tree(
+        src, out_dir, jobs=jobs, imgbb_api_key=settings.IMGBB_API_KEY, force=force
+    )
+    logger.info(
+        f"Сборка {out_dir}: собрано {stats.written}, без изменений {stats.skipped}, "
+        f"ошибок {len(stats.failed)} за {time.perf_counter() - start:.1f} сек."
+    )
+    if stats.failed:
+        for path, error in stats.failed.items():
+            logger.warning(f"{path}: {error}")
+        raise typer.Exit(1)
+
+
+@app.command()
+def scan(
+    root: Path = typer.Argument(..., help="Каталог с исходниками"),
+    index: Optional[Path] = typer.Option(
+        None, help="Файл индекса (по умолчанию <root>/.mdp-scan.json)"
+    ),
+    jobs: int = typer.Option(8, "--jobs", "-j", help="Потоков для хеширования"),
+    as_json: bool = typer.Option(False, "--json", help="Вывести результат в JSON"),
+):
+    """
+    Находит изменившиеся файлы по индексу stat/хешей и посты, которые нужно
+    пересобрать (включая посты с изменившимися изображениями).
+    """
+    start = time.perf_counter()
+    result = scan_tree(root, index, jobs=jobs)
+    elapsed = time.perf_counter() - start
+    if as_json:
+        print(
+            json.dumps(
+                {
+                    "added": result.added,
+                    "modified": result.modified,
+                    "removed": result.removed,
+                    "dirty": result.dirty,
+                },
+                ensure_ascii=False,
+                indent=1,
+            )
+        )
+        return
+    for path in result.dirty:
+        print(path)
+    logger.info(
+        f"Файлов: {len(result.files)}, новых {len(result.added)}, "
+        f"изменённых {len(result.modified)}, удалённых {len(result.removed)}, "
+        f"к пересборке {len(result.dirty)} (перехешировано {result.hashed}) "
+        f"за {elapsed:.2f} сек."
+    )
+
+
+app.command("b", help="Алиас для build")(build)
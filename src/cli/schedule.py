@@ -0,0 +1,188 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from cli.logger_config import logger
+from config import settings
+from core import metrics
+from core.credentials import PinStore, TelegramPool, TelegraphPool
+from core.scheduler import (
+    TARGETS,
+    ScheduleStore,
+    parse_when,
+    prerender,
+    run_scheduler,
+)
+from core.telegram import TransportConfig
+
+app = typer.Typer(help="Отложенные публикации")
+console = Console()
+
+
+@app.command()
+def add(
+    md_path: str,
+    at: str = typer.Option(
+        ..., "--at", help="Время публикации: ISO-дата или +30m / +2h / +1d"
+    ),
+    target: str = typer.Option("tg", help="Куда публиковать: tg, gr или tgh"),
+    channels: Optional[List[str]] = typer.Option(
+        None, "--channel", "-c", help="Канал для публикации (можно указать несколько)"
+    ),
+    groups: Optional[List[str]] = typer.Option(
+        None, "--group", "-g", help="Группа каналов из TELEGRAM_CHANNEL_GROUP_<NAME>"
+    ),
+):
+    """
+    Ставит Markdown-файл в очередь. Рендер и загрузка изображений выполняются сразу.
+    """
+    if target not in TARGETS:
+        logger.error(f"❌Неизвестная цель {target}, доступно: {', '.join(TARGETS)}")
+        raise typer.Exit(1)
+    try:
+        due_at = parse_when(at)
+    except ValueError as e:
+        logger.error(f"❌{e}")
+        raise typer.Exit(1)
+
+    targets = settings.resolve_channels(channels, groups)
+    if target != "gr" and not targets:
+        logger.error("❌Не указан ни один канал")
+        raise typer.Exit(1)
+
+    payload = prerender(
+        target, md_path, settings.IMGBB_API_KEY, settings.TELEGRAM_FORMAT
+    )
+    store = ScheduleStore(settings.SCHEDULE_DB)
+    try:
+        job_id = store.add(due_at, target, md_path, targets, payload)
+    finally:
+        store.close()
+    when = datetime.fromtimestamp(due_at).isoformat(timespec="seconds")
+    logger.info(f"✅Задача {job_id} ({target}) запланирована на {when}")
+
+
+@app.command("list")
+def list_jobs(
+    all_jobs: bool = typer.Option(False, "--all", help="Показать и выполненные задачи"),
+):
+    """
+    Показывает очередь публикаций.
+    """
+    store = ScheduleStore(settings.SCHEDULE_DB)
+    try:
+        jobs = store.list() if all_jobs else store.list("pending")
+    finally:
+        store.close()
+
+    table = Table(title="Очередь публикаций")
+    table.add_column("ID", justify="right", style="cyan")
+    table.add_column("Время", style="bold")
+    table.add_column("Цель", style="magenta")
+    table.add_column("Файл")
+    table.add_column("Статус", style="green")
+    for job in jobs:
+        when = datetime.fromtimestamp(job.due_at).isoformat(timespec="seconds")
+        table.add_row(str(job.id), when, job.target, job.md_path, job.status)
+    console.print(table)
+
+
+@app.command()
+def rm(job_id: int):
+    """
+    Удаляет задачу из очереди (только ещё не выполненную).
+    """
+    store = ScheduleStore(settings.SCHEDULE_DB)
+    try:
+        removed = store.remove(job_id)
+    finally:
+        store.close()
+    logger.info(f"Удаление задачи {job_id}: {'да' if removed else 'нет'}")
+
+
+@app.command()
+def retry(
+    job_id: int,
+    at: Optional[str] = typer.Option(
+        None, "--at", help="Время повтора: ISO-дата или +30m (по умолчанию — сейчас)"
+    ),
+):
+    """
+    Возвращает в очередь задачу со статусом failed или partial.
+    Каналы, где пост уже опубликован, при повторе пропускаются.
+    """
+    try:
+        due_at = parse_when(at) if at else time.time()
+    except ValueError as e:
+        logger.error(f"❌{e}")
+        raise typer.Exit(1)
+    store = ScheduleStore(settings.SCHEDULE_DB)
+    try:
+        retried = store.retry(job_id, due_at)
+    finally:
+        store.close()
+    if not retried:
+        logger.warning(f"Задача {job_id} не найдена или не требует повтора")
+        raise typer.Exit(1)
+    logger.info(f"✅Задача {job_id} возвращена в очередь")
+
+
+@app.command()
+def run(
+    poll_interval: float = typer.Option(
+        30.0, help="Как часто проверять очередь на новые задачи (сек.)"
+    ),
+    once: bool = typer.Option(
+        False, "--once", help="Опубликовать наступившие задачи и выйти"
+    ),
+    metrics_port: Optional[int] = typer.Option(
+        None, help="Отдавать метрики Prometheus на http://0.0.0.0:<port>/metrics"
+    ),
+):
+    """
+    Запускает планировщик: один долгоживущий процесс публикует задачи по времени.
+    Можно запускать несколько планировщиков на одну очередь: задача
+    арендуется тем, кто её взял, и возвращается в очередь, только если
+    его аренда истекла.
+    """
+    pins = PinStore(settings.CREDENTIALS_DB)
+    tg = TelegramPool.from_tokens(
+        settings.TELEGRAM_BOT_TOKENS,
+        pins=pins,
+        per_chat_interval=settings.TELEGRAM_PER_CHAT_INTERVAL,
+        transport=TransportConfig(**settings.TELEGRAM_TRANSPORT),
+        imgbb_api_key=settings.IMGBB_API_KEY,
+    )
+    gr = TelegraphPool.from_tokens(
+        settings.TELEGRAPH_ACCESS_TOKENS,
+        pins=pins,
+        imgbb_api_key=settings.IMGBB_API_KEY,
+    )
+    store = ScheduleStore(settings.SCHEDULE_DB)
+    if metrics_port:
+        metrics.serve(metrics_port)
+    logger.info(f"Планировщик запущен, очередь: {settings.SCHEDULE_DB}")
+
+    async def _run() -> None:
+        async with tg:
+            await run_scheduler(
+                store,
+                tg,
+                gr,
+                poll_interval=poll_interval,
+                once=once,
+                author_name=settings.AUTHOR_NAME,
+                author_url=settings.AUTHOR_URL,
+            )
+
+    try:
+        asyncio.run(_run())
+    except KeyboardInterrupt:
+        logger.info("Планировщик остановлен")
+    finally:
+        store.close()
@@ -1,14 +1,21 @@
 import asyncio
-from typing import Optional
+from itertools import chain
+from pathlib import Path
+from typing import List, Optional
 
 import typer
 from telegram import Message
 
 from cli.logger_config import logger
 from config import settings
-from core.telegram import TelegramClient
-from utils.converting_md2html import md_to_html
-from utils.html_for_telegram import sanitize_html_for_telegram
+from core.build import iter_telegram_parts
+from core.credentials import PinStore, TelegramPool
+from core.file_id_cache import FileIdCache
+from core.telegram import TransportConfig
+from core.thread import ID_RESERVE, ThreadResult, edit_thread, send_thread
+from utils.manifest import save_manifest
+from utils.message_ids import parse_message_ids, parse_message_ranges
+from utils.telegram_entities import MESSAGE_LIMIT
 
 app = typer.Typer(help="Команды для Telegram")
 
@@ -18,84 +25,159 @@ if not settings.TELEGRAM_BOT_TOKEN:
 if not settings.TELEGRAM_CHANNEL:
     logger.error("❌ Tg канал отсутствует")
 
-client = TelegramClient(settings.TELEGRAM_BOT_TOKEN or "None")
+client = TelegramPool.from_tokens(
+    settings.TELEGRAM_BOT_TOKENS,
+    pins=PinStore(settings.CREDENTIALS_DB),
+    per_chat_interval=settings.TELEGRAM_PER_CHAT_INTERVAL,
+    transport=TransportConfig(**settings.TELEGRAM_TRANSPORT),
+    imgbb_api_key=settings.IMGBB_API_KEY,
+    file_id_cache=FileIdCache(settings.TELEGRAM_FILE_ID_CACHE),
+)
 channel = settings.TELEGRAM_CHANNEL or "None"
 
 
 @app.command()
-def edit(msg_id: int, md_path: str):
+def edit(
+    msg_ids: str = typer.Argument(
+        ..., help="ID сообщения или цепочки: 123, 123,124,125 или 123-125"
+    ),
+    md_path: str = typer.Argument(...),
+):
     """
-    Редактирует сообщение в Telegram-канале.
+    Редактирует сообщение или цепочку сообщений в Telegram-канале.
+    Если текст стал длиннее, новые части уходят ответами на последнюю,
+    если короче — лишние сообщения удаляются.
     """
-
-    async def _edit(msg_id: int, md_path: str) -> None:
-        html = md_to_html(md_path)
-        clean_html = sanitize_html_for_telegram(
-            html,
-            base_path=md_path,
-            imgbb_api_key=settings.IMGBB_API_KEY,
+    try:
+        ids = parse_message_ids([msg_ids])
+    except ValueError as e:
+        logger.error(f"❌{e}")
+        raise typer.Exit(1)
+
+    async def _edit() -> None:
+        parts = iter_telegram_parts(
+            md_path, settings.IMGBB_API_KEY, settings.TELEGRAM_FORMAT, _part_limit()
         )
-        result = await client.edit_message(channel, msg_id, clean_html)
-        if isinstance(result, Message):
-            logger.info(f"✅Отредактирован пост ID: {msg_id}")
-        else:
-            logger.warning(f"❌Ошибка редактирования ID {msg_id}: {result}")
+        async with client:
+            result = await edit_thread(
+                client, channel, ids, parts, add_id=settings.ADD_ID
+            )
+        thread = result.messages[str(channel)]
+        if str(channel) in result.errors:
+            logger.warning(f"❌Ошибка редактирования: {result.errors[str(channel)]}")
+        logger.info(f"✅Отредактирована цепочка ID: {','.join(map(str, thread))}")
+
+    asyncio.run(_edit())
 
-    asyncio.run(_edit(msg_id, md_path))
+
+def _part_limit() -> int:
+    """Лимит части: в первую при ADD_ID дописывается её ID."""
+    return MESSAGE_LIMIT - ID_RESERVE if settings.ADD_ID else MESSAGE_LIMIT
 
 
 @app.command()
-def post(md_path: str):
+def post(
+    md_path: str,
+    channels: Optional[List[str]] = typer.Option(
+        None, "--channel", "-c", help="Канал для публикации (можно указать несколько)"
+    ),
+    groups: Optional[List[str]] = typer.Option(
+        None, "--group", "-g", help="Группа каналов из TELEGRAM_CHANNEL_GROUP_<NAME>"
+    ),
+    manifest: Optional[Path] = typer.Option(
+        None, help="Сохранить message_id по каналам в JSON-файл"
+    ),
+):
     """
-    Пост сообщение в Telegram-канале и добавление в него ID
+    Пост сообщение в Telegram-канале и добавление в него ID.
+    Длинный текст делится на части по границам блоков и уходит цепочкой
+    ответов; следующие части рендерятся, пока отправляются предыдущие.
+    Markdown рендерится и изображения загружаются один раз для всех каналов.
     """
-    html = md_to_html(md_path)
-    clean_html = sanitize_html_for_telegram(
-        html,
-        base_path=md_path,
-        imgbb_api_key=settings.IMGBB_API_KEY,
+    targets = settings.resolve_channels(channels, groups) or [channel]
+    parts = iter_telegram_parts(
+        md_path, settings.IMGBB_API_KEY, settings.TELEGRAM_FORMAT, _part_limit()
     )
 
-    async def _post(text) -> Optional[int]:
-        result = await client.send_message(chat_id=channel, text=text)
-        if isinstance(result, Message):
-            msg_id = result.message_id
-            logger.info(f"✅Опубликован пост ID: {msg_id}")
-            return msg_id
-        else:
-            logger.warning(f"❌Ошибка публикации: {result}")
-            return None
-
-    async def _edit(msg_id: int) -> None:
-        new_text = clean_html + "\n" + str(msg_id)
-        result = await client.edit_message(channel, msg_id, new_text)
-        if isinstance(result, Message):
-            logger.info(f"✅Опубликован пост ID: {msg_id}")
-        else:
-            logger.warning(f"❌Ошибка поста ID {msg_id}: {result}")
-
-    async def main():
-        try:
-            msg_id = await _post(clean_html)
-            if msg_id is not None and settings.ADD_ID:
-                await _edit(msg_id)
-        except Exception as e:
-            logger.warning(f"Ошибка постинга: {e}")
-
-    asyncio.run(main())
+    async def main() -> ThreadResult:
+        async with client:
+            return await send_thread(client, targets, parts, add_id=settings.ADD_ID)
+
+    try:
+        result = asyncio.run(main())
+    except Exception as e:
+        logger.warning(f"Ошибка постинга: {e}")
+        return
+    for chat_id, thread in result.messages.items():
+        if thread:
+            logger.info(
+                f"✅Опубликован пост ID: {','.join(map(str, thread))} ({chat_id})"
+            )
+        if chat_id in result.errors:
+            logger.warning(f"❌Ошибка публикации ({chat_id}): {result.errors[chat_id]}")
+    if manifest:
+        data = {
+            "md_path": md_path,
+            "messages": {c: t[0] if t else None for c, t in result.messages.items()},
+        }
+        if any(len(t) > 1 for t in result.messages.values()):
+            data["threads"] = result.messages
+        out = save_manifest(manifest, data)
+        logger.info(f"Манифест сохранён: {out}")
 
 
 @app.command()
-def rm(msg_id: int):
+def rm(
+    msg_ids: List[str] = typer.Argument(
+        ..., help="ID сообщений: 123, 1,2,3, диапазон 100-250 или путь к файлу с ID"
+    ),
+    concurrency: int = typer.Option(4, help="Количество параллельных запросов"),
+    rate: float = typer.Option(5.0, help="Максимум запросов к API в секунду"),
+    confirm: bool = typer.Option(
+        False,
+        "--confirm",
+        help="Удалять по одному ID и сообщить точный список неудалённых",
+    ),
+):
     """
-    Удаление из Telegram-канала сообщения по ID
+    Удаление из Telegram-канала сообщений по ID (пакетами до 100 штук).
+    deleteMessages молча пропускает ID, которые удалить нельзя, поэтому
+    неудалёнными сообщаются только ID из пакетов, отклонённых целиком.
+    С --confirm каждый ID удаляется отдельным запросом (медленнее, но
+    неудалённые ID известны точно).
     """
-
-    async def _rm() -> None:
-        res = await client.delete_message(chat_id=channel, message_id=msg_id)
-        logger.info(f"Удаление поста ID {msg_id}: {'да' if res else 'нет'}")
-
-    asyncio.run(_rm())
+    try:
+        ranges = parse_message_ranges(msg_ids)
+    except (ValueError, OSError) as e:
+        logger.error(f"❌{e}")
+        raise typer.Exit(1)
+
+    total = sum(len(r) for r in ranges)
+    if not total:
+        logger.warning("Нет ID для удаления")
+        return
+
+    async def _rm() -> List[int]:
+        async with client:
+            if total == 1:
+                message_id = ranges[0].start
+                res = await client.delete_message(
+                    chat_id=channel, message_id=message_id
+                )
+                return [] if res else [message_id]
+            return await client.delete_messages(
+                chat_id=channel,
+                message_ids=chain.from_iterable(ranges),
+                concurrency=concurrency,
+                rate=rate,
+                confirm=confirm,
+            )
+
+    failed = asyncio.run(_rm())
+    logger.info(f"Отправлено на удаление: {total}, отклонено: {len(failed)}")
+    if failed:
+        logger.warning(f"Не удалось удалить ID: {', '.join(map(str, failed))}")
+        raise typer.Exit(1)
 
 
 @app.command()
@@ -107,9 +189,10 @@ def img_post(photo_path: str, md_path: Optional[str] = None):
     """
 
     async def _img_post(photo_path: str, md_path: Optional[str]) -> None:
-        res = await client.send_photo(
-            chat_id=channel, photo_path=photo_path, md_path=md_path
-        )
+        async with client:
+            res = await client.send_photo(
+                chat_id=channel, photo_path=photo_path, md_path=md_path
+            )
         if res:
             logger.info(f"Пост ID: {res.message_id}")
         else:
@@ -126,9 +209,10 @@ def img_edit(post_id: int, md_path: Optional[str] = None):
     """
 
     async def _img_edit(post_id: int, md_path: Optional[str] = None) -> None:
-        res = await client.edit_photo(
-            chat_id=channel, message_id=post_id, md_path=md_path
-        )
+        async with client:
+            res = await client.edit_photo(
+                chat_id=channel, message_id=post_id, md_path=md_path
+            )
 
         if isinstance(res, Message):
             logger.info(f"Отредактирован пост ID: {res.message_id}")
@@ -1,13 +1,17 @@
 import asyncio
-from typing import Optional
+from pathlib import Path
+from typing import Dict, List, Optional
 
 import typer
 from telegram import Message
 
 from cli.logger_config import logger
 from config import settings
-from core.telegram import TelegramClient
-from core.telegraph import TelegraphClient
+from core.batch import BatchItem, run_tgh_batch
+from core.build import iter_sources
+from core.credentials import PinStore, TelegramPool, TelegraphPool
+from core.telegram import TransportConfig
+from utils.manifest import save_manifest
 
 app = typer.Typer(help="Пост Telegragph и ссылки в TG")
 
@@ -16,30 +20,124 @@ if not settings.TELEGRAM_BOT_TOKEN or not settings.TELEGRAPH_ACCESS_TOKEN:
 if not settings.TELEGRAM_CHANNEL:
     logger.critical("ID TG канала не найдено")
 
-TgClient = TelegramClient(settings.TELEGRAM_BOT_TOKEN or "None")
-GrClient = TelegraphClient(settings.TELEGRAPH_ACCESS_TOKEN or "None")
+pins = PinStore(settings.CREDENTIALS_DB)
+TgClient = TelegramPool.from_tokens(
+    settings.TELEGRAM_BOT_TOKENS,
+    pins=pins,
+    per_chat_interval=settings.TELEGRAM_PER_CHAT_INTERVAL,
+    transport=TransportConfig(**settings.TELEGRAM_TRANSPORT),
+    imgbb_api_key=settings.IMGBB_API_KEY,
+)
+GrClient = TelegraphPool.from_tokens(
+    settings.TELEGRAPH_ACCESS_TOKENS, pins=pins, imgbb_api_key=settings.IMGBB_API_KEY
+)
 channel = settings.TELEGRAM_CHANNEL or "None"
 
 
 @app.command()
-def post(md_path: str, title: Optional[str] = None):
+def post(
+    md_path: str,
+    title: Optional[str] = None,
+    channels: Optional[List[str]] = typer.Option(
+        None, "--channel", "-c", help="Канал для публикации (можно указать несколько)"
+    ),
+    groups: Optional[List[str]] = typer.Option(
+        None, "--group", "-g", help="Группа каналов из TELEGRAM_CHANNEL_GROUP_<NAME>"
+    ),
+    manifest: Optional[Path] = typer.Option(
+        None, help="Сохранить URL страницы и message_id по каналам в JSON-файл"
+    ),
+):
     """
     Создание страницы в Telegragh и её пост TG
     """
+    targets = settings.resolve_channels(channels, groups) or [channel]
     result = GrClient.create_page(title=title, md_path=md_path)
     if result.get("url"):
-        logger.info(f"Страница создана: {result["url"]}")
+        logger.info(f"Страница создана: {result['url']}")
 
-        async def _send_msg(url: str):
-            result = await TgClient.send_message(chat_id=channel, text=url)
-            if isinstance(result, Message):
-                logger.info(f"Пост в TG ID: {result.message_id}")
-            else:
-                logger.warning(f"Ошибка поста в TG: {md_path}")
+        async def _send_msg(url: str) -> Dict[str, Optional[int]]:
+            ids: Dict[str, Optional[int]] = {}
+            async with TgClient:
+                results = await TgClient.send_message_many(targets, url)
+            for chat_id, res in results.items():
+                if isinstance(res, Message):
+                    ids[str(chat_id)] = res.message_id
+                    logger.info(f"Пост в TG ID: {res.message_id} ({chat_id})")
+                else:
+                    ids[str(chat_id)] = None
+                    logger.warning(f"Ошибка поста в TG ({chat_id}): {md_path}")
+            return ids
 
-        asyncio.run(_send_msg(result["url"]))
+        ids = asyncio.run(_send_msg(result["url"]))
+        if manifest:
+            out = save_manifest(
+                manifest,
+                {"md_path": md_path, "url": result["url"], "messages": ids},
+            )
+            logger.info(f"Манифест сохранён: {out}")
     else:
         logger.warning(f"Ошибка создания страницы {md_path} в Telegraph: {result}")
 
 
+@app.command()
+def batch(
+    paths: List[Path] = typer.Argument(..., help="Markdown-файлы или каталоги"),
+    channels: Optional[List[str]] = typer.Option(
+        None, "--channel", "-c", help="Канал для публикации (можно указать несколько)"
+    ),
+    groups: Optional[List[str]] = typer.Option(
+        None, "--group", "-g", help="Группа каналов из TELEGRAM_CHANNEL_GROUP_<NAME>"
+    ),
+    jobs: int = typer.Option(2, "--jobs", "-j", help="Процессов рендера"),
+    page_jobs: int = typer.Option(4, help="Одновременно создаваемых страниц"),
+    queue_size: int = typer.Option(8, help="Размер очереди между стадиями"),
+    manifest: Optional[Path] = typer.Option(
+        None, help="Сохранить URL страниц и message_id всех файлов в JSON-файл"
+    ),
+):
+    """
+    Пакетный постинг: страницы в Telegraph и ссылки на них в TG.
+    Рендер, создание страниц и отправка ссылок идут конвейером одновременно;
+    ссылки уходят в каналы в порядке файлов.
+    """
+    targets = settings.resolve_channels(channels, groups) or [channel]
+    md_paths = [str(src) for path in paths for src in iter_sources(path.expanduser())]
+    if not md_paths:
+        logger.warning("Нет Markdown-файлов для публикации")
+        raise typer.Exit(1)
+
+    def _done(item: BatchItem) -> None:
+        if item.error is None:
+            ids = ", ".join(str(m) for m in item.messages.values() if m)
+            logger.info(f"✅{item.md_path}: {item.url} (ID: {ids})")
+
+    async def main() -> List[BatchItem]:
+        async with TgClient:
+            return await run_tgh_batch(
+                md_paths,
+                TgClient,
+                GrClient,
+                targets,
+                render_jobs=jobs,
+                page_jobs=page_jobs,
+                queue_size=queue_size,
+                imgbb_api_key=settings.IMGBB_API_KEY,
+                author_name=settings.AUTHOR_NAME,
+                author_url=settings.AUTHOR_URL,
+                on_done=_done,
+            )
+
+    items = asyncio.run(main())
+    failed = [item for item in items if item.error]
+    logger.info(f"Опубликовано {len(items) - len(failed)} из {len(items)}")
+    if manifest:
+        out = save_manifest(
+            manifest, {"publications": [item.to_manifest() for item in items]}
+        )
+        logger.info(f"Манифест сохранён: {out}")
+    if failed:
+        raise typer.Exit(1)
+
+
 app.command("p", help="Алиас для post")(post)
@@ -53,6 +53,112 @@ AUTHOR_NAME = os.getenv("AUTHOR_NAME", "Автор")
 AUTHOR_URL = os.getenv("AUTHOR_URL", "https://")
 IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
 ADD_ID = False
+# Формат сообщений Telegram: html (parse_mode=HTML) или entities (MessageEntity)
+TELEGRAM_FORMAT = os.getenv("TELEGRAM_FORMAT", "html").strip().lower()
+
+
+def _token_pool(primary: str | None, extra: str | None) -> list[str]:
+    """Основной токен и дополнительные через запятую, без повторов."""
+    tokens = [primary or ""] + (extra or "").split(",")
+    return list(dict.fromkeys(t.strip() for t in tokens if t.strip()))
+
+
+# Пулы учётных данных: запросы распределяются между ботами / аккаунтами Telegraph
+TELEGRAM_BOT_TOKENS = _token_pool(TELEGRAM_BOT_TOKEN, os.getenv("TELEGRAM_BOT_TOKENS"))
+TELEGRAPH_ACCESS_TOKENS = _token_pool(
+    TELEGRAPH_ACCESS_TOKEN, os.getenv("TELEGRAPH_ACCESS_TOKENS")
+)
+# Какой бот / аккаунт создал сообщение или страницу (правки идут через него же)
+CREDENTIALS_DB = Path(os.getenv("MDP_CREDENTIALS_DB", config_dir / "credentials.db"))
+# Группы каналов для кросспостинга: TELEGRAM_CHANNEL_GROUP_<NAME>=@a,@b,-100123
+CHANNEL_GROUP_PREFIX = "TELEGRAM_CHANNEL_GROUP_"
+# Минимальный интервал между сообщениями в один чат (сек.)
+TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv("TELEGRAM_PER_CHAT_INTERVAL", "1.0"))
+# HTTP-транспорт Bot API: пул соединений, HTTP/2, таймауты (сек.)
+TELEGRAM_TRANSPORT = {
+    "pool_size": int(os.getenv("TELEGRAM_POOL_SIZE", "16")),
+    "http2": os.getenv("TELEGRAM_HTTP2", "").lower() in ("1", "true", "yes"),
+    "connect_timeout": float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "20.0")),
+    "read_timeout": float(os.getenv("TELEGRAM_READ_TIMEOUT", "30.0")),
+    "write_timeout": float(os.getenv("TELEGRAM_WRITE_TIMEOUT", "30.0")),
+    "pool_timeout": float(os.getenv("TELEGRAM_POOL_TIMEOUT", "10.0")),
+    "media_pool_size": int(os.getenv("TELEGRAM_MEDIA_POOL_SIZE", "4")),
+    "media_write_timeout": float(os.getenv("TELEGRAM_MEDIA_WRITE_TIMEOUT", "120.0")),
+}
+# Кеш file_id отправленных изображений (повторная отправка без загрузки)
+TELEGRAM_FILE_ID_CACHE = Path(
+    os.getenv("MDP_FILE_ID_CACHE", config_dir / "file_ids.db")
+)
+# Служебный чат, куда `mdp reconcile` пересылает копии сообщений для сравнения
+TELEGRAM_RECONCILE_CHAT = os.getenv("TELEGRAM_RECONCILE_CHAT")
+# Каталог артефактов `mdp render build`: публикация берёт готовый рендер оттуда
+BUILD_DIR = os.getenv("MDP_BUILD_DIR")
+# Кеш отрендеренных блоков больших документов ("off" — только в памяти процесса)
+BLOCK_CACHE_DB = (
+    None
+    if os.getenv("MDP_BLOCK_CACHE", "").lower() == "off"
+    else Path(os.getenv("MDP_BLOCK_CACHE") or config_dir / "blocks.db")
+)
+# Хостинги изображений в порядке предпочтения: imgbb, telegraph, http.
+# Загрузка идёт на самый быстрый исправный, при ошибке — на следующий
+IMAGE_HOSTS = [
+    h.strip() for h in os.getenv("MDP_IMAGE_HOSTS", "imgbb").split(",") if h.strip()
+]
+# Хостинг http: PUT <UPLOAD_URL>/<хеш>.<ext>, ссылка <PUBLIC_URL>/<хеш>.<ext>
+IMAGE_HTTP_UPLOAD_URL = os.getenv("MDP_IMAGE_HTTP_UPLOAD_URL")
+IMAGE_HTTP_PUBLIC_URL = os.getenv("MDP_IMAGE_HTTP_PUBLIC_URL")
+IMAGE_HTTP_TOKEN = os.getenv("MDP_IMAGE_HTTP_TOKEN")
+# История просмотров страниц Telegraph (mdp gr snapshot / stats)
+VIEWS_DB = Path(os.getenv("MDP_VIEWS_DB", config_dir / "views.db"))
+# Очередь отложенных публикаций (mdp schedule)
+SCHEDULE_DB = Path(os.getenv("MDP_SCHEDULE_DB", config_dir / "schedule.db"))
+# Файл метрик для textfile collector node_exporter (пишется при завершении)
+METRICS_FILE = os.getenv("MDP_METRICS_FILE")
+# Локальная проверка payload перед каждым вызовом API ("off" — выключить)
+PREFLIGHT = os.getenv("MDP_PREFLIGHT", "on").lower() not in ("0", "off", "false", "no")
+# Проверка ссылок (mdp links): кеш рабочих ссылок ("off" — без кеша) и его срок
+LINK_CACHE_DB = (
+    None
+    if os.getenv("MDP_LINK_CACHE", "").lower() == "off"
+    else Path(os.getenv("MDP_LINK_CACHE") or config_dir / "links.db")
+)
+LINK_CACHE_TTL = float(os.getenv("MDP_LINK_CACHE_TTL", str(24 * 3600)))
+# Одновременных запросов к одному хосту и пауза между ними, сек.
+LINK_PER_HOST = int(os.getenv("MDP_LINK_PER_HOST", "2"))
+LINK_HOST_DELAY = float(os.getenv("MDP_LINK_HOST_DELAY", "0.5"))
+LINK_TIMEOUT = float(os.getenv("MDP_LINK_TIMEOUT", "10.0"))
+# Политика повторов и circuit breaker для всех исходящих запросов
+RETRY_MAX_ATTEMPTS = int(os.getenv("MDP_RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("MDP_RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.getenv("MDP_RETRY_MAX_DELAY", "60.0"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("MDP_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("MDP_BREAKER_RESET_TIMEOUT", "30.0"))
+
+
+def get_channel_group(name: str) -> list[str]:
+    """Возвращает список каналов группы из переменной TELEGRAM_CHANNEL_GROUP_<NAME>."""
+    raw = os.getenv(CHANNEL_GROUP_PREFIX + name.upper(), "")
+    return [c.strip() for c in raw.split(",") if c.strip()]
+
+
+def resolve_channels(
+    channels: list[str] | None = None, groups: list[str] | None = None
+) -> list[str]:
+    """
+    Собирает итоговый список каналов (без повторов, в исходном порядке).
+    Если ничего не указано — используется TELEGRAM_CHANNEL.
+    """
+    result: list[str] = []
+    for name in groups or []:
+        members = get_channel_group(name)
+        if not members:
+            logger.warning("Группа каналов %s не найдена или пуста", name)
+        result.extend(members)
+    for channel in channels or []:
+        result.extend(c.strip() for c in channel.split(",") if c.strip())
+    if not result and TELEGRAM_CHANNEL:
+        result.append(TELEGRAM_CHANNEL)
+    return list(dict.fromkeys(result))
 
 
 def get_token_telegraph() -> str:
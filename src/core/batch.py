@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from telegram import Message
+
+from core.build import render_telegraph_nodes
+from core.credentials import TelegramPool, TelegraphPool
+from core.telegram import TelegramClient
+from core.telegraph import TelegraphClient
+from utils.md2telegraph import Node
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+
+@dataclass
+class BatchItem:
+    """Один файл пакета и его путь по конвейеру."""
+
+    index: int
+    md_path: str
+    title: Optional[str] = None
+    nodes: Optional[List[Node]] = None
+    url: Optional[str] = None
+    page_path: Optional[str] = None
+    messages: Dict[str, Optional[int]] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def to_manifest(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"md_path": self.md_path, "messages": self.messages}
+        if self.url:
+            data["url"] = self.url
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+async def run_tgh_batch(
+    md_paths: Sequence[str],
+    tg: Union[TelegramClient, TelegramPool],
+    gr: Union[TelegraphClient, TelegraphPool],
+    chats: Sequence[ChatId],
+    render_jobs: int = 2,
+    page_jobs: int = 4,
+    queue_size: int = 8,
+    imgbb_api_key: Optional[str] = None,
+    author_name: Optional[str] = None,
+    author_url: Optional[str] = None,
+    on_done: Optional[Callable[[BatchItem], None]] = None,
+) -> List[BatchItem]:
+    """
+    Конвейер «рендер → страница Telegraph → ссылка в Telegram» для пакета файлов.
+
+    Стадии работают одновременно и связаны очередями на queue_size элементов:
+    пока рендерится десятый файл, ссылка на первый уже уходит в каналы.
+    Рендер идёт в render_jobs процессах (упирается в CPU), страницы создаются
+    в page_jobs потоках. Ссылки публикуются строго в порядке md_paths:
+    готовая страница ждёт, пока будут объявлены все предыдущие.
+    Ошибка одного файла не останавливает пакет — она записывается в его error.
+    """
+    page_jobs = max(1, page_jobs)
+    items = [BatchItem(i, path) for i, path in enumerate(md_paths)]
+    todo: asyncio.Queue[BatchItem] = asyncio.Queue()
+    for item in items:
+        todo.put_nowait(item)
+    rendered: asyncio.Queue[Optional[BatchItem]] = asyncio.Queue(max(1, queue_size))
+    published: asyncio.Queue[Optional[BatchItem]] = asyncio.Queue(max(1, queue_size))
+    loop = asyncio.get_running_loop()
+
+    async def render_worker(pool: ProcessPoolExecutor) -> None:
+        while not todo.empty():
+            item = todo.get_nowait()
+            try:
+                item.nodes, item.title = await loop.run_in_executor(
+                    pool, render_telegraph_nodes, item.md_path, imgbb_api_key
+                )
+            except Exception as e:
+                item.error = f"рендер: {e}"
+            await rendered.put(item)
+
+    async def render_stage() -> None:
+        workers = max(1, min(render_jobs, len(items)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            await asyncio.gather(*(render_worker(pool) for _ in range(workers)))
+        for _ in range(page_jobs):
+            await rendered.put(None)
+
+    async def page_worker() -> None:
+        while (item := await rendered.get()) is not None:
+            if item.error is None:
+                try:
+                    page = await asyncio.to_thread(
+                        gr.create_page_from_nodes,
+                        item.title or Path(item.md_path).stem,
+                        item.nodes or [],
+                        author_name,
+                        author_url,
+                    )
+                    if not page.get("url"):
+                        raise RuntimeError(page)
+                    item.url, item.page_path = page["url"], page.get("path")
+                    logger.info("Страница создана: %s", item.url)
+                except Exception as e:
+                    item.error = f"Telegraph: {e}"
+            item.nodes = None  # узлы больше не нужны, не держим их в памяти
+            await published.put(item)
+
+    async def page_stage() -> None:
+        await asyncio.gather(*(page_worker() for _ in range(page_jobs)))
+        await published.put(None)
+
+    async def announce(item: BatchItem) -> None:
+        if item.error is None and item.url:
+            results = await tg.send_message_many(chats, item.url)
+            for chat_id, res in results.items():
+                if isinstance(res, Message):
+                    item.messages[str(chat_id)] = res.message_id
+                else:
+                    item.messages[str(chat_id)] = None
+                    logger.warning("Ошибка поста в TG (%s): %s", chat_id, res)
+            if not any(item.messages.values()):
+                item.error = "Telegram: ссылка не опубликована ни в один канал"
+        if item.error:
+            logger.warning("%s: %s", item.md_path, item.error)
+        if on_done is not None:
+            on_done(item)
+
+    async def announce_stage() -> None:
+        # Страницы готовы в произвольном порядке; объявляем по порядку исходников
+        waiting: Dict[int, BatchItem] = {}
+        next_index = 0
+        while (item := await published.get()) is not None:
+            waiting[item.index] = item
+            while next_index in waiting:
+                await announce(waiting.pop(next_index))
+                next_index += 1
+
+    await asyncio.gather(render_stage(), page_stage(), announce_stage())
+    return items
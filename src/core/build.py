@@ -0,0 +1,358 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from core.file_id_cache import file_digest
+from core.scanner import ScanResult, iter_image_refs, save_index, scan
+from utils.converting_md2html import (
+    is_large_md,
+    iter_md_to_html,
+    md_includes,
+    read_md_source,
+)
+from utils.html_for_telegram import (
+    iter_sanitize_html_for_telegram,
+    md_file_to_telegram_html,
+)
+from utils.md2telegraph import Node, markdown_to_telegraph_nodes
+from utils.telegram_entities import (
+    MESSAGE_LIMIT,
+    TelegramText,
+    iter_html_to_telegram_text,
+    md_file_to_telegram_text,
+)
+from utils.telegram_split import pack_message_parts
+from utils.upload_img import offline, uploaded_url
+
+logger = logging.getLogger(__name__)
+
+# Артефакты одного исходника: <out>/<относительный путь без .md>/...
+TELEGRAM_FILE = "telegram.html"
+TELEGRAPH_FILE = "telegraph.json"
+META_FILE = "meta.json"
+# Соответствие «абсолютный путь исходника → каталог артефактов»
+INDEX_FILE = "index.json"
+# Индекс сканера: неизменившиеся исходники пропускаются без чтения
+SCAN_INDEX_FILE = "scan.json"
+
+# Каталог сборки, из которого команды публикации берут готовые артефакты
+_build_dir: Optional[Path] = None
+
+
+@dataclass
+class BuildStats:
+    written: int = 0
+    skipped: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Artifact:
+    source: Path
+    title: Optional[str]
+    telegram_html: str
+    telegraph_nodes: List[Node]
+    images: List[Dict[str, Any]]
+
+
+def configure(build_dir: Optional[Union[str, Path]]) -> None:
+    """Включает использование артефактов `mdp render build` при публикации."""
+    global _build_dir
+    _build_dir = Path(build_dir).expanduser() if build_dir else None
+
+
+def iter_sources(root: Path) -> Iterator[Path]:
+    """Все Markdown-файлы дерева (или сам файл), в стабильном порядке."""
+    if root.is_file():
+        yield root
+        return
+    for path in sorted(root.rglob("*.md")):
+        if not any(part.startswith(".") for part in path.relative_to(root).parts):
+            yield path
+
+
+def image_manifest(md_path: Path) -> List[Dict[str, Any]]:
+    """Изображения, на которые ссылается документ: локальные пути, размеры, ссылки."""
+    md_dir = md_path.parent
+    images: List[Dict[str, Any]] = []
+    for src in iter_image_refs(read_md_source(str(md_path))):
+        if src.startswith(("http://", "https://")):
+            images.append({"src": src, "url": src})
+            continue
+        local = (md_dir / src).resolve()
+        exists = local.is_file()
+        images.append(
+            {
+                "src": src,
+                "path": str(local),
+                "exists": exists,
+                "size": local.stat().st_size if exists else None,
+                "url": uploaded_url(str(local)) if exists else None,
+            }
+        )
+    return images
+
+
+def source_digest(src: Path) -> str:
+    """
+    Хеш исходника вместе со всеми включаемыми в него файлами: артефакты
+    устаревают и при правке сниппета, а не только самого поста.
+    """
+    includes = md_includes(str(src))
+    if not includes:
+        return file_digest(src)
+    h = hashlib.sha256(file_digest(src).encode())
+    for path in includes:
+        digest = file_digest(path) if path.is_file() else "-"
+        h.update(f"\0{path}\0{digest}".encode())
+    return h.hexdigest()
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(path)
+
+
+def _read_meta(artifact_dir: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads((artifact_dir / META_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _load_index(out_dir: Path) -> Dict[str, str]:
+    try:
+        return json.loads((out_dir / INDEX_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def build_one(
+    md_path: str,
+    artifact_dir: str,
+    imgbb_api_key: Optional[str] = None,
+    force: bool = False,
+) -> bool:
+    """
+    Рендерит один исходник в артефакты (выполняется в процессе-воркере).
+    Возвращает False, если артефакты актуальны и пересборка не нужна.
+    """
+    src, out = Path(md_path), Path(artifact_dir)
+    digest = source_digest(src)
+    meta = _read_meta(out)
+    if not force and meta and meta.get("source_hash") == digest:
+        return False
+
+    telegram_html = md_file_to_telegram_html(md_path, imgbb_api_key)
+    nodes, title = markdown_to_telegraph_nodes(md_path, imgbb_api_key)
+
+    out.mkdir(parents=True, exist_ok=True)
+    _write_atomic(out / TELEGRAM_FILE, telegram_html)
+    _write_atomic(
+        out / TELEGRAPH_FILE,
+        json.dumps(nodes, ensure_ascii=False, separators=(",", ":")),
+    )
+    # meta.json пишется последним: его наличие означает, что набор полный
+    _write_atomic(
+        out / META_FILE,
+        json.dumps(
+            {
+                "source": str(src),
+                "source_hash": digest,
+                "title": title,
+                "images": image_manifest(src),
+                "built_at": time.time(),
+            },
+            ensure_ascii=False,
+            indent=1,
+        ),
+    )
+    return True
+
+
+def build_tree(
+    root: Path,
+    out_dir: Path,
+    jobs: Optional[int] = None,
+    imgbb_api_key: Optional[str] = None,
+    force: bool = False,
+) -> BuildStats:
+    """
+    Рендерит все Markdown-файлы root в out_dir пулом процессов
+    (рендер упирается в CPU: Python-Markdown и BeautifulSoup).
+    Для каталога изменения находит сканер: неизменившиеся файлы пропускаются
+    без чтения, а при изменении изображения или включаемого файла пересобираются
+    все посты, которые от него зависят.
+    """
+    root = root.resolve()
+    base = root.parent if root.is_file() else root
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index = _load_index(out_dir)
+    stats = BuildStats()
+
+    scanned: Optional[ScanResult] = None
+    dirty: Set[str] = set()
+    asset_dirty: Set[str] = set()
+    if root.is_dir():
+        scanned = scan(root, out_dir / SCAN_INDEX_FILE, jobs=jobs or 8, save=False)
+        dirty = set(scanned.dirty)
+        # Сам файл не менялся, но изменилось изображение — хеш исходника не поможет
+        asset_dirty = dirty - set(scanned.added) - set(scanned.modified)
+
+    tasks: List[Tuple[str, str, bool]] = []
+    for src in iter_sources(root):
+        artifact_dir = out_dir / src.relative_to(base).with_suffix("")
+        index[str(src)] = str(artifact_dir.relative_to(out_dir))
+        key = str(src)
+        if (
+            scanned is not None
+            and not force
+            and key not in dirty
+            and (artifact_dir / META_FILE).exists()
+        ):
+            stats.skipped += 1
+            continue
+        tasks.append((key, str(artifact_dir), force or key in asset_dirty))
+
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = {
+            pool.submit(build_one, src, artifact_dir, imgbb_api_key, rebuild): src
+            for src, artifact_dir, rebuild in tasks
+        }
+        for fut in as_completed(futures):
+            src = futures[fut]
+            try:
+                if fut.result():
+                    stats.written += 1
+                    logger.debug("Собрано: %s", src)
+                else:
+                    stats.skipped += 1
+            except Exception as e:
+                stats.failed[src] = str(e)
+                logger.warning("Ошибка рендера %s: %s", src, e)
+
+    if scanned is not None:
+        # Несобранные файлы и их изображения забываем, чтобы пересобрать их в следующий раз
+        for src in stats.failed:
+            state = scanned.files.pop(src, None)
+            for ref in state.refs if state else ():
+                scanned.files.pop(ref, None)
+        save_index(out_dir / SCAN_INDEX_FILE, scanned.files)
+
+    _write_atomic(out_dir / INDEX_FILE, json.dumps(index, ensure_ascii=False, indent=1))
+    return stats
+
+
+def load_artifact(md_path: str, build_dir: Optional[Path] = None) -> Optional[Artifact]:
+    """
+    Готовые артефакты для исходника, если они есть и собраны из текущей версии файла.
+    """
+    build_dir = build_dir or _build_dir
+    if build_dir is None:
+        return None
+    src = Path(md_path).resolve()
+    rel = _load_index(build_dir).get(str(src))
+    if rel is None:
+        return None
+    artifact_dir = build_dir / rel
+    meta = _read_meta(artifact_dir)
+    if not meta or not src.is_file() or meta.get("source_hash") != source_digest(src):
+        logger.info("Артефакты %s устарели, рендер на лету", md_path)
+        return None
+    try:
+        telegram_html = (artifact_dir / TELEGRAM_FILE).read_text(encoding="utf-8")
+        nodes = json.loads((artifact_dir / TELEGRAPH_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning("Артефакты %s повреждены: %s", artifact_dir, e)
+        return None
+    return Artifact(
+        source=src,
+        title=meta.get("title"),
+        telegram_html=telegram_html,
+        telegraph_nodes=nodes,
+        images=meta.get("images", []),
+    )
+
+
+def render_telegram_html(md_path: str, imgbb_api_key: Optional[str] = None) -> str:
+    """HTML для Telegram: из артефактов сборки или рендер на лету."""
+    artifact = load_artifact(md_path)
+    if artifact is not None:
+        return artifact.telegram_html
+    return md_file_to_telegram_html(md_path, imgbb_api_key)
+
+
+def render_telegram_message(
+    md_path: str,
+    imgbb_api_key: Optional[str] = None,
+    fmt: str = "html",
+    upload: bool = True,
+) -> Union[str, TelegramText]:
+    """
+    Текст сообщения Telegram в формате fmt: "html" — HTML для parse_mode,
+    "entities" — TelegramText (текст и MessageEntity, всегда рендер на лету).
+    upload=False не загружает изображения, даже если хостинги заданы
+    через configure() (для сравнения, не для публикации).
+    """
+    if not upload:
+        with offline():
+            return render_telegram_message(md_path, imgbb_api_key, fmt)
+    if fmt == "entities":
+        return md_file_to_telegram_text(md_path, imgbb_api_key)
+    if fmt != "html":
+        raise ValueError(f"Неизвестный формат Telegram: {fmt} (html или entities)")
+    return render_telegram_html(md_path, imgbb_api_key)
+
+
+def iter_telegram_parts(
+    md_path: str,
+    imgbb_api_key: Optional[str] = None,
+    fmt: str = "html",
+    limit: int = MESSAGE_LIMIT,
+) -> Iterator[Union[str, TelegramText]]:
+    """
+    Сообщение Telegram, разбитое на части не длиннее limit, для цепочки ответов.
+    Обычный файл рендерится целиком, как render_telegram_message, и делится
+    на части. Большой (is_large_md) рендерится потоково: блоки готовятся
+    (и изображения загружаются) по мере того, как запрашиваются следующие
+    части, поэтому первую часть можно отправлять, пока остальные ещё готовятся.
+    """
+    if not is_large_md(md_path):
+        whole = render_telegram_message(md_path, imgbb_api_key, fmt)
+        yield from pack_message_parts([whole], limit)
+        return
+    if fmt == "entities":
+        base_dir = Path(md_path).expanduser().parent
+        blocks: Iterator[Union[str, TelegramText]] = iter_html_to_telegram_text(
+            iter_md_to_html(md_path), base_dir, imgbb_api_key
+        )
+    elif fmt == "html":
+        artifact = load_artifact(md_path)
+        if artifact is not None:
+            blocks = iter([artifact.telegram_html])
+        else:
+            blocks = iter_sanitize_html_for_telegram(
+                iter_md_to_html(md_path), md_path, imgbb_api_key
+            )
+    else:
+        raise ValueError(f"Неизвестный формат Telegram: {fmt} (html или entities)")
+    yield from pack_message_parts(blocks, limit)
+
+
+def render_telegraph_nodes(
+    md_path: str,
+    imgbb_api_key: Optional[str] = None,
+    upload: bool = True,
+) -> Tuple[List[Node], Optional[str]]:
+    """(nodes, title) для Telegraph: из артефактов сборки или рендер на лету."""
+    artifact = load_artifact(md_path)
+    if artifact is not None:
+        return artifact.telegraph_nodes, artifact.title
+    return markdown_to_telegraph_nodes(md_path, imgbb_api_key, upload=upload)
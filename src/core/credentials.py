@@ -0,0 +1,417 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from telegram import Message
+from telegram.error import TelegramError
+
+from core.preflight import PreflightError
+from core.retry import CircuitOpenError, cooldown_remaining, get_breaker
+from core.telegram import DELETE_BATCH_SIZE, TelegramClient
+from core.telegraph import TelegraphClient
+from utils.md2telegraph import Node
+from utils.message_ids import chunked
+from utils.telegram_entities import TelegramText
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pins (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    credential TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS page_parts (
+    path TEXT PRIMARY KEY,
+    parts TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class _PooledClient(Protocol):
+    credential_id: str
+    service: str
+
+
+C = TypeVar("C", bound=_PooledClient)
+
+
+class PinStore:
+    """
+    Какой учётной записью создан ресурс: сообщение (kind="tg", key="chat:id")
+    или страница Telegraph (kind="gr", key=path). Редактировать их может только она.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # Страницы Telegraph создаются и из потоков (asyncio.to_thread)
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def pin(self, kind: str, keys: Iterable[str], credential: str) -> None:
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pins (kind, key, credential, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                ((kind, key, credential, now) for key in keys),
+            )
+
+    def lookup(self, kind: str, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT credential FROM pins WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_parts(self, path: str, parts: Sequence[str]) -> None:
+        """Страницы-продолжения публикации с первой страницей path (по порядку)."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO page_parts (path, parts) VALUES (?, ?)",
+                (path, json.dumps(list(parts))),
+            )
+
+    def parts(self, path: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT parts FROM page_parts WHERE path = ?", (path,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class CredentialPool(Generic[C]):
+    """
+    Набор клиентов с разными учётными данными. Запрос получает клиента,
+    который не ждёт паузы rate limit, у которого меньше всего запросов
+    в работе и который реже использовался.
+    """
+
+    def __init__(self, clients: Sequence[C]) -> None:
+        if not clients:
+            raise ValueError("Пул учётных данных пуст")
+        self.clients: Dict[str, C] = {c.credential_id: c for c in clients}
+        self._in_flight = dict.fromkeys(self.clients, 0)
+        self._used = dict.fromkeys(self.clients, 0)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    @property
+    def default(self) -> str:
+        """Основная учётная запись: ей созданы ресурсы, не закреплённые в PinStore."""
+        return next(iter(self.clients))
+
+    def _score(self, credential: str) -> Tuple[bool, float, int, int]:
+        service = self.clients[credential].service
+        wait = cooldown_remaining(service)
+        blocked = wait > 0 or get_breaker(service).state == "open"
+        return blocked, wait, self._in_flight[credential], self._used[credential]
+
+    @contextmanager
+    def lease(self, credential: Optional[str] = None) -> Iterator[Tuple[str, C]]:
+        """
+        Выдаёт (credential_id, клиент) на время запроса.
+        credential — закреплённая учётная запись; если её нет в пуле, выбирается любая.
+        """
+        with self._lock:
+            if credential is not None and credential not in self.clients:
+                logger.warning(
+                    "Учётная запись %s не найдена в пуле, используется другая",
+                    credential,
+                )
+                credential = None
+            if credential is None:
+                credential = min(self.clients, key=self._score)
+            self._in_flight[credential] += 1
+            self._used[credential] += 1
+        try:
+            yield credential, self.clients[credential]
+        finally:
+            with self._lock:
+                self._in_flight[credential] -= 1
+
+
+def _message_key(chat_id: ChatId, message_id: int) -> str:
+    return f"{chat_id}:{message_id}"
+
+
+class TelegramPool:
+    """
+    Несколько ботов за интерфейсом TelegramClient. Новые сообщения уходят через
+    наименее загруженного бота; правки и удаления — через бота, отправившего сообщение.
+    """
+
+    def __init__(
+        self, clients: Sequence[TelegramClient], pins: Optional[PinStore] = None
+    ) -> None:
+        self.pool: CredentialPool[TelegramClient] = CredentialPool(clients)
+        self.pins = pins
+
+    @classmethod
+    def from_tokens(
+        cls, tokens: Sequence[str], pins: Optional[PinStore] = None, **client_kwargs
+    ) -> "TelegramPool":
+        tokens = list(dict.fromkeys(tokens)) or ["None"]
+        clients = []
+        for token in tokens:
+            bot_id = token.split(":", 1)[0]
+            service = "telegram" if len(tokens) == 1 else f"telegram:{bot_id}"
+            clients.append(TelegramClient(token, service=service, **client_kwargs))
+        return cls(clients, pins)
+
+    async def __aenter__(self) -> "TelegramPool":
+        await asyncio.gather(*(c.start() for c in self.pool.clients.values()))
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await asyncio.gather(*(c.close() for c in self.pool.clients.values()))
+        if self.pins is not None:
+            self.pins.close()
+
+    def _pinned(self, chat_id: ChatId, message_id: int) -> str:
+        pinned = None
+        if self.pins is not None:
+            pinned = self.pins.lookup("tg", _message_key(chat_id, message_id))
+        return pinned or self.pool.default
+
+    def _pin(self, credential: str, chat_id: ChatId, result: Any) -> None:
+        if self.pins is not None and isinstance(result, Message):
+            self.pins.pin("tg", [_message_key(chat_id, result.message_id)], credential)
+
+    async def send_message(
+        self, chat_id: ChatId, text: Union[str, TelegramText], **kwargs
+    ) -> Optional[Message | TelegramError | CircuitOpenError | PreflightError]:
+        with self.pool.lease() as (credential, client):
+            await client.chat_limiter(chat_id).acquire()
+            result = await client.send_message(chat_id=chat_id, text=text, **kwargs)
+        self._pin(credential, chat_id, result)
+        return result
+
+    async def send_message_many(
+        self,
+        chat_ids: Sequence[ChatId],
+        text: Union[str, TelegramText],
+        concurrency: int = 8,
+        **kwargs,
+    ) -> Dict[
+        ChatId, Optional[Message | TelegramError | CircuitOpenError | PreflightError]
+    ]:
+        """Как TelegramClient.send_message_many, но каналы распределяются по ботам."""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _send(chat_id: ChatId):
+            async with semaphore:
+                return await self.send_message(chat_id, text, **kwargs)
+
+        results = await asyncio.gather(*(_send(c) for c in chat_ids))
+        return dict(zip(chat_ids, results))
+
+    async def edit_message(
+        self,
+        chat_id: ChatId,
+        message_id: int,
+        new_text: Union[str, TelegramText],
+        **kwargs,
+    ) -> Optional[Message | TelegramError | CircuitOpenError | PreflightError | bool]:
+        with self.pool.lease(self._pinned(chat_id, message_id)) as (_, client):
+            return await client.edit_message(chat_id, message_id, new_text, **kwargs)
+
+    async def send_photo(
+        self, chat_id: ChatId, photo_path: str, **kwargs
+    ) -> Optional[Message]:
+        with self.pool.lease() as (credential, client):
+            result = await client.send_photo(
+                chat_id=chat_id, photo_path=photo_path, **kwargs
+            )
+        self._pin(credential, chat_id, result)
+        return result
+
+    async def edit_photo(
+        self, chat_id: ChatId, message_id: int, **kwargs
+    ) -> Message | bool:
+        with self.pool.lease(self._pinned(chat_id, message_id)) as (_, client):
+            return await client.edit_photo(
+                chat_id=chat_id, message_id=message_id, **kwargs
+            )
+
+    async def fetch_message(
+        self, chat_id: ChatId, message_id: int, copy_chat_id: ChatId
+    ) -> Optional[Message]:
+        with self.pool.lease(self._pinned(chat_id, message_id)) as (_, client):
+            return await client.fetch_message(chat_id, message_id, copy_chat_id)
+
+    async def delete_message(self, chat_id: ChatId, message_id: int) -> bool:
+        with self.pool.lease(self._pinned(chat_id, message_id)) as (_, client):
+            return await client.delete_message(chat_id=chat_id, message_id=message_id)
+
+    async def delete_messages(
+        self, chat_id: ChatId, message_ids: Iterable[int], **kwargs
+    ) -> List[int]:
+        """
+        Удаляет сообщения пачками через ботов, которые их отправили
+        (семантика результата — как у TelegramClient.delete_messages).
+        ID читаются окнами по DELETE_BATCH_SIZE * concurrency и группируются
+        по ботам внутри окна: большой диапазон не разворачивается в память.
+        """
+        window = DELETE_BATCH_SIZE * max(1, kwargs.get("concurrency", 4))
+        failed: List[int] = []
+
+        async def _delete(credential: str, ids: List[int]) -> List[int]:
+            with self.pool.lease(credential) as (_, client):
+                return await client.delete_messages(chat_id, ids, **kwargs)
+
+        for chunk in chunked(message_ids, window):
+            groups: Dict[str, List[int]] = {}
+            for message_id in chunk:
+                credential = self._pinned(chat_id, message_id)
+                groups.setdefault(credential, []).append(message_id)
+            results = await asyncio.gather(*(_delete(c, i) for c, i in groups.items()))
+            failed.extend(i for ids in results for i in ids)
+        return sorted(failed)
+
+
+def _page_paths(result: Dict[str, Any]) -> List[str]:
+    paths = [result["path"]] if result.get("path") else []
+    for url in result.get("parts", [])[1:]:
+        paths.append(url.rstrip("/").rsplit("/", 1)[-1])
+    return paths
+
+
+class TelegraphPool:
+    """
+    Несколько аккаунтов Telegraph за интерфейсом TelegraphClient.
+    Страница редактируется только создавшим её аккаунтом, поэтому путь каждой
+    созданной страницы (и её продолжений) закрепляется за аккаунтом.
+    """
+
+    def __init__(
+        self, clients: Sequence[TelegraphClient], pins: Optional[PinStore] = None
+    ) -> None:
+        self.pool: CredentialPool[TelegraphClient] = CredentialPool(clients)
+        self.pins = pins
+
+    @classmethod
+    def from_tokens(
+        cls, tokens: Sequence[str], pins: Optional[PinStore] = None, **client_kwargs
+    ) -> "TelegraphPool":
+        tokens = list(dict.fromkeys(tokens)) or ["None"]
+        clients = []
+        for i, token in enumerate(tokens):
+            service = "telegraph" if len(tokens) == 1 else f"telegraph:{i}"
+            clients.append(TelegraphClient(token, service=service, **client_kwargs))
+        return cls(clients, pins)
+
+    def _pinned(self, path: str) -> str:
+        pinned = self.pins.lookup("gr", path) if self.pins is not None else None
+        return pinned or self.pool.default
+
+    def _pin(self, credential: str, result: Dict[str, Any]) -> None:
+        paths = _page_paths(result)
+        if self.pins is not None and paths:
+            self.pins.pin("gr", paths, credential)
+            # Затёртые продолжения тоже запоминаются: при росте текста
+            # они будут использованы снова вместо создания новых страниц
+            self.pins.set_parts(paths[0], paths[1:] + result.get("spare", []))
+
+    def create_page(
+        self,
+        title: str | None,
+        md_path: str,
+        author_name: Optional[str] = None,
+        author_url: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        with self.pool.lease() as (credential, client):
+            result = client.create_page(title, md_path, author_name, author_url)
+        self._pin(credential, result)
+        return result
+
+    def create_page_from_nodes(
+        self,
+        title: str,
+        nodes: List[Node],
+        author_name: Optional[str] = None,
+        author_url: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        with self.pool.lease() as (credential, client):
+            result = client.create_page_from_nodes(
+                title, nodes, author_name, author_url
+            )
+        self._pin(credential, result)
+        return result
+
+    def edit_page(
+        self,
+        path: str,
+        title: str | None,
+        md_path: str,
+        author_name: Optional[str] = None,
+        author_url: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        parts = self.pins.parts(path) if self.pins is not None else None
+        with self.pool.lease(self._pinned(path)) as (credential, client):
+            result = client.edit_page(
+                path, title, md_path, author_name, author_url, part_paths=parts
+            )
+        # При правке могли появиться новые страницы-продолжения
+        self._pin(credential, result)
+        return result
+
+    def delete_page(self, path: str, title: str = "Deleted") -> dict:
+        with self.pool.lease(self._pinned(path)) as (_, client):
+            return client.delete_page(path, title)
+
+    def get_page(self, path: str, return_content: bool = True) -> Dict[str, Any]:
+        # getPage не требует токена — подойдёт любой аккаунт
+        with self.pool.lease() as (_, client):
+            return client.get_page(path, return_content=return_content)
+
+    def iter_pages(self, limit: int = 50) -> Iterator[Dict[str, Any]]:
+        """Страницы всех аккаунтов пула."""
+        for client in self.pool.clients.values():
+            yield from client.iter_pages(limit=limit)
+
+    def list_all_pages(self, limit: int = 200, jobs: int = 4) -> List[Dict[str, Any]]:
+        """Страницы всех аккаунтов пула (каждый аккаунт — параллельной пагинацией)."""
+        pages: List[Dict[str, Any]] = []
+        for client in self.pool.clients.values():
+            pages.extend(client.list_all_pages(limit=limit, jobs=jobs))
+        return pages
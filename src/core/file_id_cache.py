@@ -0,0 +1,88 @@
+import hashlib
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+from core.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+FILE_ID_LOOKUPS = Counter(
+    "mdp_telegram_file_id_cache_total",
+    "Обращения к кешу file_id: hit, miss, stale (Telegram отклонил ID)",
+    ("result",),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_ids (
+    bot_id TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (bot_id, digest)
+);
+"""
+
+_CHUNK = 1024 * 1024
+
+
+def file_digest(path: Path) -> str:
+    """sha256 содержимого файла (читается блоками, без загрузки целиком)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FileIdCache:
+    """
+    Персистентное соответствие «хеш содержимого → file_id» для каждого бота (SQLite).
+    file_id привязан к боту, поэтому ключ — (bot_id, digest).
+    База открывается при первом обращении.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get(self, bot_id: str, digest: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT file_id FROM file_ids WHERE bot_id = ? AND digest = ?",
+            (bot_id, digest),
+        ).fetchone()
+        FILE_ID_LOOKUPS.inc(result="hit" if row else "miss")
+        return row[0] if row else None
+
+    def put(self, bot_id: str, digest: str, file_id: str, size: int) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_ids"
+                " (bot_id, digest, file_id, size, created_at) VALUES (?, ?, ?, ?, ?)",
+                (bot_id, digest, file_id, size, time.time()),
+            )
+
+    def forget(self, bot_id: str, digest: str) -> None:
+        """Удаляет устаревший file_id, который Telegram больше не принимает."""
+        FILE_ID_LOOKUPS.inc(result="stale")
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM file_ids WHERE bot_id = ? AND digest = ?",
+                (bot_id, digest),
+            )
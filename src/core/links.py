@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+import httpx
+
+from core.metrics import Counter, track_request
+from core.rate_limit import RateLimiter
+from utils.converting_md2html import is_large_md, iter_md_to_html, md_to_html
+
+logger = logging.getLogger(__name__)
+
+LINK_CHECKS = Counter(
+    "mdp_link_checks_total",
+    "Проверки ссылок: ok, broken, unknown, cached",
+    ("result",),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    url TEXT PRIMARY KEY,
+    status INTEGER,
+    final_url TEXT,
+    checked_at REAL NOT NULL
+);
+"""
+
+USER_AGENT = "mdp-linkcheck/1.0"
+# HEAD не поддерживается или запрещён: повторяем запрос через GET
+_HEAD_FALLBACK = {403, 404, 405, 501}
+# Сервер перегружен или ограничивает частоту — ссылка не обязательно битая
+_UNKNOWN_STATUSES = {429, 503}
+
+
+class _LinkParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.links: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href.strip())
+
+
+def iter_html_links(html: str) -> List[str]:
+    """Внешние ссылки `<a href>` (http/https) в порядке появления, без повторов."""
+    parser = _LinkParser()
+    parser.feed(html)
+    parser.close()
+    seen: Dict[str, None] = {}
+    for href in parser.links:
+        if urlsplit(href).scheme in ("http", "https"):
+            seen.setdefault(href.split("#", 1)[0], None)
+    return list(seen)
+
+
+def extract_links(md_path: str) -> List[str]:
+    """Внешние ссылки из отрендеренного документа (большие — по блокам)."""
+    if is_large_md(md_path):
+        found: Dict[str, None] = {}
+        for block in iter_md_to_html(md_path):
+            for url in iter_html_links(block):
+                found.setdefault(url, None)
+        return list(found)
+    return iter_html_links(md_to_html(md_path))
+
+
+@dataclass(frozen=True)
+class LinkResult:
+    url: str
+    status: Optional[int] = None
+    final_url: Optional[str] = None
+    error: Optional[str] = None
+    checked_at: float = 0.0
+    cached: bool = False
+    # Сервер не ответил за timeout — ссылка не обязательно битая
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status is not None and self.status < 400
+
+    @property
+    def unknown(self) -> bool:
+        """Результат не говорит, битая ли ссылка (rate limit, перегрузка, таймаут)."""
+        return self.timed_out or self.status in _UNKNOWN_STATUSES
+
+    @property
+    def result(self) -> str:
+        if self.ok:
+            return "ok"
+        return "unknown" if self.unknown else "broken"
+
+
+class LinkCache:
+    """
+    Результаты проверки ссылок (SQLite). Рабочая ссылка не перепроверяется,
+    пока не истёк ttl; битые и неопределённые не кешируются — их
+    проверяют при каждом запуске, пока их не исправят.
+    """
+
+    def __init__(self, path: Path, ttl: float = 24 * 3600) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get(self, url: str) -> Optional[LinkResult]:
+        row = self.conn.execute(
+            "SELECT status, final_url, checked_at FROM links WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        return LinkResult(url, row[0], row[1], checked_at=row[2], cached=True)
+
+    def put(self, results: Iterable[LinkResult]) -> None:
+        rows = [
+            (r.url, r.status, r.final_url, r.checked_at)
+            for r in results
+            if r.ok and not r.cached
+        ]
+        if rows:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO links (url, status, final_url, checked_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+
+
+class LinkChecker:
+    """
+    Параллельная проверка ссылок: всего не больше jobs запросов одновременно,
+    к одному хосту — не больше per_host, и не чаще одного запроса в delay секунд
+    (вежливость к чужим серверам). Сначала HEAD, при отказе — GET без чтения тела.
+    """
+
+    def __init__(
+        self,
+        jobs: int = 16,
+        per_host: int = 2,
+        delay: float = 0.5,
+        timeout: float = 10.0,
+        cache: Optional[LinkCache] = None,
+    ) -> None:
+        self.jobs = max(1, jobs)
+        self.per_host = max(1, per_host)
+        self.delay = delay
+        self.timeout = timeout
+        self.cache = cache
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._slots = asyncio.Semaphore(self.jobs)
+
+    def _host(self, url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    async def _request(
+        self, client: httpx.AsyncClient, method: str, url: str
+    ) -> httpx.Response:
+        host = self._host(url)
+        semaphore = self._hosts.setdefault(host, asyncio.Semaphore(self.per_host))
+        limiter = self._limiters.setdefault(
+            host, RateLimiter(1 / self.delay if self.delay > 0 else 0)
+        )
+        async with semaphore:
+            await limiter.acquire()
+            # Ждём свободный слот здесь, а не в пуле httpx: ожидание пула
+            # не должно съедать таймаут запроса
+            async with self._slots:
+                with track_request("links", method):
+                    async with client.stream(method, url) as response:
+                        return response
+
+    async def check_one(self, client: httpx.AsyncClient, url: str) -> LinkResult:
+        try:
+            response = await self._request(client, "HEAD", url)
+            if response.status_code in _HEAD_FALLBACK:
+                response = await self._request(client, "GET", url)
+        except httpx.HTTPError as e:
+            result = LinkResult(
+                url,
+                error=str(e) or type(e).__name__,
+                checked_at=time.time(),
+                timed_out=isinstance(e, httpx.TimeoutException),
+            )
+        else:
+            final = str(response.url)
+            result = LinkResult(
+                url,
+                response.status_code,
+                final if final != url else None,
+                checked_at=time.time(),
+            )
+        LINK_CHECKS.inc(result=result.result)
+        if not result.ok:
+            logger.debug("Ссылка %s: %s", url, result.error or result.status)
+        return result
+
+    async def check(
+        self, urls: Sequence[str], refresh: bool = False
+    ) -> List[LinkResult]:
+        """Результаты в порядке urls; из кеша берутся ещё не устаревшие."""
+        # Семафоры и лимитеры привязаны к циклу событий: свои на каждый запуск
+        self._hosts, self._limiters = {}, {}
+        self._slots = asyncio.Semaphore(self.jobs)
+        results: Dict[str, LinkResult] = {}
+        pending: List[str] = []
+        for url in dict.fromkeys(urls):
+            cached = None if refresh or self.cache is None else self.cache.get(url)
+            if cached is not None:
+                LINK_CHECKS.inc(result="cached")
+                results[url] = cached
+            else:
+                pending.append(url)
+
+        if pending:
+            limits = httpx.Limits(
+                max_connections=self.jobs, max_keepalive_connections=self.jobs
+            )
+            async with httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, pool=None),
+                limits=limits,
+                follow_redirects=True,
+                headers={"User-Agent": USER_AGENT},
+            ) as client:
+                checked = await asyncio.gather(
+                    *(self.check_one(client, url) for url in pending)
+                )
+            results.update((r.url, r) for r in checked)
+            if self.cache is not None:
+                self.cache.put(checked)
+        return [results[url] for url in dict.fromkeys(urls)]
+
+
+@dataclass
+class LinkReport:
+    md_path: str
+    results: List[LinkResult] = field(default_factory=list)
+    # Документ не удалось отрендерить — ссылки не проверялись
+    error: Optional[str] = None
+
+    @property
+    def broken(self) -> List[LinkResult]:
+        return [r for r in self.results if r.result == "broken"]
+
+
+def _extract(md_path: str) -> LinkReport:
+    try:
+        return LinkReport(md_path, [LinkResult(url) for url in extract_links(md_path)])
+    except Exception as e:
+        return LinkReport(md_path, error=str(e))
+
+
+async def check_files(
+    md_paths: Sequence[str], checker: LinkChecker, refresh: bool = False
+) -> List[LinkReport]:
+    """
+    Проверяет ссылки файлов (порядок отчётов совпадает с md_paths);
+    ссылка, встречающаяся в нескольких файлах, проверяется один раз.
+    """
+    reports = await asyncio.gather(*(asyncio.to_thread(_extract, p) for p in md_paths))
+    urls = [r.url for report in reports for r in report.results]
+    checked = {r.url: r for r in await checker.check(urls, refresh)}
+    for report in reports:
+        report.results = [checked[r.url] for r in report.results]
+    return list(reports)
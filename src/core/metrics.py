@@ -0,0 +1,235 @@
+import atexit
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Все созданные метрики регистрируются здесь автоматически
+REGISTRY: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        """Строки метрики в текстовом формате Prometheus."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        lines = self.header()
+        for key, val in items:
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {val:g}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # на каждую комбинацию меток: [счётчики по корзинам..., +Inf], сумма
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][idx] += 1
+            entry[1][0] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(c), s[0]) for k, (c, s) in self._values.items()]
+        lines = self.header()
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _labels(self.label_names, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            plain = _labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{plain} {total:g}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+API_LATENCY = Histogram(
+    "mdp_api_request_seconds",
+    "Длительность запросов к внешним API",
+    ("service", "method"),
+)
+API_REQUESTS = Counter(
+    "mdp_api_requests_total",
+    "Количество запросов к внешним API",
+    ("service", "method", "status"),
+)
+RETRY_AFTER = Counter(
+    "mdp_retry_after_total",
+    "Сколько раз API ответил rate limit (RetryAfter / FLOOD_WAIT)",
+    ("service",),
+)
+RATE_LIMIT_WAIT = Counter(
+    "mdp_rate_limit_wait_seconds_total",
+    "Суммарное время ожидания из-за rate limit",
+    ("service",),
+)
+UPLOADED_BYTES = Counter(
+    "mdp_uploaded_bytes_total",
+    "Объём загруженных файлов",
+    ("service",),
+)
+
+
+class RequestStatus:
+    """Результат запроса для track_request: ошибку без исключения отмечает fail()."""
+
+    def __init__(self) -> None:
+        self.status = "ok"
+
+    def fail(self) -> None:
+        self.status = "error"
+
+
+@contextmanager
+def track_request(service: str, method: str) -> Iterator[RequestStatus]:
+    """
+    Замеряет длительность и результат одного запроса к API. Исключение
+    внутри блока — ошибка; ответ с ошибкой (Telegraph `{"ok": false}`)
+    блок отмечает через fail() у полученного RequestStatus.
+    """
+    start = time.perf_counter()
+    request = RequestStatus()
+    try:
+        yield request
+    except BaseException:
+        request.fail()
+        raise
+    finally:
+        API_LATENCY.observe(time.perf_counter() - start, service=service, method=method)
+        API_REQUESTS.inc(service=service, method=method, status=request.status)
+
+
+def record_retry_after(service: str, delay: float) -> None:
+    RETRY_AFTER.inc(service=service)
+    RATE_LIMIT_WAIT.inc(delay, service=service)
+
+
+def record_upload(service: str, size: int) -> None:
+    UPLOADED_BYTES.inc(size, service=service)
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus / OpenMetrics."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str | Path) -> None:
+    """Атомарно записывает метрики для textfile collector node_exporter."""
+    out = Path(path).expanduser()
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+    tmp.write_text(render(), encoding="utf-8")
+    tmp.replace(out)
+
+
+def enable_textfile(path: str | Path) -> None:
+    """Сохранить метрики в файл при завершении процесса."""
+
+    def _flush() -> None:
+        try:
+            write_textfile(path)
+        except OSError as e:
+            logger.warning("Не удалось записать метрики в %s: %s", path, e)
+
+    atexit.register(_flush)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("metrics: " + format, *args)
+
+
+def serve(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Запускает HTTP-эндпоинт /metrics в фоновом потоке (для режима демона)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return server
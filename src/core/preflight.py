@@ -0,0 +1,400 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.build import iter_telegram_parts, render_telegraph_nodes
+from core.scanner import iter_image_refs
+from utils.converting_md2html import read_md_source
+from utils.md2telegraph import ALLOWED_TAGS as TELEGRAPH_TAGS
+from utils.md2telegraph import Node
+from utils.telegram_entities import (
+    CAPTION_LIMIT,
+    MESSAGE_LIMIT,
+    TelegramText,
+    utf16_len,
+)
+from utils.telegraph_payload import (
+    NAV_RESERVE_BYTES,
+    TELEGRAPH_CONTENT_LIMIT,
+    dump_node,
+)
+from utils.upload_img import offline
+
+# Проверка перед каждым вызовом API (выключается через configure)
+_enabled = True
+
+ERROR = "error"
+WARNING = "warning"
+
+# Теги и атрибуты, которые принимает parse_mode=HTML в Bot API
+TELEGRAM_TAGS: Dict[str, Tuple[str, ...]] = {
+    "b": (),
+    "strong": (),
+    "i": (),
+    "em": (),
+    "u": (),
+    "ins": (),
+    "s": (),
+    "strike": (),
+    "del": (),
+    "span": ("class",),
+    "tg-spoiler": (),
+    "a": ("href",),
+    "tg-emoji": ("emoji-id",),
+    "code": ("class",),
+    "pre": (),
+    "blockquote": ("expandable",),
+}
+TELEGRAM_ENTITIES = {"lt", "gt", "amp", "quot"}
+
+# Атрибуты узлов, которые понимает Telegraph API; alt и title добавляет
+# md2telegraph, API их молча отбрасывает
+TELEGRAPH_ATTRS = {"href", "src", "alt", "title"}
+TELEGRAPH_MEDIA = {"img", "iframe", "video"}
+TITLE_LIMIT = 256
+AUTHOR_NAME_LIMIT = 128
+AUTHOR_URL_LIMIT = 512
+# Максимальный размер изображения, который принимает ImgBB
+IMAGE_SIZE_LIMIT = 32 * 1024 * 1024
+
+
+def configure(enabled: bool) -> None:
+    """Включает или выключает автоматическую проверку перед публикацией."""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+@dataclass(frozen=True)
+class Problem:
+    severity: str
+    where: str  # tg, gr, asset или link
+    message: str
+
+    def __str__(self) -> str:
+        return f"[{self.where}] {self.message}"
+
+
+class PreflightError(ValueError):
+    """Payload не пройдёт проверку API: запрос не отправляется."""
+
+    def __init__(self, problems: Sequence[Problem]) -> None:
+        self.problems = list(problems)
+        super().__init__("; ".join(str(p) for p in self.problems))
+
+
+@dataclass
+class PreflightReport:
+    md_path: str
+    problems: List[Problem] = field(default_factory=list)
+
+    @property
+    def errors(self) -> List[Problem]:
+        return [p for p in self.problems if p.severity == ERROR]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+class _TelegramHTMLChecker(HTMLParser):
+    """Проверяет HTML так же строго, как парсер Bot API, и считает длину текста."""
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=False)
+        self.stack: List[str] = []
+        self.length = 0
+        self.text_found = False
+        self.problems: List[Problem] = []
+
+    def _error(self, message: str) -> None:
+        self.problems.append(Problem(ERROR, "tg", message))
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        allowed = TELEGRAM_TAGS.get(tag)
+        if allowed is None:
+            self._error(f"тег <{tag}> не поддерживается Telegram")
+            return
+        for name, _ in attrs:
+            if name not in allowed:
+                self._error(f"атрибут {name} не поддерживается у <{tag}>")
+        if tag == "a" and "a" in self.stack:
+            self._error("вложенная ссылка <a>")
+        if "code" in self.stack or ("pre" in self.stack and tag != "code"):
+            self._error(f"тег <{tag}> внутри блока кода")
+        self.stack.append(tag)
+
+    def handle_startendtag(
+        self, tag: str, attrs: List[Tuple[str, Optional[str]]]
+    ) -> None:
+        self._error(f"тег <{tag}/> не поддерживается Telegram")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag not in TELEGRAM_TAGS:
+            return  # уже учтён в handle_starttag
+        if not self.stack or self.stack[-1] != tag:
+            expected = f", ожидался </{self.stack[-1]}>" if self.stack else ""
+            self._error(f"лишний закрывающий тег </{tag}>{expected}")
+            if tag in self.stack:
+                while self.stack.pop() != tag:
+                    pass
+            return
+        self.stack.pop()
+
+    def handle_data(self, data: str) -> None:
+        if "<" in data or "&" in data:
+            self._error(f"неэкранированный символ в тексте: {data.strip()[:40]!r}")
+        self.length += utf16_len(data)
+        self.text_found = self.text_found or bool(data.strip())
+
+    def handle_entityref(self, name: str) -> None:
+        if name not in TELEGRAM_ENTITIES:
+            self._error(f"неизвестная HTML-сущность &{name};")
+        self.length += 1
+        self.text_found = True
+
+    def handle_charref(self, name: str) -> None:
+        try:
+            code = int(name[1:], 16) if name[:1] in "xX" else int(name)
+        except ValueError:
+            self._error(f"некорректная ссылка на символ &#{name};")
+            return
+        self.length += 2 if code > 0xFFFF else 1
+        self.text_found = True
+
+
+@lru_cache(maxsize=64)
+def _check_telegram_html(html: str, limit: int) -> Tuple[Problem, ...]:
+    checker = _TelegramHTMLChecker()
+    checker.feed(html)
+    checker.close()
+    problems = checker.problems
+    for tag in reversed(checker.stack):
+        problems.append(Problem(ERROR, "tg", f"незакрытый тег <{tag}>"))
+    if not checker.text_found:
+        problems.append(Problem(ERROR, "tg", "пустой текст"))
+    if checker.length > limit:
+        problems.append(
+            Problem(ERROR, "tg", f"текст длиннее лимита: {checker.length} из {limit}")
+        )
+    return tuple(problems)
+
+
+def check_telegram_html(html: str, caption: bool = False) -> List[Problem]:
+    """
+    Проверка HTML для parse_mode=HTML: баланс тегов, допустимые теги и атрибуты,
+    экранирование и длина текста после разбора (в UTF-16, как считает Telegram).
+    """
+    return list(_check_telegram_html(html, CAPTION_LIMIT if caption else MESSAGE_LIMIT))
+
+
+def check_telegram_text(text: TelegramText, caption: bool = False) -> List[Problem]:
+    """Проверка текста с сущностями: длина и границы сущностей."""
+    limit = CAPTION_LIMIT if caption else MESSAGE_LIMIT
+    problems: List[Problem] = []
+    length = text.utf16_length
+    if not text.text.strip():
+        problems.append(Problem(ERROR, "tg", "пустой текст"))
+    if length > limit:
+        problems.append(
+            Problem(ERROR, "tg", f"текст длиннее лимита: {length} из {limit}")
+        )
+    for entity in text.entities:
+        if entity.offset < 0 or entity.length <= 0:
+            problems.append(Problem(ERROR, "tg", f"пустая сущность {entity.type}"))
+        elif entity.offset + entity.length > length:
+            problems.append(
+                Problem(ERROR, "tg", f"сущность {entity.type} выходит за конец текста")
+            )
+    return problems
+
+
+def check_telegram_message(text: Any, caption: bool = False) -> List[Problem]:
+    """Проверка HTML или TelegramText — того, что уходит в Bot API."""
+    if isinstance(text, TelegramText):
+        return check_telegram_text(text, caption)
+    return check_telegram_html(str(text), caption)
+
+
+def _check_node(
+    node: Any, problems: List[Problem], allow_local: bool, path: str
+) -> None:
+    if isinstance(node, str):
+        return
+    if not isinstance(node, dict):
+        problems.append(Problem(ERROR, "gr", f"{path}: узел не строка и не объект"))
+        return
+    tag = node.get("tag")
+    if tag not in TELEGRAPH_TAGS:
+        problems.append(Problem(ERROR, "gr", f"{path}: тег {tag!r} не поддерживается"))
+    attrs = node.get("attrs") or {}
+    if not isinstance(attrs, dict):
+        problems.append(Problem(ERROR, "gr", f"{path}: attrs должен быть объектом"))
+        attrs = {}
+    extra = set(attrs) - TELEGRAPH_ATTRS
+    if extra:
+        problems.append(
+            Problem(WARNING, "gr", f"{path}: атрибуты {sorted(extra)} будут отброшены")
+        )
+    if tag in TELEGRAPH_MEDIA:
+        src = str(attrs.get("src") or "")
+        if not src:
+            problems.append(Problem(ERROR, "gr", f"{path}: <{tag}> без src"))
+        elif not allow_local and not src.startswith(("http://", "https://", "/")):
+            problems.append(
+                Problem(ERROR, "gr", f"{path}: локальный файл не загружен: {src}")
+            )
+    children = node.get("children", [])
+    if not isinstance(children, list):
+        problems.append(Problem(ERROR, "gr", f"{path}: children должен быть списком"))
+        return
+    for i, child in enumerate(children):
+        _check_node(child, problems, allow_local, f"{path}/{tag}[{i}]")
+
+
+def check_telegraph_nodes(
+    nodes: Sequence[Node],
+    title: Optional[str] = None,
+    author_name: Optional[str] = None,
+    author_url: Optional[str] = None,
+    allow_local: bool = False,
+) -> List[Problem]:
+    """
+    Проверка страницы Telegraph: допустимые теги и атрибуты, структура узлов,
+    незагруженные локальные файлы, лимиты заголовка, автора и размера блока.
+    allow_local=True — для офлайн-проверки до загрузки изображений.
+    """
+    problems: List[Problem] = []
+    if not nodes:
+        problems.append(Problem(ERROR, "gr", "пустая страница"))
+    if title is not None and not 0 < len(title) <= TITLE_LIMIT:
+        problems.append(
+            Problem(ERROR, "gr", f"заголовок должен быть 1–{TITLE_LIMIT} символов")
+        )
+    if author_name and len(author_name) > AUTHOR_NAME_LIMIT:
+        problems.append(
+            Problem(ERROR, "gr", f"имя автора длиннее {AUTHOR_NAME_LIMIT} символов")
+        )
+    if author_url and len(author_url) > AUTHOR_URL_LIMIT:
+        problems.append(
+            Problem(ERROR, "gr", f"ссылка автора длиннее {AUTHOR_URL_LIMIT} символов")
+        )
+    block_limit = TELEGRAPH_CONTENT_LIMIT - NAV_RESERVE_BYTES - 2
+    for i, node in enumerate(nodes):
+        _check_node(node, problems, allow_local, f"[{i}]")
+        size = len(dump_node(node).encode("utf-8"))
+        if size > block_limit:
+            problems.append(
+                Problem(
+                    ERROR,
+                    "gr",
+                    f"[{i}]: блок {size} байт не помещается в страницу ({block_limit})",
+                )
+            )
+    return problems
+
+
+def check_assets(md_path: str) -> List[Problem]:
+    """
+    Локальные изображения документа (в том числе из включаемых файлов):
+    существование и размер.
+    """
+    src_path = Path(md_path).expanduser()
+    problems: List[Problem] = []
+    try:
+        text = read_md_source(str(src_path))
+    except OSError as e:
+        return [Problem(ERROR, "asset", f"не удалось прочитать {md_path}: {e}")]
+    for src in iter_image_refs(text):
+        if src.startswith(("http://", "https://")):
+            continue
+        local = src_path.parent / src
+        try:
+            size = local.stat().st_size
+        except OSError:
+            problems.append(Problem(ERROR, "asset", f"нет изображения {src}"))
+            continue
+        if not local.is_file():
+            problems.append(Problem(ERROR, "asset", f"{src} — не файл"))
+        elif size == 0:
+            problems.append(Problem(ERROR, "asset", f"пустое изображение {src}"))
+        elif size > IMAGE_SIZE_LIMIT:
+            problems.append(
+                Problem(
+                    ERROR,
+                    "asset",
+                    f"изображение {src} больше {IMAGE_SIZE_LIMIT // 2**20} МБ",
+                )
+            )
+    return problems
+
+
+def check_file(
+    md_path: str, targets: Iterable[str] = ("tg", "gr"), telegram_format: str = "html"
+) -> PreflightReport:
+    """
+    Офлайн-проверка исходника: рендер без загрузки изображений и проверка
+    того, что получит API. Пост проверяется по частям цепочки, как его
+    отправит `tg post`; длина считается с заглушками вместо ссылок
+    на ещё не загруженные изображения.
+    """
+    report = PreflightReport(md_path, check_assets(md_path))
+    if any(p.message.startswith("не удалось прочитать") for p in report.problems):
+        return report
+    targets = set(targets)
+    if "tg" in targets:
+        try:
+            with offline():
+                parts = list(iter_telegram_parts(md_path, None, telegram_format))
+            if not parts:
+                report.problems.append(Problem(ERROR, "tg", "пустой текст"))
+            for i, part in enumerate(parts, 1):
+                for problem in check_telegram_message(part):
+                    if len(parts) > 1:
+                        problem = replace(
+                            problem, message=f"часть {i}: {problem.message}"
+                        )
+                    report.problems.append(problem)
+        except Exception as e:
+            report.problems.append(Problem(ERROR, "tg", f"ошибка рендера: {e}"))
+    if "gr" in targets:
+        try:
+            nodes, title = render_telegraph_nodes(md_path, None, upload=False)
+            report.problems.extend(
+                check_telegraph_nodes(
+                    nodes, title or Path(md_path).stem, allow_local=True
+                )
+            )
+        except Exception as e:
+            report.problems.append(Problem(ERROR, "gr", f"ошибка рендера: {e}"))
+    return report
+
+
+def check_files(
+    md_paths: Sequence[str],
+    targets: Iterable[str] = ("tg", "gr"),
+    telegram_format: str = "html",
+    jobs: Optional[int] = None,
+) -> List[PreflightReport]:
+    """Проверка многих файлов пулом процессов; порядок отчётов совпадает с md_paths."""
+    targets = tuple(targets)
+    workers = max(1, min(jobs or os.cpu_count() or 1, len(md_paths)))
+    if workers == 1:
+        return [check_file(p, targets, telegram_format) for p in md_paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(
+            pool.map(
+                check_file,
+                md_paths,
+                [targets] * len(md_paths),
+                [telegram_format] * len(md_paths),
+                chunksize=max(1, len(md_paths) // (workers * 4)),
+            )
+        )
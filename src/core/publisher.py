@@ -0,0 +1,363 @@
+import asyncio
+import logging
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from telegram import Message
+
+from core.build import render_telegram_message, render_telegraph_nodes
+from core.credentials import PinStore, TelegramPool, TelegraphPool
+from core.file_id_cache import FileIdCache
+from core.retry import RetryPolicy
+from core.telegram import TransportConfig
+from utils import block_cache, upload_img
+from utils.block_cache import BlockCache
+from utils.image_hosts import ImageHost, ImageHostSelector, build_hosts
+from utils.md2telegraph import Node
+from utils.telegram_entities import TelegramText
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+TARGETS = ("tg", "gr", "tgh")
+
+
+class PublishError(RuntimeError):
+    """Публикация не удалась ни в одном из мест назначения."""
+
+
+@dataclass
+class PublisherConfig:
+    """
+    Явная конфигурация Publisher: ни переменные окружения, ни .env не читаются.
+    Пустой список токенов отключает соответствующую платформу.
+    """
+
+    telegram_tokens: Sequence[str] = ()
+    telegraph_tokens: Sequence[str] = ()
+    # Каналы по умолчанию для post(), если chats не переданы
+    channels: Sequence[ChatId] = ()
+    imgbb_api_key: Optional[str] = None
+    author_name: Optional[str] = None
+    author_url: Optional[str] = None
+    # Дописывать ID сообщения в конец поста (как ADD_ID в CLI)
+    add_id: bool = False
+    # Формат сообщений: "html" (parse_mode=HTML) или "entities" (MessageEntity)
+    telegram_format: str = "html"
+    per_chat_interval: float = 1.0
+    transport: TransportConfig = field(default_factory=TransportConfig)
+    retry_policy: Optional[RetryPolicy] = None
+    file_id_cache: Optional[Path] = None
+    credentials_db: Optional[Path] = None
+    # SQLite-кеш отрендеренных блоков больших документов (None — только в памяти)
+    block_cache: Optional[Path] = None
+    # Хостинги изображений в порядке предпочтения (пусто — ImgBB по imgbb_api_key)
+    image_hosts: Sequence[ImageHost] = ()
+
+    @classmethod
+    def from_settings(cls) -> "PublisherConfig":
+        """Конфигурация из config.settings (те же переменные, что у CLI)."""
+        from config import settings
+
+        return cls(
+            telegram_tokens=settings.TELEGRAM_BOT_TOKENS,
+            telegraph_tokens=settings.TELEGRAPH_ACCESS_TOKENS,
+            channels=[settings.TELEGRAM_CHANNEL] if settings.TELEGRAM_CHANNEL else [],
+            imgbb_api_key=settings.IMGBB_API_KEY,
+            author_name=settings.AUTHOR_NAME,
+            author_url=settings.AUTHOR_URL,
+            add_id=settings.ADD_ID,
+            telegram_format=settings.TELEGRAM_FORMAT,
+            per_chat_interval=settings.TELEGRAM_PER_CHAT_INTERVAL,
+            transport=TransportConfig(**settings.TELEGRAM_TRANSPORT),
+            file_id_cache=settings.TELEGRAM_FILE_ID_CACHE,
+            credentials_db=settings.CREDENTIALS_DB,
+            block_cache=settings.BLOCK_CACHE_DB,
+            image_hosts=build_hosts(
+                settings.IMAGE_HOSTS,
+                imgbb_api_key=settings.IMGBB_API_KEY,
+                http_upload_url=settings.IMAGE_HTTP_UPLOAD_URL,
+                http_public_url=settings.IMAGE_HTTP_PUBLIC_URL,
+                http_token=settings.IMAGE_HTTP_TOKEN,
+            ),
+        )
+
+
+@dataclass
+class Rendered:
+    md_path: str
+    telegram_html: Optional[str] = None
+    # Заполняется вместо telegram_html при telegram_format="entities"
+    telegram_text: Optional[TelegramText] = None
+    telegraph_nodes: Optional[List[Node]] = None
+    title: Optional[str] = None
+
+
+@dataclass
+class Publication:
+    """Результат post(): страница и/или сообщения по каналам."""
+
+    target: str
+    md_path: str
+    url: Optional[str] = None
+    page_path: Optional[str] = None
+    messages: Dict[str, Optional[int]] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    def to_manifest(self) -> Dict[str, Any]:
+        """Данные в формате манифеста `--manifest` (их понимает mdp reconcile)."""
+        data: Dict[str, Any] = {"md_path": self.md_path, "messages": self.messages}
+        if self.url:
+            data["url"] = self.url
+        return data
+
+
+class Publisher:
+    """
+    Публикация из Python-кода: рендер и вызовы API без побочных эффектов CLI.
+    Клиенты (пулы соединений, лимитеры, кеш file_id) живут столько же, сколько
+    Publisher, и переиспользуются всеми вызовами:
+
+        async with Publisher(PublisherConfig(telegram_tokens=[token])) as mdp:
+            pub = await mdp.post("post.md", chats=["@channel"])
+            await mdp.edit(pub, "post.md")
+
+    Кеш блоков и хостинги изображений тоже принадлежат Publisher и действуют
+    только в его вызовах: глобальные настройки процесса не меняются.
+    """
+
+    def __init__(self, config: PublisherConfig) -> None:
+        self.config = config
+        self.block_cache = (
+            BlockCache(Path(config.block_cache).expanduser())
+            if config.block_cache
+            else None
+        )
+        self.image_hosts = (
+            ImageHostSelector(config.image_hosts) if config.image_hosts else None
+        )
+        self.pins = PinStore(config.credentials_db) if config.credentials_db else None
+        self.telegram: Optional[TelegramPool] = None
+        self.telegraph: Optional[TelegraphPool] = None
+        if config.telegram_tokens:
+            self.telegram = TelegramPool.from_tokens(
+                config.telegram_tokens,
+                pins=self.pins,
+                per_chat_interval=config.per_chat_interval,
+                retry_policy=config.retry_policy,
+                transport=config.transport,
+                file_id_cache=(
+                    FileIdCache(config.file_id_cache) if config.file_id_cache else None
+                ),
+                imgbb_api_key=config.imgbb_api_key,
+            )
+        if config.telegraph_tokens:
+            self.telegraph = TelegraphPool.from_tokens(
+                config.telegraph_tokens,
+                pins=self.pins,
+                retry_policy=config.retry_policy,
+                imgbb_api_key=config.imgbb_api_key,
+            )
+
+    async def __aenter__(self) -> "Publisher":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        if self.telegram is not None:
+            await self.telegram.__aenter__()
+
+    async def close(self) -> None:
+        if self.telegram is not None:
+            await self.telegram.__aexit__(None, None, None)
+        if self.pins is not None:
+            self.pins.close()
+        if self.block_cache is not None:
+            self.block_cache.close()
+
+    def _scope(self) -> ExitStack:
+        """Кеш блоков и хостинги этого Publisher для рендера внутри блока."""
+        stack = ExitStack()
+        if self.block_cache is not None:
+            stack.enter_context(block_cache.use(self.block_cache))
+        if self.image_hosts is not None:
+            stack.enter_context(upload_img.use_selector(self.image_hosts))
+        return stack
+
+    def _require_telegram(self) -> TelegramPool:
+        if self.telegram is None:
+            raise PublishError("Не заданы токены Telegram (telegram_tokens)")
+        return self.telegram
+
+    def _require_telegraph(self) -> TelegraphPool:
+        if self.telegraph is None:
+            raise PublishError("Не заданы токены Telegraph (telegraph_tokens)")
+        return self.telegraph
+
+    async def render(self, md_path: str, target: str = "tg") -> Rendered:
+        """
+        Рендер без публикации (в потоке, чтобы не блокировать цикл событий).
+        Для tg — HTML (или TelegramText) для Telegram, для gr и tgh — узлы Telegraph.
+        """
+        _check_target(target)
+        key = self.config.imgbb_api_key
+        # asyncio.to_thread копирует контекст, вместе с ним — кеш и хостинги
+        with self._scope():
+            if target == "tg":
+                message = await asyncio.to_thread(
+                    render_telegram_message, md_path, key, self.config.telegram_format
+                )
+                if isinstance(message, TelegramText):
+                    return Rendered(md_path, telegram_text=message)
+                return Rendered(md_path, telegram_html=message)
+            nodes, title = await asyncio.to_thread(render_telegraph_nodes, md_path, key)
+        return Rendered(md_path, telegraph_nodes=nodes, title=title)
+
+    async def post(
+        self,
+        md_path: str,
+        target: str = "tg",
+        chats: Optional[Sequence[ChatId]] = None,
+        title: Optional[str] = None,
+    ) -> Publication:
+        """
+        Публикует Markdown: tg — пост в каналы, gr — страница Telegraph,
+        tgh — страница и ссылка на неё в каналы.
+        PublishError — если не опубликовано ни в одно место назначения.
+        """
+        _check_target(target)
+        pub = Publication(target, md_path)
+        rendered = await self.render(md_path, target)
+        text: Union[str, TelegramText] = _message_text(rendered)
+
+        if target in ("gr", "tgh"):
+            telegraph = self._require_telegraph()
+            page = await asyncio.to_thread(
+                telegraph.create_page_from_nodes,
+                title or rendered.title or "None",
+                rendered.telegraph_nodes or [],
+                self.config.author_name,
+                self.config.author_url,
+            )
+            if not page.get("url"):
+                raise PublishError(f"Ошибка создания страницы {md_path}: {page}")
+            pub.url, pub.page_path = page["url"], page.get("path")
+            text = page["url"]
+            if target == "gr":
+                return pub
+
+        telegram = self._require_telegram()
+        targets = list(self.config.channels if chats is None else chats)
+        if not targets:
+            raise PublishError("Не указан ни один канал")
+        results = await telegram.send_message_many(targets, text)
+        for chat_id, result in results.items():
+            if isinstance(result, Message):
+                pub.messages[str(chat_id)] = result.message_id
+            else:
+                pub.messages[str(chat_id)] = None
+                pub.errors[str(chat_id)] = str(result)
+        if not any(pub.messages.values()):
+            raise PublishError(f"Не удалось опубликовать {md_path}: {pub.errors}")
+
+        if target == "tg" and self.config.add_id:
+            await asyncio.gather(
+                *(
+                    telegram.edit_message(chat_id, message_id, text + f"\n{message_id}")
+                    for chat_id, message_id in pub.messages.items()
+                    if message_id is not None
+                )
+            )
+        return pub
+
+    async def edit(
+        self, publication: Publication, md_path: Optional[str] = None
+    ) -> Publication:
+        """
+        Обновляет публикацию содержимым md_path (по умолчанию — тем же файлом).
+        Страница правится через аккаунт, который её создал; сообщения tgh
+        содержат только ссылку и не меняются.
+        """
+        md_path = md_path or publication.md_path
+        pub = Publication(
+            publication.target,
+            md_path,
+            url=publication.url,
+            page_path=publication.page_path,
+            messages=dict(publication.messages),
+        )
+        if pub.page_path:
+            with self._scope():
+                page = await asyncio.to_thread(
+                    self._require_telegraph().edit_page,
+                    pub.page_path,
+                    None,
+                    md_path,
+                    self.config.author_name,
+                    self.config.author_url,
+                )
+            if not page.get("path"):
+                raise PublishError(f"Ошибка редактирования {pub.page_path}: {page}")
+
+        if pub.target == "tg" and pub.messages:
+            telegram = self._require_telegram()
+            text = _message_text(await self.render(md_path, "tg"))
+            ids = {c: m for c, m in pub.messages.items() if m is not None}
+            results = await asyncio.gather(
+                *(
+                    telegram.edit_message(
+                        chat_id,
+                        message_id,
+                        text + f"\n{message_id}" if self.config.add_id else text,
+                    )
+                    for chat_id, message_id in ids.items()
+                )
+            )
+            for chat_id, result in zip(ids, results):
+                if not isinstance(result, Message):
+                    pub.errors[chat_id] = str(result)
+            if len(pub.errors) == len(ids):
+                raise PublishError(
+                    f"Не удалось отредактировать {md_path}: {pub.errors}"
+                )
+        return pub
+
+    async def delete(self, publication: Publication) -> List[str]:
+        """
+        Удаляет сообщения публикации и затирает страницу (Telegraph не умеет
+        удалять страницы). Возвращает места, где удалить не удалось.
+        """
+        failed: List[str] = []
+        if publication.page_path:
+            try:
+                await asyncio.to_thread(
+                    self._require_telegraph().delete_page, publication.page_path
+                )
+            except Exception as e:
+                logger.warning("Ошибка удаления %s: %s", publication.page_path, e)
+                failed.append(publication.page_path)
+        ids = {c: m for c, m in publication.messages.items() if m is not None}
+        if ids:
+            telegram = self._require_telegram()
+            results = await asyncio.gather(
+                *(telegram.delete_message(c, m) for c, m in ids.items())
+            )
+            failed.extend(f"{c}:{ids[c]}" for c, ok in zip(ids, results) if not ok)
+        return failed
+
+
+def _message_text(rendered: Rendered) -> Union[str, TelegramText]:
+    if rendered.telegram_text is not None:
+        return rendered.telegram_text
+    return rendered.telegram_html or ""
+
+
+def _check_target(target: str) -> None:
+    if target not in TARGETS:
+        raise ValueError(f"Неизвестная цель {target}, доступно: {', '.join(TARGETS)}")
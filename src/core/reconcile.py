@@ -0,0 +1,488 @@
+import asyncio
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from bs4 import BeautifulSoup, Comment, Tag
+from bs4.element import NavigableString
+from telegram import Message
+
+from core.build import iter_telegram_parts, render_telegraph_nodes
+from core.credentials import TelegramPool, TelegraphPool
+from core.telegram import TelegramClient
+from core.telegraph import TelegraphClient
+from core.thread import ID_RESERVE, edit_thread
+from utils.manifest import update_manifest_thread
+from utils.md2telegraph import Node
+from utils.telegram_entities import MESSAGE_LIMIT, TelegramText
+from utils.telegraph2md import content_hash
+from utils.telegraph_payload import is_nav_node, nav_next_url
+from utils.upload_img import offline
+
+logger = logging.getLogger(__name__)
+
+IN_SYNC = "in_sync"
+DRIFTED = "drifted"
+MISSING = "missing"
+ERROR = "error"
+
+# Виды публикаций: страница Telegraph, пост из Markdown, сообщение со ссылкой (tgh)
+KINDS = ("gr", "tg", "link")
+
+# Страницы-продолжения одной публикации (защита от зацикленной навигации)
+MAX_PARTS = 50
+
+# Изображения сравниваются только по положению: при каждом рендере локальные
+# файлы загружаются заново и получают новый URL
+IMAGE_PLACEHOLDER = "[img]"
+_IMAGE_LINE_RE = re.compile(
+    r"^(?:https?://\S+\.(?:png|jpe?g|gif|webp|svg|bmp)|\[локальное изображение: [^\]]*\])$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# Теги Telegram HTML → каноническая разметка (синонимы сводятся к одному имени)
+_TG_MARKS = {
+    "b": "b",
+    "strong": "b",
+    "i": "i",
+    "em": "i",
+    "u": "u",
+    "ins": "u",
+    "s": "s",
+    "strike": "s",
+    "del": "s",
+    "code": "code",
+    "pre": "pre",
+    "blockquote": "blockquote",
+    "tg-spoiler": "spoiler",
+}
+
+
+@dataclass(frozen=True)
+class Target:
+    """Опубликованный экземпляр исходника: страница или сообщение в канале."""
+
+    kind: str
+    md_path: str
+    page_path: Optional[str] = None
+    chat_id: Optional[str] = None
+    message_id: Optional[int] = None
+    # Для kind="link" — ссылка на страницу, которую содержит сообщение
+    url: Optional[str] = None
+    # Для kind="tg" — все сообщения цепочки (длинный пост), первое — message_id
+    thread: Tuple[int, ...] = ()
+    # Манифест, из которого взята публикация: в него пишется изменённая цепочка
+    manifest: Optional[str] = field(default=None, compare=False)
+
+    @property
+    def message_ids(self) -> Tuple[int, ...]:
+        return self.thread or ((self.message_id,) if self.message_id else ())
+
+    @property
+    def key(self) -> str:
+        if self.kind == "gr":
+            return f"gr:{self.page_path}"
+        return f"{self.kind}:{self.chat_id}:{self.message_id}"
+
+
+@dataclass
+class ReconcileItem:
+    target: Target
+    status: str
+    local_hash: Optional[str] = None
+    live_hash: Optional[str] = None
+    error: Optional[str] = None
+    # Сообщение — подпись к изображению (правится через edit_photo)
+    caption: bool = False
+
+
+def _page_path(url: str) -> str:
+    return url.rstrip("/").rsplit("/", 1)[-1]
+
+
+def targets_from_record(md_path: str, record: Dict[str, Any]) -> List[Target]:
+    """
+    Публикации из манифеста (`--manifest`) или результата задачи планировщика:
+    {"url": ..., "messages": {chat_id: message_id}}. Для длинного поста
+    "threads": {chat_id: [message_id, ...]} содержит всю цепочку.
+    """
+    targets: List[Target] = []
+    threads = record.get("threads") or {}
+    url = record.get("url")
+    if url:
+        targets.append(Target("gr", md_path, page_path=_page_path(url)))
+    for chat_id, message_id in (record.get("messages") or {}).items():
+        if message_id is None:
+            continue
+        if url:
+            targets.append(
+                Target("link", md_path, chat_id=chat_id, message_id=message_id, url=url)
+            )
+        else:
+            thread = tuple(threads.get(chat_id) or ())
+            targets.append(
+                Target(
+                    "tg",
+                    md_path,
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    thread=thread if len(thread) > 1 else (),
+                )
+            )
+    return targets
+
+
+def load_manifest_targets(paths: Iterable[Path]) -> List[Target]:
+    """
+    Публикации из манифестов (файлы или каталоги с *.json), в том числе
+    пакетных — со списком publications. При повторе одной
+    и той же публикации побеждает манифест, указанный позже.
+    """
+    targets: Dict[str, Target] = {}
+    for path in paths:
+        files = sorted(path.rglob("*.json")) if path.is_dir() else [path]
+        for file in files:
+            try:
+                data = json.loads(file.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                logger.warning("Манифест %s пропущен: %s", file, e)
+                continue
+            # Пакетный манифест (`tgh batch`) содержит список публикаций
+            records = data.get("publications") if isinstance(data, dict) else None
+            if not isinstance(records, list):
+                records = [data]
+            for record in records:
+                if not isinstance(record, dict) or not record.get("md_path"):
+                    logger.debug("%s — не манифест публикации", file)
+                    continue
+                for target in targets_from_record(record["md_path"], record):
+                    targets[target.key] = replace(target, manifest=str(file))
+    return list(targets.values())
+
+
+def _canon_url(value: str) -> str:
+    return value.removeprefix("https://telegra.ph").removeprefix("http://telegra.ph")
+
+
+def _canon_telegraph(node: Node) -> Optional[Any]:
+    if isinstance(node, str):
+        text = re.sub(r"\s+", " ", node)
+        return text if text.strip() else None
+    tag = node.get("tag")
+    attrs = node.get("attrs") or {}
+    canon_attrs = (
+        {}
+        if tag == "img"
+        else {k: _canon_url(attrs[k]) for k in ("href", "src") if attrs.get(k)}
+    )
+    children = [
+        c for c in map(_canon_telegraph, node.get("children") or []) if c is not None
+    ]
+    return [tag, canon_attrs, children]
+
+
+def telegraph_digest(nodes: Sequence[Node]) -> str:
+    """
+    Хеш содержимого страницы после нормализации: без навигации между частями,
+    без различий в пробелах и без URL изображений.
+    """
+    canon = [_canon_telegraph(n) for n in nodes if not is_nav_node(n)]
+    return content_hash([c for c in canon if c is not None])
+
+
+def _telegram_runs(
+    node: Tag, marks: Tuple[str, ...], out: List[Tuple[str, Tuple[str, ...]]]
+) -> None:
+    for child in node.children:
+        if isinstance(child, Comment):
+            continue
+        if isinstance(child, NavigableString):
+            out.append((str(child), marks))
+            continue
+        if not isinstance(child, Tag):
+            continue
+        if child.name == "br":
+            out.append(("\n", marks))
+            continue
+        mark = _TG_MARKS.get(child.name)
+        if child.name == "a":
+            mark = "a:" + _canon_url(str(child.get("href") or ""))
+        elif child.name == "span" and "tg-spoiler" in (child.get("class") or []):
+            mark = "spoiler"
+        elif child.name == "code" and "pre" in marks:
+            mark = None  # <pre><code class="language-x"> ≡ <pre>
+        inner = tuple(sorted({*marks, mark})) if mark else marks
+        _telegram_runs(child, inner, out)
+
+
+def _rstrip_runs(runs: List[List[Any]]) -> None:
+    """Убирает пробелы в конце сообщения, даже если они в нескольких фрагментах."""
+    while runs:
+        runs[-1][0] = runs[-1][0].rstrip()
+        if runs[-1][0]:
+            return
+        runs.pop()
+
+
+def telegram_digest(html: str, message_id: Optional[int] = None) -> str:
+    """
+    Хеш сообщения Telegram после нормализации HTML: синонимы тегов, пробелы,
+    ссылки на изображения и добавленный в конец ID сообщения (ADD_ID) не учитываются.
+    """
+    html = _IMAGE_LINE_RE.sub(IMAGE_PLACEHOLDER, html)
+    runs: List[Tuple[str, Tuple[str, ...]]] = []
+    if "<" in html:
+        _telegram_runs(BeautifulSoup(html, "html.parser"), (), runs)
+    else:
+        # Сообщение без разметки (например, ссылка tgh)
+        runs.append((html, ()))
+
+    merged: List[List[Any]] = []
+    for text, marks in runs:
+        text = re.sub(r"[ \t]+", " ", text)
+        text = re.sub(r" *\n *", "\n", text)
+        if not text.strip():
+            marks = ()
+        if merged and merged[-1][1] == list(marks):
+            merged[-1][0] += text
+        elif text:
+            merged.append([text, list(marks)])
+    if merged:
+        merged[0][0] = merged[0][0].lstrip()
+    _rstrip_runs(merged)
+    if message_id is not None and merged:
+        suffix = f"\n{message_id}"
+        if merged[-1][0].endswith(suffix):
+            merged[-1][0] = merged[-1][0][: -len(suffix)]
+            _rstrip_runs(merged)
+    merged = [run for run in merged if run[0]]
+    payload = json.dumps(merged, ensure_ascii=False, separators=(",", ":"))
+    return content_hash([payload])
+
+
+def _fetch_page_nodes(
+    client: Union[TelegraphClient, TelegraphPool], path: str
+) -> Optional[List[Node]]:
+    """Содержимое страницы со всеми продолжениями; None — страницы нет."""
+    nodes: List[Node] = []
+    current: Optional[str] = path
+    for _ in range(MAX_PARTS):
+        if current is None:
+            break
+        data = client.get_page(current, return_content=True)
+        if not data.get("ok"):
+            if data.get("error") == "PAGE_NOT_FOUND" and current == path:
+                return None
+            raise RuntimeError(data.get("error") or data)
+        result = data["result"]
+        if current == path and result.get("title") == "Deleted":
+            return None
+        content = result.get("content") or []
+        nodes.extend(content)
+        next_url = nav_next_url(content)
+        current = _page_path(next_url) if next_url else None
+    return nodes
+
+
+def check_pages(
+    client: Union[TelegraphClient, TelegraphPool],
+    targets: Sequence[Target],
+    jobs: int = 8,
+) -> List[ReconcileItem]:
+    """
+    Сравнивает страницы Telegraph с локальным рендером исходников.
+    Страницы скачиваются параллельно; каждый исходник рендерится один раз
+    (без загрузки изображений).
+    """
+    local: Dict[str, str] = {}
+
+    def _local_hash(md_path: str) -> str:
+        if md_path not in local:
+            nodes, _ = render_telegraph_nodes(md_path, None, upload=False)
+            local[md_path] = telegraph_digest(nodes)
+        return local[md_path]
+
+    def _check(target: Target) -> ReconcileItem:
+        try:
+            if not Path(target.md_path).is_file():
+                raise FileNotFoundError(f"Нет исходника {target.md_path}")
+            live = _fetch_page_nodes(client, target.page_path or "")
+            local_hash = _local_hash(target.md_path)
+        except Exception as e:
+            return ReconcileItem(target, ERROR, error=str(e))
+        if live is None:
+            return ReconcileItem(target, MISSING, local_hash=local_hash)
+        live_hash = telegraph_digest(live)
+        status = IN_SYNC if live_hash == local_hash else DRIFTED
+        return ReconcileItem(target, status, local_hash, live_hash)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(_check, targets))
+
+
+def part_limit(add_id: bool = False) -> int:
+    """Лимит части цепочки: в первую при add_id дописывается её ID."""
+    return MESSAGE_LIMIT - ID_RESERVE if add_id else MESSAGE_LIMIT
+
+
+async def check_messages(
+    client: Union[TelegramClient, TelegramPool],
+    targets: Sequence[Target],
+    copy_chat_id: Union[int, str],
+    concurrency: int = 4,
+    telegram_format: str = "html",
+    add_id: bool = False,
+) -> List[ReconcileItem]:
+    """
+    Сравнивает сообщения в каналах с локальным рендером. Текущее содержимое
+    берётся из копии, пересланной в служебный чат copy_chat_id; локальный
+    рендер — без загрузки изображений.
+    Пост делится на части так же, как при публикации (add_id уменьшает
+    лимит части), и каждая часть сравнивается со своим сообщением цепочки.
+    telegram_format — формат, в котором сообщения публиковались.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    local: Dict[str, List[str]] = {}
+    limit = part_limit(add_id)
+
+    def _local_parts(target: Target) -> List[str]:
+        if target.kind == "link":
+            return [target.url or ""]
+        if target.md_path not in local:
+            with offline():
+                parts = list(
+                    iter_telegram_parts(target.md_path, None, telegram_format, limit)
+                )
+            local[target.md_path] = [
+                p.to_html() if isinstance(p, TelegramText) else p for p in parts
+            ]
+        return local[target.md_path]
+
+    async def _fetch(chat_id: str, message_id: int) -> Optional[Message]:
+        async with semaphore:
+            return await client.fetch_message(chat_id, message_id, copy_chat_id)
+
+    async def _check(target: Target) -> ReconcileItem:
+        ids = target.message_ids
+        try:
+            if target.kind == "tg" and not Path(target.md_path).is_file():
+                raise FileNotFoundError(f"Нет исходника {target.md_path}")
+            local_digests = [
+                telegram_digest(part, ids[0] if i == 0 else None)
+                for i, part in enumerate(_local_parts(target))
+            ]
+            live = await asyncio.gather(
+                *(_fetch(target.chat_id or "", message_id) for message_id in ids)
+            )
+        except Exception as e:
+            return ReconcileItem(target, ERROR, error=str(e))
+        local_hash = (
+            local_digests[0] if len(local_digests) == 1 else content_hash(local_digests)
+        )
+        if not live or live[0] is None:
+            return ReconcileItem(target, MISSING, local_hash=local_hash)
+        caption = (
+            len(live) == 1 and live[0].text is None and live[0].caption is not None
+        )
+        live_digests = [
+            telegram_digest(
+                (m.caption_html if caption else m.text_html) or "",
+                ids[0] if i == 0 else None,
+            )
+            if m is not None
+            else MISSING
+            for i, m in enumerate(live)
+        ]
+        live_hash = (
+            live_digests[0] if len(live_digests) == 1 else content_hash(live_digests)
+        )
+        status = IN_SYNC if live_digests == local_digests else DRIFTED
+        return ReconcileItem(target, status, local_hash, live_hash, caption=caption)
+
+    return list(await asyncio.gather(*(_check(t) for t in targets)))
+
+
+def _save_thread(target: Target, thread: List[int]) -> None:
+    """Цепочка выросла или сократилась: новые ID пишутся в манифест публикации."""
+    if target.manifest and update_manifest_thread(
+        target.manifest, target.md_path, target.chat_id or "", thread
+    ):
+        logger.info("Цепочка %s обновлена в %s", target.key, target.manifest)
+        return
+    logger.warning(
+        "Цепочка %s теперь %s: запишите ID в манифест",
+        target.key,
+        ",".join(map(str, thread)),
+    )
+
+
+async def push_drifted(
+    items: Iterable[ReconcileItem],
+    tg: Union[TelegramClient, TelegramPool],
+    gr: Union[TelegraphClient, TelegraphPool],
+    author_name: Optional[str] = None,
+    author_url: Optional[str] = None,
+    add_id: bool = False,
+    imgbb_api_key: Optional[str] = None,
+    telegram_format: str = "html",
+) -> Dict[str, bool]:
+    """
+    Перезаписывает только разошедшиеся публикации локальной версией.
+    Пост правится как цепочка (edit_thread): части редактируются по месту,
+    новые уходят ответами, лишние удаляются, а изменённая цепочка
+    сохраняется в манифест.
+    """
+    results: Dict[str, bool] = {}
+    for item in items:
+        if item.status != DRIFTED:
+            continue
+        target = item.target
+        try:
+            if target.kind == "gr":
+                page = await asyncio.to_thread(
+                    gr.edit_page,
+                    target.page_path or "",
+                    None,
+                    target.md_path,
+                    author_name,
+                    author_url,
+                )
+                ok = bool(page.get("path"))
+            elif item.caption:
+                res = await tg.edit_photo(
+                    chat_id=target.chat_id or "",
+                    message_id=target.message_id or 0,
+                    md_path=target.md_path,
+                )
+                ok = isinstance(res, Message)
+            elif target.kind == "tg":
+                ids = list(target.message_ids)
+                parts = iter_telegram_parts(
+                    target.md_path,
+                    imgbb_api_key,
+                    telegram_format,
+                    part_limit(add_id),
+                )
+                thread = await edit_thread(
+                    tg, target.chat_id or "", ids, parts, add_id=add_id
+                )
+                chat = str(target.chat_id)
+                if chat in thread.errors:
+                    logger.warning("Цепочка %s: %s", target.key, thread.errors[chat])
+                ok = chat not in thread.errors
+                if thread.messages[chat] != ids:
+                    _save_thread(target, thread.messages[chat])
+            else:
+                res = await tg.edit_message(
+                    target.chat_id or "", target.message_id or 0, target.url or ""
+                )
+                ok = isinstance(res, Message)
+        except Exception as e:
+            logger.warning("Не удалось обновить %s: %s", target.key, e)
+            ok = False
+        results[target.key] = ok
+    return results
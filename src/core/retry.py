@@ -0,0 +1,348 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+import requests
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegraph.exceptions import RetryAfterError
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+
+from core.metrics import Counter, record_retry_after
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRIES = Counter(
+    "mdp_retries_total",
+    "Количество повторных попыток запросов",
+    ("service",),
+)
+BREAKER_OPEN = Counter(
+    "mdp_circuit_open_total",
+    "Сколько раз размыкался circuit breaker",
+    ("service",),
+)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Параметры повторов: число попыток и экспоненциальная задержка с джиттером."""
+
+    max_attempts: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    jitter: float = 0.5
+
+    def backoff(self, attempt: int) -> float:
+        """Задержка перед попыткой attempt + 1 (attempt считается с 1)."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class CircuitOpenError(RuntimeError):
+    """Сервис недоступен: breaker разомкнут, запрос не отправлялся."""
+
+
+class CircuitBreaker:
+    """
+    Размыкается после failure_threshold подряд неудачных (retryable) запросов
+    и в течение reset_timeout сразу отклоняет вызовы. Затем пропускает
+    ровно один пробный запрос (half-open): успех замыкает цепь, неудача —
+    снова размыкает; остальные вызовы до ответа пробного отклоняются.
+    """
+
+    def __init__(
+        self, service: str, failure_threshold: int = 5, reset_timeout: float = 30.0
+    ) -> None:
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        # Пробный запрос half-open уже выполняется
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or self._remaining() > 0:
+                return "open"
+            return "half-open"
+
+    def _remaining(self) -> float:
+        return self.reset_timeout - (time.monotonic() - (self._opened_at or 0))
+
+    def allow(self) -> None:
+        """Пропускает вызов или бросает CircuitOpenError; в half-open — один пробный."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._remaining()
+            if remaining <= 0 and not self._probing:
+                self._probing = True
+                return
+        if remaining > 0:
+            raise CircuitOpenError(
+                f"{self.service}: сервис недоступен, повтор через {remaining:.0f} сек."
+            )
+        raise CircuitOpenError(f"{self.service}: выполняется пробный запрос")
+
+    def release(self) -> None:
+        """Пробный запрос завершился без вердикта (пауза по rate limit, отмена)."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._probing = False
+            self._failures += 1
+            if self._failures >= self.failure_threshold or self._opened_at is not None:
+                if self._opened_at is None:
+                    BREAKER_OPEN.inc(service=self.service)
+                    logger.error(
+                        "%s: %s ошибок подряд, запросы приостановлены на %.0f сек.",
+                        self.service,
+                        self._failures,
+                        self.reset_timeout,
+                    )
+                self._opened_at = time.monotonic()
+
+
+_default_policy = RetryPolicy()
+_breaker_settings: Tuple[int, float] = (5, 30.0)
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+# Сервис сам попросил паузу (RetryAfter / FLOOD_WAIT): service → monotonic-время конца
+_cooldowns: Dict[str, float] = {}
+
+
+def configure(
+    policy: Optional[RetryPolicy] = None,
+    failure_threshold: Optional[int] = None,
+    reset_timeout: Optional[float] = None,
+) -> None:
+    """Задаёт политику по умолчанию и параметры breaker'ов (из настроек CLI)."""
+    global _default_policy, _breaker_settings
+    if policy is not None:
+        _default_policy = policy
+    threshold, timeout = _breaker_settings
+    _breaker_settings = (
+        failure_threshold if failure_threshold is not None else threshold,
+        reset_timeout if reset_timeout is not None else timeout,
+    )
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def default_policy() -> RetryPolicy:
+    return _default_policy
+
+
+def get_breaker(service: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(service)
+        if breaker is None:
+            threshold, timeout = _breaker_settings
+            breaker = _breakers[service] = CircuitBreaker(service, threshold, timeout)
+        return breaker
+
+
+def cooldown_remaining(service: str) -> float:
+    """Сколько секунд сервис ещё просит не присылать запросы (0 — можно)."""
+    until = _cooldowns.get(service)
+    return max(0.0, until - time.monotonic()) if until else 0.0
+
+
+def is_available(service: str) -> bool:
+    """Сервис не в паузе по rate limit и его breaker не разомкнут."""
+    return cooldown_remaining(service) == 0 and get_breaker(service).state != "open"
+
+
+def _seconds(value: Any) -> float:
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+def not_sent(exc: BaseException) -> bool:
+    """
+    Запрос точно не обработан сервером: соединение не установлено, нет
+    свободного соединения в пуле или сервер отклонил его по rate limit.
+    Такой запрос можно повторить, даже если метод не идемпотентен.
+    """
+    if isinstance(exc, (RetryAfter, RetryAfterError)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code == 429
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.ConnectionError):
+        reason = exc.args[0] if exc.args else None
+        if isinstance(reason, MaxRetryError):
+            reason = reason.reason
+        # NewConnectionError — подкласс ConnectTimeoutError
+        return isinstance(reason, ConnectTimeoutError)
+    if isinstance(exc, NetworkError):
+        # HTTPXRequest из python-telegram-bot оборачивает ошибку httpx
+        return isinstance(
+            exc.__cause__, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+        )
+    return False
+
+
+def is_idempotent(method: str) -> bool:
+    """
+    Повтор метода не создаёт дубликатов: edit/delete/get — да,
+    send_message, send_photo, createPage и подобные — нет.
+    """
+    name = method.replace("_", "").lower()
+    return not name.startswith(("send", "copy", "forward", "create"))
+
+
+def classify(exc: BaseException) -> Tuple[bool, Optional[float]]:
+    """
+    Решает, стоит ли повторять запрос, если метод идемпотентен.
+    Возвращает (retryable, retry_after) — retry_after задан, если сервер сам указал паузу.
+    Для неидемпотентных методов см. not_sent.
+    """
+    if isinstance(exc, RetryAfter):
+        return True, _seconds(exc.retry_after)
+    if isinstance(exc, RetryAfterError):
+        return True, _seconds(exc.retry_after)
+    if isinstance(exc, BadRequest):
+        return False, None
+    if isinstance(exc, NetworkError):  # включая TimedOut
+        return True, None
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True, None
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        if status == 429:
+            header = exc.response.headers.get("Retry-After")
+            return True, float(header) if header and header.isdigit() else None
+        return status >= 500, None
+    return False, None
+
+
+def _on_error(
+    service: str,
+    exc: BaseException,
+    attempt: int,
+    policy: RetryPolicy,
+    idempotent: bool = True,
+) -> Optional[float]:
+    """Общая логика после ошибки: возвращает задержку или None, если повторять не нужно."""
+    breaker = get_breaker(service)
+    retryable, retry_after = classify(exc)
+    if retry_after is not None:
+        _cooldowns[service] = time.monotonic() + retry_after
+    if not retryable:
+        # Сервис ответил осмысленной ошибкой — он жив
+        breaker.record_success()
+        return None
+    if retry_after is None:
+        breaker.record_failure()
+    else:
+        breaker.release()
+    if not idempotent and not not_sent(exc):
+        # Таймаут или обрыв после отправки: запрос мог быть выполнен,
+        # повтор неидемпотентного метода создал бы дубликат
+        logger.warning(
+            "%s: %s, запрос мог дойти до сервера — не повторяем",
+            service,
+            exc.__class__.__name__,
+        )
+        return None
+    if attempt >= policy.max_attempts or breaker.state == "open":
+        return None
+    if retry_after is not None:
+        record_retry_after(service, retry_after)
+        delay = retry_after
+    else:
+        delay = policy.backoff(attempt)
+    RETRIES.inc(service=service)
+    logger.warning(
+        "%s: %s, попытка %s/%s через %.2f сек.",
+        service,
+        exc.__class__.__name__,
+        attempt + 1,
+        policy.max_attempts,
+        delay,
+    )
+    return delay
+
+
+async def call_async(
+    service: str,
+    func: Callable[[], Awaitable[T]],
+    policy: Optional[RetryPolicy] = None,
+    idempotent: bool = True,
+) -> T:
+    """
+    Выполняет асинхронный вызов с повторами и circuit breaker'ом сервиса.
+    Неидемпотентный вызов (idempotent=False) повторяется, только если
+    запрос точно не дошёл до сервера.
+    """
+    policy = policy or _default_policy
+    breaker = get_breaker(service)
+    attempt = 0
+    while True:
+        breaker.allow()
+        attempt += 1
+        try:
+            result = await func()
+        except Exception as e:
+            delay = _on_error(service, e, attempt, policy, idempotent)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return result
+
+
+def call_sync(
+    service: str,
+    func: Callable[[], T],
+    policy: Optional[RetryPolicy] = None,
+    idempotent: bool = True,
+) -> T:
+    """Синхронный вариант call_async (для requests)."""
+    policy = policy or _default_policy
+    breaker = get_breaker(service)
+    attempt = 0
+    while True:
+        breaker.allow()
+        attempt += 1
+        try:
+            result = func()
+        except Exception as e:
+            delay = _on_error(service, e, attempt, policy, idempotent)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return result
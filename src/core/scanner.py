@@ -0,0 +1,247 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from utils.converting_md2html import iter_include_refs
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+MD_SUFFIXES = {".md"}
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".bmp"}
+
+# ![alt](path "title"), ![alt](<path>) и <img src="path">
+IMAGE_REF_RE = re.compile(
+    r"!\[[^\]]*\]\(\s*<?([^)\s>]+)>?|<img\s[^>]*src=[\"']([^\"']+)[\"']",
+    re.IGNORECASE,
+)
+
+# Файл, изменённый в пределах этого окна до сканирования, может измениться
+# ещё раз с тем же mtime — такой stat не кешируем и перехешируем в следующий раз
+_RACY_WINDOW_NS = 2_000_000_000
+
+
+def iter_image_refs(text: str) -> Iterator[str]:
+    """Ссылки на изображения в Markdown-тексте (в порядке появления, без повторов)."""
+    seen: Set[str] = set()
+    for match in IMAGE_REF_RE.finditer(text):
+        src = match.group(1) or match.group(2)
+        if src not in seen:
+            seen.add(src)
+            yield src
+
+
+@dataclass
+class FileState:
+    size: int
+    mtime_ns: int
+    inode: int
+    digest: str
+    # локальные изображения и включаемые файлы `{!path!}`, на которые
+    # ссылается Markdown-файл (абсолютные пути)
+    refs: List[str] = field(default_factory=list)
+
+    def same_stat(self, st: os.stat_result) -> bool:
+        return (
+            self.size == st.st_size
+            and self.mtime_ns == st.st_mtime_ns
+            and self.inode == st.st_ino
+        )
+
+
+@dataclass
+class ScanResult:
+    files: Dict[str, FileState]
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    # Markdown-файлы, которые нужно пересобрать: изменены сами или изменились
+    # изображения и включаемые файлы, от которых они зависят (транзитивно)
+    dirty: List[str] = field(default_factory=list)
+    hashed: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.modified or self.removed)
+
+
+def _walk(root: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """Обход дерева через os.scandir (скрытые каталоги и файлы пропускаются)."""
+    stack = [root]
+    suffixes = MD_SUFFIXES | IMAGE_SUFFIXES
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            logger.warning("Каталог недоступен %s: %s", directory, e)
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in suffixes:
+                    try:
+                        yield entry.path, entry.stat()
+                    except OSError:
+                        continue
+
+
+def _hash_file(path: str) -> Tuple[str, List[str]]:
+    """
+    sha256 файла; для Markdown заодно извлекает ссылки на локальные
+    изображения и включаемые файлы.
+    """
+    data = Path(path).read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    if not _is_md(path):
+        return digest, []
+    base = os.path.dirname(path)
+    text = data.decode("utf-8", errors="replace")
+    refs = [
+        os.path.normpath(os.path.join(base, src))
+        for src in iter_image_refs(text)
+        if "://" not in src and not src.startswith("data:")
+    ]
+    refs += [
+        os.path.normpath(os.path.join(base, os.path.expanduser(spec)))
+        for spec in iter_include_refs(text)
+    ]
+    return digest, refs
+
+
+def load_index(index_path: Path) -> Dict[str, FileState]:
+    try:
+        raw = json.loads(index_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if raw.get("version") != INDEX_VERSION:
+        return {}
+    return {path: FileState(*values) for path, values in raw["files"].items()}
+
+
+def save_index(index_path: Path, files: Dict[str, FileState]) -> None:
+    data = {
+        "version": INDEX_VERSION,
+        "files": {
+            path: [s.size, s.mtime_ns, s.inode, s.digest, s.refs]
+            for path, s in files.items()
+        },
+    }
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = index_path.with_name(index_path.name + ".tmp")
+    tmp.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+    tmp.replace(index_path)
+
+
+def scan(
+    root: Path,
+    index_path: Optional[Path] = None,
+    jobs: int = 8,
+    save: bool = True,
+) -> ScanResult:
+    """
+    Находит изменения в дереве Markdown-файлов и изображений по индексу
+    (путь, размер, mtime_ns, inode, хеш). Перехешируются только файлы с
+    изменившимся stat, хеширование идёт в пуле потоков.
+    """
+    root_str = os.path.abspath(root)
+    index_path = index_path or Path(root_str) / ".mdp-scan.json"
+    old = load_index(index_path)
+    now_ns = time.time_ns()
+
+    stats: Dict[str, os.stat_result] = dict(_walk(root_str))
+    # Изображения и включения вне дерева (../shared/img.png) тоже отслеживаем по stat
+    for state in old.values():
+        for ref in state.refs:
+            if ref not in stats:
+                try:
+                    stats[ref] = os.stat(ref)
+                except OSError:
+                    pass
+
+    files: Dict[str, FileState] = {}
+    to_hash: List[str] = []
+    for path, st in stats.items():
+        known = old.get(path)
+        if known is not None and known.same_stat(st):
+            files[path] = known
+        else:
+            to_hash.append(path)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        hashed = list(pool.map(_hash_file, to_hash))
+
+    result = ScanResult(files=files, hashed=len(to_hash))
+    for path, (digest, refs) in zip(to_hash, hashed):
+        st = stats[path]
+        racy = now_ns - st.st_mtime_ns < _RACY_WINDOW_NS
+        files[path] = FileState(
+            size=st.st_size,
+            mtime_ns=-1 if racy else st.st_mtime_ns,
+            inode=st.st_ino,
+            digest=digest,
+            refs=refs,
+        )
+        known = old.get(path)
+        if known is None:
+            result.added.append(path)
+        elif known.digest != digest:
+            result.modified.append(path)
+
+    # Новые ссылки на файлы вне дерева: учитываем их с первого сканирования,
+    # включения вне дерева — вместе с их собственными ссылками
+    pending = list(result.added) + list(result.modified)
+    while pending:
+        for ref in files[pending.pop()].refs:
+            if ref not in files and os.path.isfile(ref):
+                digest, refs = _hash_file(ref)
+                st = os.stat(ref)
+                files[ref] = FileState(
+                    st.st_size, st.st_mtime_ns, st.st_ino, digest, refs
+                )
+                pending.append(ref)
+
+    result.removed = sorted(set(old) - set(files))
+    changed = set(result.added) | set(result.modified) | set(result.removed)
+    result.added.sort()
+    result.modified.sort()
+    result.dirty = sorted(
+        p for p in dependents(files, changed) if _is_md(p) and p in files
+    )
+
+    if save and (result.changed or result.hashed):
+        save_index(index_path, files)
+    return result
+
+
+def dependents(files: Dict[str, FileState], changed: Set[str]) -> Set[str]:
+    """
+    Файлы из changed и все, кто зависит от них через ссылки: пост, включающий
+    сниппет, который включает изменённый сниппет, тоже попадает в результат.
+    """
+    users: Dict[str, List[str]] = {}
+    for path, state in files.items():
+        for ref in state.refs:
+            users.setdefault(ref, []).append(path)
+    found = set(changed)
+    queue = list(changed)
+    while queue:
+        for user in users.get(queue.pop(), ()):
+            if user not in found:
+                found.add(user)
+                queue.append(user)
+    return found
+
+
+def _is_md(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in MD_SUFFIXES
@@ -0,0 +1,398 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import socket
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from telegram import Message
+
+from core.build import render_telegram_message, render_telegraph_nodes
+from core.credentials import TelegramPool, TelegraphPool
+from core.telegram import TelegramClient
+from core.telegraph import TelegraphClient
+from utils.telegram_entities import TelegramText
+
+logger = logging.getLogger(__name__)
+
+TARGETS = ("tg", "gr", "tgh")
+# Сколько секунд задача принадлежит взявшему её планировщику без продления
+LEASE_SECONDS = 300.0
+
+# Индекс (status, due_at) делает выборку ближайшей задачи и вставку O(log n)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    due_at REAL NOT NULL,
+    target TEXT NOT NULL,
+    md_path TEXT NOT NULL,
+    channels TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    result TEXT,
+    created_at REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_due ON jobs(status, due_at);
+"""
+
+_RELATIVE_RE = re.compile(r"^\+(\d+(?:\.\d+)?)([smhd])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@dataclass
+class ScheduledJob:
+    id: int
+    due_at: float
+    target: str
+    md_path: str
+    channels: List[str]
+    payload: Dict[str, Any]
+    status: str
+    result: Optional[Dict[str, Any]]
+
+
+def parse_when(value: str) -> float:
+    """
+    Разбирает время публикации: `+30m`, `+2h`, `+1d` или ISO-дата
+    (`2026-10-20T10:00`, без часового пояса — локальное время).
+    Возвращает unix-время.
+    """
+    value = value.strip()
+    m = _RELATIVE_RE.match(value)
+    if m:
+        return time.time() + float(m.group(1)) * _UNITS[m.group(2)]
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Не удалось разобрать время: {value!r}")
+
+
+class ScheduleStore:
+    """Персистентная очередь с приоритетом по времени публикации (SQLite)."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """Добавляет колонки аренды в очередь, созданную старой версией."""
+        columns = {r["name"] for r in self.conn.execute("PRAGMA table_info(jobs)")}
+        with self.conn:
+            for name, decl in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if name not in columns:
+                    self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> ScheduledJob:
+        return ScheduledJob(
+            id=row["id"],
+            due_at=row["due_at"],
+            target=row["target"],
+            md_path=row["md_path"],
+            channels=json.loads(row["channels"]),
+            payload=json.loads(row["payload"]),
+            status=row["status"],
+            result=json.loads(row["result"]) if row["result"] else None,
+        )
+
+    def add(
+        self,
+        due_at: float,
+        target: str,
+        md_path: str,
+        channels: List[str],
+        payload: Dict[str, Any],
+    ) -> int:
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO jobs (due_at, target, md_path, channels, payload, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    due_at,
+                    target,
+                    md_path,
+                    json.dumps(channels),
+                    json.dumps(payload, ensure_ascii=False),
+                    time.time(),
+                ),
+            )
+        return int(cur.lastrowid or 0)
+
+    def next_due(self) -> Optional[ScheduledJob]:
+        row = self.conn.execute(
+            "SELECT * FROM jobs WHERE status = 'pending' ORDER BY due_at LIMIT 1"
+        ).fetchone()
+        return self._job(row) if row else None
+
+    def pop_due(
+        self, now: float, owner: str, lease: float = LEASE_SECONDS, limit: int = 50
+    ) -> List[ScheduledJob]:
+        """
+        Забирает наступившие задачи: помечает их как выполняющиеся и отдаёт
+        в аренду owner до now + lease. Выборка и захват — один UPDATE,
+        поэтому два планировщика не возьмут одну задачу.
+        """
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?"
+                " WHERE id IN (SELECT id FROM jobs WHERE status = 'pending'"
+                " AND due_at <= ? ORDER BY due_at LIMIT ?)",
+                (owner, now + lease, now, limit),
+            )
+        # Задачи прошлых выборок владелец уже завершил: цикл последовательный
+        rows = self.conn.execute(
+            "SELECT * FROM jobs WHERE status = 'running' AND owner = ? ORDER BY due_at",
+            (owner,),
+        ).fetchall()
+        return [self._job(r) for r in rows]
+
+    def heartbeat(self, owner: str, lease_until: float) -> int:
+        """Продлевает аренду выполняющихся задач owner."""
+        with self.conn:
+            cur = self.conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                (lease_until, owner),
+            )
+        return cur.rowcount
+
+    def finish(
+        self,
+        job_id: int,
+        status: str,
+        result: Dict[str, Any],
+        owner: Optional[str] = None,
+    ) -> bool:
+        """
+        Записывает итог задачи. С owner — только если аренда ещё его:
+        задачу с истёкшей арендой мог забрать другой планировщик.
+        """
+        query = (
+            "UPDATE jobs SET status = ?, result = ?, lease_until = NULL WHERE id = ?"
+        )
+        params: List[Any] = [status, json.dumps(result, ensure_ascii=False), job_id]
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        with self.conn:
+            cur = self.conn.execute(query, params)
+        return cur.rowcount > 0
+
+    def reset_expired(self, now: float) -> int:
+        """
+        Возвращает в очередь задачи, аренду которых не продлили: их планировщик
+        завершился аварийно. Задачи живых планировщиков не трогает.
+        """
+        with self.conn:
+            cur = self.conn.execute(
+                "UPDATE jobs SET status = 'pending', owner = NULL, lease_until = NULL"
+                " WHERE status = 'running'"
+                " AND (lease_until IS NULL OR lease_until < ?)",
+                (now,),
+            )
+        return cur.rowcount
+
+    def retry(self, job_id: int, due_at: float) -> bool:
+        """
+        Возвращает в очередь задачу со статусом failed или partial.
+        Каналы, куда пост уже ушёл, при повторе пропускаются.
+        """
+        with self.conn:
+            cur = self.conn.execute(
+                "UPDATE jobs SET status = 'pending', due_at = ?, owner = NULL"
+                " WHERE id = ? AND status IN ('failed', 'partial')",
+                (due_at, job_id),
+            )
+        return cur.rowcount > 0
+
+    def list(self, status: Optional[str] = None) -> List[ScheduledJob]:
+        if status:
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY due_at", (status,)
+            )
+        else:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY due_at")
+        return [self._job(r) for r in rows]
+
+    def remove(self, job_id: int) -> bool:
+        with self.conn:
+            cur = self.conn.execute(
+                "DELETE FROM jobs WHERE id = ? AND status = 'pending'", (job_id,)
+            )
+        return cur.rowcount > 0
+
+
+def prerender(
+    target: str,
+    md_path: str,
+    imgbb_api_key: Optional[str],
+    telegram_format: str = "html",
+) -> Dict[str, Any]:
+    """
+    Рендерит Markdown и загружает изображения заранее, при постановке в очередь.
+    В момент публикации остаётся только вызов API.
+    В формате entities сохраняются текст и список MessageEntity.
+    """
+    if target == "tg":
+        message = render_telegram_message(md_path, imgbb_api_key, telegram_format)
+        if isinstance(message, TelegramText):
+            return message.to_payload()
+        return {"text": message}
+    nodes, title = render_telegraph_nodes(md_path, imgbb_api_key)
+    return {"title": title, "nodes": nodes}
+
+
+def new_owner() -> str:
+    """Уникальное имя планировщика: хост, PID и случайный суффикс."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def job_status(result: Dict[str, Any]) -> str:
+    """done — опубликовано везде, partial — часть каналов с ошибкой, иначе failed."""
+    if not result.get("errors"):
+        return "done"
+    return "partial" if any((result.get("messages") or {}).values()) else "failed"
+
+
+async def publish_job(
+    job: ScheduledJob,
+    tg: Union[TelegramClient, TelegramPool],
+    gr: Union[TelegraphClient, TelegraphPool],
+    author_name: Optional[str] = None,
+    author_url: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Публикует заранее отрендеренную задачу через переданные клиенты.
+    При повторе (job.result от прошлой попытки) страница не создаётся заново,
+    а сообщения уходят только в каналы, где публикации ещё нет.
+    Ошибки по каналам возвращаются в result["errors"].
+    """
+    previous = job.result or {}
+    result: Dict[str, Any] = {}
+    text: Union[str, TelegramText, None] = job.payload.get("text")
+    if "entities" in job.payload:
+        text = TelegramText.from_payload(job.payload)
+
+    if job.target in ("gr", "tgh"):
+        if previous.get("url"):
+            result["url"] = previous["url"]
+        else:
+            title = job.payload.get("title") or "None"
+            page = await asyncio.to_thread(
+                gr.create_page_from_nodes,
+                title,
+                job.payload["nodes"],
+                author_name,
+                author_url,
+            )
+            if not page.get("url"):
+                raise RuntimeError(f"Ошибка создания страницы: {page}")
+            result["url"] = page["url"]
+        text = result["url"]
+
+    if job.target in ("tg", "tgh"):
+        messages: Dict[str, Optional[int]] = {
+            str(chat_id): (previous.get("messages") or {}).get(str(chat_id))
+            for chat_id in job.channels
+        }
+        pending = [c for c in job.channels if messages[str(c)] is None]
+        sent = await tg.send_message_many(pending, text or "") if pending else {}
+        errors: Dict[str, str] = {}
+        for chat_id, res in sent.items():
+            if isinstance(res, Message):
+                messages[str(chat_id)] = res.message_id
+            else:
+                errors[str(chat_id)] = str(res) if res else "нет ответа"
+        result["messages"] = messages
+        if errors:
+            result["errors"] = errors
+
+    return result
+
+
+async def _keep_lease(store: ScheduleStore, owner: str, lease: float) -> None:
+    while True:
+        await asyncio.sleep(lease / 3)
+        store.heartbeat(owner, time.time() + lease)
+
+
+async def run_scheduler(
+    store: ScheduleStore,
+    tg: Union[TelegramClient, TelegramPool],
+    gr: Union[TelegraphClient, TelegraphPool],
+    poll_interval: float = 30.0,
+    once: bool = False,
+    author_name: Optional[str] = None,
+    author_url: Optional[str] = None,
+    owner: Optional[str] = None,
+    lease: float = LEASE_SECONDS,
+) -> None:
+    """
+    Основной цикл планировщика: спит до ближайшей задачи (но не дольше
+    poll_interval, чтобы увидеть задачи, добавленные другим процессом),
+    затем публикует все наступившие задачи через «тёплые» клиенты.
+    Взятые задачи арендуются на lease секунд и продлеваются, пока идёт
+    публикация; в очередь возвращаются только задачи с истёкшей арендой,
+    так что несколько планировщиков (и запуски --once) не дублируют посты.
+    """
+    owner = owner or new_owner()
+
+    while True:
+        restored = store.reset_expired(time.time())
+        if restored:
+            logger.warning("Возвращено в очередь прерванных задач: %s", restored)
+
+        heartbeat = asyncio.create_task(_keep_lease(store, owner, lease))
+        try:
+            for job in store.pop_due(time.time(), owner, lease):
+                try:
+                    result = await publish_job(job, tg, gr, author_name, author_url)
+                except Exception as e:
+                    result = {**(job.result or {}), "error": str(e)}
+                    status = "failed"
+                else:
+                    status = job_status(result)
+                if not store.finish(job.id, status, result, owner):
+                    logger.warning(
+                        "Задача %s (%s): аренда истекла, итог не записан",
+                        job.id,
+                        job.md_path,
+                    )
+                elif status == "done":
+                    logger.info(
+                        "Задача %s (%s) опубликована: %s", job.id, job.md_path, result
+                    )
+                else:
+                    logger.error(
+                        "Задача %s (%s) не выполнена (%s): %s",
+                        job.id,
+                        job.md_path,
+                        status,
+                        result.get("error") or result.get("errors"),
+                    )
+        finally:
+            heartbeat.cancel()
+
+        if once:
+            return
+
+        nxt = store.next_due()
+        delay = poll_interval
+        if nxt is not None:
+            delay = min(poll_interval, max(0.0, nxt.due_at - time.time()))
+        await asyncio.sleep(delay)
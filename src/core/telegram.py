@@ -1,27 +1,181 @@
 import asyncio
+import importlib.util
 import logging
-from datetime import timedelta
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Union
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
 
-from telegram import Bot, InputFile, LinkPreviewOptions, Message
-from telegram.error import RetryAfter, TelegramError
+from telegram import Bot, InputFile, LinkPreviewOptions, Message, ReplyParameters
+from telegram.error import BadRequest, TelegramError
+from telegram.request import HTTPXRequest
 
-from utils.converting_md2html import md_to_html
-from utils.html_for_telegram import sanitize_html_for_telegram
+from core import preflight
+from core.build import render_telegram_html
+from core.file_id_cache import FileIdCache, file_digest
+from core.metrics import record_upload, track_request
+from core.preflight import PreflightError
+from core.rate_limit import RateLimiter
+from core.retry import CircuitOpenError, RetryPolicy, call_async, is_idempotent
+from utils.message_ids import chunked
+from utils.telegram_entities import TelegramText
 
 logger = logging.getLogger(__name__)
 
+# Лимит Bot API на количество ID в одном deleteMessages
+DELETE_BATCH_SIZE = 100
+
+
+@dataclass(frozen=True)
+class TransportConfig:
+    """Параметры HTTP-транспорта Bot API (пул соединений, HTTP/2, таймауты)."""
+
+    pool_size: int = 16
+    http2: bool = False
+    connect_timeout: float = 20.0
+    read_timeout: float = 30.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0
+    # Отдельный пул для загрузки файлов: медленные аплоады не занимают
+    # соединения текстовых запросов
+    media_pool_size: int = 4
+    media_write_timeout: float = 120.0
+
+    def build_request(self, media: bool = False) -> HTTPXRequest:
+        http_version = "2" if self.http2 and _http2_available() else "1.1"
+        write_timeout = self.media_write_timeout if media else self.write_timeout
+        return HTTPXRequest(
+            connection_pool_size=self.media_pool_size if media else self.pool_size,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            write_timeout=write_timeout,
+            media_write_timeout=self.media_write_timeout,
+            pool_timeout=self.pool_timeout,
+            http_version=http_version,
+        )
+
+
+def _text_kwargs(
+    text: Union[str, TelegramText], parse_mode: Optional[str]
+) -> Dict[str, Any]:
+    """Аргументы текста для Bot API: HTML с parse_mode или текст с entities."""
+    if not isinstance(text, TelegramText):
+        return {"text": text, "parse_mode": parse_mode}
+    return {"text": text.text, "entities": list(text.entities), "parse_mode": None}
+
+
+def _preflight(
+    text: Union[str, TelegramText], parse_mode: Optional[str], caption: bool = False
+) -> Optional[PreflightError]:
+    """
+    Локальная проверка текста перед вызовом API: ошибка возвращается,
+    и запрос, который Telegram всё равно отклонит, не отправляется.
+    """
+    if not preflight.is_enabled():
+        return None
+    if not isinstance(text, TelegramText) and parse_mode != "HTML":
+        return None
+    problems = preflight.check_telegram_message(text, caption=caption)
+    if not problems:
+        return None
+    logger.error("Проверка перед отправкой не пройдена: %s", problems[0])
+    return PreflightError(problems)
+
+
+@lru_cache(maxsize=None)
+def _http2_available() -> bool:
+    if importlib.util.find_spec("h2") is None:
+        logger.warning(
+            "HTTP/2 недоступен (pip install 'python-telegram-bot[http2]'), "
+            "используется HTTP/1.1"
+        )
+        return False
+    return True
+
 
 class TelegramClient:
-    def __init__(self, token: str) -> None:
-        """Создает клиента Telegram API."""
-        self.bot = Bot(token=token)
+    def __init__(
+        self,
+        token: str,
+        per_chat_interval: float = 1.0,
+        retry_policy: Optional[RetryPolicy] = None,
+        transport: Optional[TransportConfig] = None,
+        file_id_cache: Optional[FileIdCache] = None,
+        service: str = "telegram",
+        imgbb_api_key: Optional[str] = None,
+    ) -> None:
+        """
+        Создает клиента Telegram API.
+        Соединения открываются в async with client: и переиспользуются всеми вызовами.
+        file_id_cache позволяет повторно отправлять те же изображения без загрузки.
+        imgbb_api_key нужен для локальных изображений в подписях из Markdown.
+        """
+        self.transport = transport or TransportConfig()
+        self.bot = Bot(token=token, request=self.transport.build_request())
+        # Отдельный Bot с собственным пулом только для загрузки медиа
+        self.media_bot = Bot(
+            token=token, request=self.transport.build_request(media=True)
+        )
+        # file_id действителен только для бота, который его получил
+        self.bot_id = token.split(":", 1)[0]
+        self.credential_id = self.bot_id
+        # Имя для повторов и circuit breaker (у каждого бота пула своё)
+        self.service = service
+        self.file_id_cache = file_id_cache
+        self.imgbb_api_key = imgbb_api_key
+        self.retry_policy = retry_policy
+        self.per_chat_interval = per_chat_interval
+        self._chat_limiters: Dict[Union[int, str], RateLimiter] = {}
+
+    async def __aenter__(self) -> "TelegramClient":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        """Открывает пулы соединений и проверяет токен (getMe)."""
+        await self.media_bot.request.initialize()
+        try:
+            await self._api("initialize")
+        except (TelegramError, CircuitOpenError) as e:
+            # Пул уже открыт; ошибки токена проявятся в самих запросах
+            logger.error("Ошибка инициализации бота: %s", e)
+
+    async def close(self) -> None:
+        """Закрывает соединения обоих пулов."""
+        await asyncio.gather(self.bot.shutdown(), self.media_bot.request.shutdown())
+        if self.file_id_cache is not None:
+            self.file_id_cache.close()
+
+    def chat_limiter(self, chat_id: Union[int, str]) -> RateLimiter:
+        """Ограничитель частоты сообщений для конкретного чата."""
+        limiter = self._chat_limiters.get(chat_id)
+        if limiter is None:
+            rate = 1 / self.per_chat_interval if self.per_chat_interval > 0 else 0
+            limiter = self._chat_limiters[chat_id] = RateLimiter(rate=rate)
+        return limiter
+
+    async def _api(self, method: str, *, media: bool = False, **kwargs: Any):
+        """
+        Вызов метода Bot API: метрики, повторы по политике и circuit breaker.
+        media=True отправляет запрос через пул для загрузки файлов.
+        """
+        bot = self.media_bot if media else self.bot
+
+        async def _call():
+            with track_request("telegram", method):
+                return await getattr(bot, method)(**kwargs)
+
+        return await call_async(
+            self.service, _call, self.retry_policy, idempotent=is_idempotent(method)
+        )
 
     async def send_message(
         self,
         chat_id: Union[int, str],
-        text: str,
+        text: Union[str, TelegramText],
         parse_mode: Optional[str] = "HTML",
         disable_web_page_preview: bool = False,
         link_preview_options=LinkPreviewOptions(
@@ -29,62 +183,76 @@ class TelegramClient:
             prefer_large_media=False,  # маленькое превью
             show_above_text=False,  # превью под текстом
         ),
-    ) -> Optional[Message | TelegramError]:
-        """Отправка текстового сообщения."""
+        reply_to: Optional[int] = None,
+    ) -> Optional[Message | TelegramError | CircuitOpenError | PreflightError]:
+        """
+        Отправка текстового сообщения. TelegramText отправляется сущностями
+        (entities) без parse_mode. Текст, не прошедший проверку, не отправляется.
+        reply_to — ID сообщения, ответом на которое отправляется это.
+        """
+        error = _preflight(text, parse_mode)
+        if error is not None:
+            return error
         try:
-            return await self.bot.send_message(
+            return await self._api(
+                "send_message",
                 chat_id=chat_id,
-                text=text,
-                parse_mode=parse_mode,
+                **_text_kwargs(text, parse_mode),
                 disable_web_page_preview=disable_web_page_preview,
                 link_preview_options=link_preview_options,
-                connect_timeout=20.0,
+                reply_parameters=(
+                    ReplyParameters(message_id=reply_to) if reply_to else None
+                ),
             )
-        except RetryAfter as e:
-            if isinstance(e.retry_after, timedelta):
-                delay: float = e.retry_after.total_seconds()
-            else:
-                delay = float(e.retry_after)
-            logger.warning(f"Rate limit, жду {delay:.2f} сек...")
-            await asyncio.sleep(delay)
-            return await self.bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                parse_mode=parse_mode,
-                disable_web_page_preview=disable_web_page_preview,
-            )
-        except TelegramError as e:
+        except (TelegramError, CircuitOpenError) as e:
             return e
 
+    async def send_message_many(
+        self,
+        chat_ids: Sequence[Union[int, str]],
+        text: Union[str, TelegramText],
+        concurrency: int = 8,
+        **kwargs,
+    ) -> Dict[
+        Union[int, str],
+        Optional[Message | TelegramError | CircuitOpenError | PreflightError],
+    ]:
+        """
+        Отправляет один и тот же текст в несколько чатов параллельно
+        с учётом ограничения частоты для каждого чата.
+        Возвращает словарь chat_id → результат send_message.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _send(chat_id: Union[int, str]):
+            async with semaphore:
+                await self.chat_limiter(chat_id).acquire()
+                return await self.send_message(chat_id=chat_id, text=text, **kwargs)
+
+        results = await asyncio.gather(*(_send(c) for c in chat_ids))
+        return dict(zip(chat_ids, results))
+
     async def edit_message(
         self,
         chat_id: Union[int, str],
         message_id: int,
-        new_text: str,
+        new_text: Union[str, TelegramText],
         parse_mode: Optional[str] = "HTML",
         disable_web_page_preview: bool = False,
-    ) -> Optional[Message | TelegramError | bool]:
-        """Редактирует существующее сообщение по ID."""
+    ) -> Optional[Message | TelegramError | CircuitOpenError | PreflightError | bool]:
+        """Редактирует существующее сообщение по ID (текст или TelegramText)."""
+        error = _preflight(new_text, parse_mode)
+        if error is not None:
+            return error
         try:
-            return await self.bot.edit_message_text(
+            return await self._api(
+                "edit_message_text",
                 chat_id=chat_id,
                 message_id=message_id,
-                text=new_text,
-                parse_mode=parse_mode,
+                **_text_kwargs(new_text, parse_mode),
                 disable_web_page_preview=disable_web_page_preview,
-                connect_timeout=20.0,
-            )
-        except RetryAfter as e:
-            if isinstance(e.retry_after, timedelta):
-                delay = e.retry_after.total_seconds()
-            else:
-                delay = float(e.retry_after)
-            logger.warning(f"Rate limit при редактировании, жду {delay:.2f} сек...")
-            await asyncio.sleep(delay)
-            return await self.edit_message(
-                chat_id, message_id, new_text, parse_mode, disable_web_page_preview
             )
-        except TelegramError as e:
+        except (TelegramError, CircuitOpenError) as e:
             return e
 
     async def send_photo(
@@ -94,40 +262,80 @@ class TelegramClient:
         md_path: Optional[str] = None,
         parse_mode: Optional[str] = "HTML",
     ) -> Optional[Message]:
-        """Отправка изображения с подписью."""
+        """
+        Отправка изображения с подписью.
+        Локальный файл, уже отправленный этим ботом, уходит по file_id без загрузки.
+        """
         html: Optional[str] = None
         if md_path:
-            html = md_to_html(md_path)
-            html = sanitize_html_for_telegram(html=html, base_path=md_path)
+            html = render_telegram_html(md_path, self.imgbb_api_key)
+            if _preflight(html, parse_mode, caption=True) is not None:
+                return None
+        caption = html or md_path
         try:
-            if not photo_path.startswith("http"):
-                path = Path(photo_path).expanduser().resolve()
-                with open(path, "rb") as photo_file:
-                    input_file = InputFile(photo_file)
-            else:
-                input_file = photo_path
-            return await self.bot.send_photo(
-                chat_id=chat_id,
-                photo=input_file,
-                caption=html or md_path,
-                connect_timeout=20.0,
-                parse_mode=parse_mode,
+            if photo_path.startswith("http"):
+                return await self._api(
+                    "send_photo",
+                    chat_id=chat_id,
+                    photo=photo_path,
+                    caption=caption,
+                    parse_mode=parse_mode,
+                )
+            return await self._send_local_photo(
+                chat_id, Path(photo_path).expanduser().resolve(), caption, parse_mode
             )
-        except RetryAfter as e:
-            if isinstance(e.retry_after, timedelta):
-                delay = e.retry_after.total_seconds()
-            else:
-                delay = float(e.retry_after)
-            logger.warning(f"Rate limit при отправке фото, жду {delay:.2f} сек...")
-            await asyncio.sleep(delay)
-            return await self.send_photo(chat_id, photo_path, md_path, parse_mode)
-        except TelegramError as e:
-            logger.error(f"Ошибка при отправке фото: {e}")
+        except (TelegramError, CircuitOpenError) as e:
+            logger.error("Ошибка при отправке фото: %s", e)
             return None
         except FileNotFoundError:
-            logger.error(f"Файл не найден: {photo_path}")
+            logger.error("Файл не найден: %s", photo_path)
             return None
 
+    async def _send_local_photo(
+        self,
+        chat_id: Union[int, str],
+        path: Path,
+        caption: Optional[str],
+        parse_mode: Optional[str],
+    ) -> Message:
+        cache = self.file_id_cache
+        digest: Optional[str] = None
+        if cache is not None:
+            digest = file_digest(path)
+            file_id = cache.get(self.bot_id, digest)
+            if file_id:
+                try:
+                    return await self._api(
+                        "send_photo",
+                        chat_id=chat_id,
+                        photo=file_id,
+                        caption=caption,
+                        parse_mode=parse_mode,
+                    )
+                except BadRequest as e:
+                    # Ошибка подписи не связана с file_id — загрузка не поможет
+                    if "file" not in str(e).lower():
+                        raise
+                    logger.warning("file_id для %s устарел (%s), загружаю", path, e)
+                    cache.forget(self.bot_id, digest)
+
+        with open(path, "rb") as photo_file:
+            input_file = InputFile(photo_file)
+        size = path.stat().st_size
+        record_upload("telegram", size)
+        message = await self._api(
+            "send_photo",
+            media=True,
+            chat_id=chat_id,
+            photo=input_file,
+            caption=caption,
+            parse_mode=parse_mode,
+        )
+        if cache is not None and digest is not None and message.photo:
+            # Самый большой размер — исходное изображение
+            cache.put(self.bot_id, digest, message.photo[-1].file_id, size)
+        return message
+
     async def edit_photo(
         self,
         chat_id: Union[int, str],
@@ -138,34 +346,130 @@ class TelegramClient:
         """Отправка изображения с подписью."""
         html: Optional[str] = None
         if md_path:
-            html = md_to_html(md_path)
-            html = sanitize_html_for_telegram(html=html, base_path=md_path)
+            html = render_telegram_html(md_path, self.imgbb_api_key)
+            if _preflight(html, parse_mode, caption=True) is not None:
+                return False
         try:
-            return await self.bot.edit_message_caption(
+            return await self._api(
+                "edit_message_caption",
                 chat_id=chat_id,
                 message_id=message_id,
                 caption=html or md_path,
-                connect_timeout=20.0,
                 parse_mode=parse_mode,
             )
-        except RetryAfter as e:
-            if isinstance(e.retry_after, timedelta):
-                delay = e.retry_after.total_seconds()
-            else:
-                delay = float(e.retry_after)
-            logger.warning(f"Rate limit при отправке фото, жду {delay:.2f} сек...")
-            await asyncio.sleep(delay)
-            return await self.edit_photo(chat_id, message_id, md_path, parse_mode)
+        except (TelegramError, CircuitOpenError) as e:
+            logger.error("Ошибка при редактировании подписи: %s", e)
+            return False
+
+    async def fetch_message(
+        self,
+        chat_id: Union[int, str],
+        message_id: int,
+        copy_chat_id: Union[int, str],
+    ) -> Optional[Message]:
+        """
+        Текущее содержимое сообщения. Bot API не отдаёт сообщения по ID, поэтому
+        сообщение пересылается в служебный чат copy_chat_id, а копия сразу удаляется.
+        Возвращает None, если сообщения больше нет.
+        """
+        try:
+            copy = await self._api(
+                "forward_message",
+                chat_id=copy_chat_id,
+                from_chat_id=chat_id,
+                message_id=message_id,
+                disable_notification=True,
+            )
+        except BadRequest as e:
+            if "not found" in str(e).lower():
+                return None
+            raise
+        try:
+            await self._api(
+                "delete_message", chat_id=copy_chat_id, message_id=copy.message_id
+            )
+        except (TelegramError, CircuitOpenError) as e:
+            logger.warning("Не удалось удалить копию сообщения %s: %s", message_id, e)
+        return copy
 
     async def delete_message(self, chat_id: Union[int, str], message_id: int) -> bool:
         """Удаляет сообщение по ID."""
         try:
-            await self.bot.delete_message(
+            await self._api(
+                "delete_message",
                 chat_id=chat_id,
                 message_id=message_id,
-                connect_timeout=20.0,
             )
             return True
-        except TelegramError as e:
-            logger.error(f"Ошибка при удалении сообщения: {e}")
+        except (TelegramError, CircuitOpenError) as e:
+            logger.error("Ошибка при удалении сообщения: %s", e)
             return False
+
+    async def delete_messages(
+        self,
+        chat_id: Union[int, str],
+        message_ids: Iterable[int],
+        concurrency: int = 4,
+        rate: float = 5.0,
+        confirm: bool = False,
+    ) -> List[int]:
+        """
+        Пакетное удаление сообщений через deleteMessages (до 100 ID за вызов).
+        deleteMessages молча пропускает ID, которые удалить нельзя, и всё равно
+        возвращает True, поэтому результата по отдельным ID у пакета нет:
+        возвращаются только ID из пакетов, отклонённых целиком, которые
+        не удалились и по одному. confirm=True удаляет каждый ID отдельным
+        deleteMessage и возвращает точный список неудалённых (для немногих ID).
+        ID читаются лениво, диапазон не разворачивается в память целиком.
+        """
+        limiter = RateLimiter(rate=rate, burst=concurrency)
+        batches = chunked(message_ids, 1 if confirm else DELETE_BATCH_SIZE)
+        failed: List[int] = []
+
+        async def _call(coro_factory) -> bool:
+            await limiter.acquire()
+            return bool(await coro_factory())
+
+        async def _delete_one(message_id: int) -> None:
+            try:
+                ok = await _call(
+                    lambda: self._api(
+                        "delete_message", chat_id=chat_id, message_id=message_id
+                    )
+                )
+            except (TelegramError, CircuitOpenError) as e:
+                logger.debug("ID %s: %s", message_id, e)
+                ok = False
+            if not ok:
+                failed.append(message_id)
+
+        async def _delete_batch(batch: List[int]) -> None:
+            if len(batch) == 1:
+                await _delete_one(batch[0])
+                return
+            try:
+                ok = await _call(
+                    lambda: self._api(
+                        "delete_messages", chat_id=chat_id, message_ids=batch
+                    )
+                )
+                if ok:
+                    return
+            except (TelegramError, CircuitOpenError) as e:
+                logger.warning(
+                    "Пакет %s..%s не удалён (%s), проверяю по одному",
+                    batch[0],
+                    batch[-1],
+                    e,
+                )
+            # Пакет отклонён целиком — выясняем, какие именно ID не удаляются
+            for message_id in batch:
+                await _delete_one(message_id)
+
+        async def _worker() -> None:
+            # Итератор пакетов общий: каждый воркер берёт следующий пакет сам
+            for batch in batches:
+                await _delete_batch(batch)
+
+        await asyncio.gather(*(_worker() for _ in range(max(1, concurrency))))
+        return sorted(failed)
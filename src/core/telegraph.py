@@ -1,30 +1,229 @@
-from typing import Any, Dict, Optional
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 
 import requests
+from requests.adapters import HTTPAdapter
 from telegraph import Telegraph
+from telegraph.exceptions import RetryAfterError, TelegraphException
 
-from utils.md2telegraph import markdown_to_telegraph_nodes
+from core import preflight
+from core.build import render_telegraph_nodes
+from core.metrics import track_request
+from core.retry import RetryPolicy, call_sync, is_idempotent
+from utils.image_hosts import TelegraphHost
+from utils.md2telegraph import Node
+from utils.telegraph_payload import (
+    TelegraphPayloadBuilder,
+    join_payload,
+    nav_next_url,
+    nav_node,
+)
 
-TELEGRAPH_UPLOAD_URL = "https://telegra.ph/upload"
 TELEGRAPH_API_URL = "https://api.telegra.ph"
+# Предел длины цепочки продолжений при обходе по ссылкам «далее»
+MAX_PARTS = 100
+
+logger = logging.getLogger(__name__)
+
+
+def _preflight(
+    nodes: List[Node],
+    title: str,
+    author_name: Optional[str],
+    author_url: Optional[str],
+) -> None:
+    """PreflightError до первого запроса, если API отклонит страницу."""
+    if not preflight.is_enabled():
+        return
+    problems = preflight.check_telegraph_nodes(nodes, title, author_name, author_url)
+    errors = [p for p in problems if p.severity == preflight.ERROR]
+    if errors:
+        raise preflight.PreflightError(errors)
 
 
 class TelegraphClient:
-    def __init__(self, access_token: str | None):
+    def __init__(
+        self,
+        access_token: str | None,
+        pool_size: int = 10,
+        retry_policy: Optional[RetryPolicy] = None,
+        timeout: float = 30.0,
+        service: str = "telegraph",
+        imgbb_api_key: Optional[str] = None,
+    ):
         self.client = Telegraph(access_token=access_token)
+        # Ключ ImgBB для локальных изображений при рендере страниц из Markdown
+        self.imgbb_api_key = imgbb_api_key
         self.access_token = access_token
+        # Идентификатор аккаунта без раскрытия токена (для закрепления страниц)
+        self.credential_id = hashlib.sha256(
+            (access_token or "").encode("utf-8")
+        ).hexdigest()[:12]
+        # Имя для повторов и circuit breaker (у каждого аккаунта пула своё)
+        self.service = service
+        self.retry_policy = retry_policy
+        self.timeout = timeout
+        # Общая сессия с пулом соединений для прямых запросов к API
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
 
     def upload_file(self, path: str) -> str:
         """
-        Загружает файл (jpg/png/gif/mp4/mp3) на Telegraph и возвращает URL. Устарел?
+        Загружает файл (jpg/png/gif/mp4/mp3) на Telegraph и возвращает URL.
+        Тот же хостинг «telegraph», что выбирается в MDP_IMAGE_HOSTS.
+        """
+        host = TelegraphHost(self.timeout, self.session)
+        return host.upload(path, self.retry_policy)
+
+    def _method(
+        self, method: str, values: Dict[str, Any], path: str = ""
+    ) -> Dict[str, Any]:
+        """
+        Прямой вызов метода Telegraph API.
+        content передаётся уже сериализованным, чтобы не кодировать его повторно.
+        """
+        if "access_token" not in values and self.access_token:
+            values = {**values, "access_token": self.access_token}
+        url = (
+            f"{TELEGRAPH_API_URL}/{method}/{path}"
+            if path
+            else f"{TELEGRAPH_API_URL}/{method}"
+        )
+
+        def _call() -> Dict[str, Any]:
+            # Разбор ответа внутри блока: {"ok": false} тоже считается ошибкой
+            with track_request("telegraph", method):
+                r = self.session.post(url, data=values, timeout=self.timeout)
+                if r.status_code >= 500:
+                    r.raise_for_status()
+                response = r.json()
+                if response.get("ok"):
+                    return response["result"]
+                error = response.get("error")
+                if isinstance(error, str) and error.startswith("FLOOD_WAIT_"):
+                    raise RetryAfterError(int(error.rsplit("_", 1)[-1]))
+                raise TelegraphException(error)
+
+        return call_sync(
+            self.service, _call, self.retry_policy, idempotent=is_idempotent(method)
+        )
+
+    def _publish_parts(
+        self,
+        builder: TelegraphPayloadBuilder,
+        title: str,
+        author_name: Optional[str],
+        author_url: Optional[str],
+        first_path: Optional[str] = None,
+        part_paths: Sequence[str] = (),
+    ) -> Dict[str, Any]:
+        """
+        Публикует содержимое одной или нескольких страниц.
+        Первая часть создаётся (или редактируется по first_path), остальные — страницы-продолжения
+        со ссылками «назад / далее». Существующие продолжения part_paths
+        редактируются на месте, новые создаются только сверх них, а лишние
+        (текст стал короче) затираются и возвращаются в result["spare"].
+        """
+        parts = builder.payloads()
+        if builder.oversized:
+            logger.warning(
+                "Блок больше лимита Telegraph (%s байт), API может отклонить страницу",
+                builder.limit,
+            )
+        total = len(parts)
+        paths = [first_path, *part_paths] if first_path else []
+        published: List[Dict[str, Any]] = []
+        titles: List[str] = []
+        for i, fragments in enumerate(parts):
+            part_title = title if i == 0 else f"{title} ({i + 1}/{total})"
+            extra = [nav_node(prev_url=published[-1]["url"])] if published else []
+            values = {
+                "title": part_title,
+                "author_name": author_name,
+                "author_url": author_url,
+                "content": join_payload(fragments, *extra),
+            }
+            if i < len(paths):
+                published.append(self._method("editPage", values, path=paths[i]))
+            else:
+                published.append(self._method("createPage", values))
+            titles.append(part_title)
+
+        # Ссылки «далее» можно проставить только после создания следующей части
+        for i in range(total - 1):
+            nav = nav_node(
+                prev_url=published[i - 1]["url"] if i else None,
+                next_url=published[i + 1]["url"],
+            )
+            self._method(
+                "editPage",
+                {
+                    "title": titles[i],
+                    "author_name": author_name,
+                    "author_url": author_url,
+                    "content": join_payload(parts[i], nav),
+                },
+                path=published[i]["path"],
+            )
+
+        result = dict(published[0])
+        if total > 1:
+            result["parts"] = [p["url"] for p in published]
+            logger.info("Контент разбит на %s страниц: %s", total, result["parts"])
+        spare = list(paths[total:])
+        for path in spare:
+            self._blank_part(path, title, published[0]["url"], author_name, author_url)
+        if spare:
+            result["spare"] = spare
+            logger.info("Лишние продолжения затёрты: %s", spare)
+        return result
+
+    def _blank_part(
+        self,
+        path: str,
+        title: str,
+        first_url: str,
+        author_name: Optional[str],
+        author_url: Optional[str],
+    ) -> None:
+        """Затирает ненужное продолжение, оставляя ссылку на начало публикации."""
+        content = [
+            {"tag": "p", "children": ["Эта часть публикации больше не используется."]},
+            nav_node(prev_url=first_url),
+        ]
+        self._method(
+            "editPage",
+            {
+                "title": title,
+                "author_name": author_name,
+                "author_url": author_url,
+                "content": join_payload([], *content),
+            },
+            path=path,
+        )
+
+    def continuation_paths(self, path: str) -> List[str]:
+        """
+        Пути страниц-продолжений опубликованной страницы: цепочка ссылок «далее»
+        в навигации живых страниц (для страниц, чьи части нигде не сохранены).
         """
-        with open(path, "rb") as f:
-            r = requests.post(TELEGRAPH_UPLOAD_URL, files={"file": f})
-        r.raise_for_status()
-        data = r.json()
-        if isinstance(data, list) and data and "src" in data[0]:
-            return "https://telegra.ph" + data[0]["src"]
-        raise RuntimeError(f"Telegraph upload error: {data}")
+        paths: List[str] = []
+        current = path
+        while len(paths) < MAX_PARTS:
+            data = self.get_page(current, return_content=True)
+            if not data.get("ok"):
+                break
+            next_url = nav_next_url(data["result"].get("content") or [])
+            if not next_url:
+                break
+            current = next_url.rstrip("/").rsplit("/", 1)[-1]
+            if current == path or current in paths:
+                break
+            paths.append(current)
+        return paths
 
     def create_page(
         self,
@@ -35,14 +234,30 @@ class TelegraphClient:
     ) -> Dict[str, Any]:
         """
         Создаёт новую страницу в Telegraph.
-        Возвращает JSON-ответ API.
+        Если контент превышает лимит Telegraph — создаются страницы-продолжения.
+        Возвращает JSON-ответ API для первой страницы.
         """
-        html_content, title_from_html = markdown_to_telegraph_nodes(md_path)
-        title = title or title_from_html or "None"
-        result_tgraph = self.client.create_page(
-            title, html_content, author_name, author_url
+        html_content, title_from_html = render_telegraph_nodes(
+            md_path, self.imgbb_api_key
+        )
+        return self.create_page_from_nodes(
+            title or title_from_html or "None", html_content, author_name, author_url
         )
-        return result_tgraph
+
+    def create_page_from_nodes(
+        self,
+        title: str,
+        nodes: List[Node],
+        author_name: Optional[str] = None,
+        author_url: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Создаёт страницу из уже подготовленных telegraph-узлов
+        (например, отрендеренных заранее планировщиком).
+        """
+        _preflight(nodes, title, author_name, author_url)
+        builder = TelegraphPayloadBuilder().extend(nodes)
+        return self._publish_parts(builder, title, author_name, author_url)
 
     def edit_page(
         self,
@@ -51,25 +266,51 @@ class TelegraphClient:
         md_path: str,
         author_name: Optional[str] = None,
         author_url: Optional[str] = None,
+        part_paths: Optional[Sequence[str]] = None,
     ) -> Dict[str, Any]:
         """
-        Редактирует существующую страницу.
+        Редактирует существующую страницу вместе с её продолжениями.
+        part_paths — известные продолжения (None — найти по ссылкам «далее»);
+        они правятся на месте, новые страницы создаются только сверх них,
+        а лишние затираются.
         """
-        html_content, title_from_html = markdown_to_telegraph_nodes(md_path)
+        html_content, title_from_html = render_telegraph_nodes(
+            md_path, self.imgbb_api_key
+        )
         title = title or title_from_html or "None"
-        result = self.client.edit_page(
-            path, title, html_content, author_name, author_url
+        _preflight(html_content, title, author_name, author_url)
+        builder = TelegraphPayloadBuilder().extend(html_content)
+        if part_paths is None:
+            part_paths = self.continuation_paths(path)
+        return self._publish_parts(
+            builder,
+            title,
+            author_name,
+            author_url,
+            first_path=path,
+            part_paths=part_paths,
         )
-        return result
 
     def get_page(self, path: str, return_content: bool = True) -> Dict[str, Any]:
         """
         Получает страницу по path.
         """
         params = {"return_content": str(return_content).lower()}
-        r = requests.get(f"{TELEGRAPH_API_URL}/getPage/{path}", params=params)
-        r.raise_for_status()
-        return r.json()
+
+        def _call() -> Dict[str, Any]:
+            with track_request("telegraph", "getPage") as request:
+                r = self.session.get(
+                    f"{TELEGRAPH_API_URL}/getPage/{path}",
+                    params=params,
+                    timeout=self.timeout,
+                )
+                r.raise_for_status()
+                response = r.json()
+                if not response.get("ok"):
+                    request.fail()
+            return response
+
+        return call_sync(self.service, _call, self.retry_policy)
 
     def get_pages_list(self, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
         """
@@ -80,8 +321,58 @@ class TelegraphClient:
             "limit": limit,
             "offset": offset,
         }
-        r = requests.get(f"{TELEGRAPH_API_URL}/getPageList", params=params)
-        return r.json()
+
+        def _call() -> Dict[str, Any]:
+            with track_request("telegraph", "getPageList") as request:
+                r = self.session.get(
+                    f"{TELEGRAPH_API_URL}/getPageList",
+                    params=params,
+                    timeout=self.timeout,
+                )
+                if r.status_code >= 500:
+                    r.raise_for_status()
+                response = r.json()
+                if not response.get("ok"):
+                    request.fail()
+            return response
+
+        return call_sync(self.service, _call, self.retry_policy)
+
+    def iter_pages(self, limit: int = 50) -> Iterator[Dict[str, Any]]:
+        """
+        Постранично перебирает все страницы аккаунта (без содержимого).
+        """
+        offset = 0
+        while True:
+            data = self.get_pages_list(limit=limit, offset=offset)
+            if not isinstance(data, dict) or not data.get("ok"):
+                raise RuntimeError(f"Ошибка Telegraph API: {data}")
+            result = data.get("result", {})
+            yield from result.get("pages", [])
+            offset += limit
+            if offset >= (result.get("total_count", 0) or 0):
+                break
+
+    def list_all_pages(self, limit: int = 200, jobs: int = 4) -> List[Dict[str, Any]]:
+        """
+        Все страницы аккаунта (без содержимого). Первый запрос узнаёт total_count,
+        остальные смещения запрашиваются параллельно; порядок страниц сохраняется.
+        """
+
+        def _fetch(offset: int) -> Dict[str, Any]:
+            data = self.get_pages_list(limit=limit, offset=offset)
+            if not isinstance(data, dict) or not data.get("ok"):
+                raise RuntimeError(f"Ошибка Telegraph API: {data}")
+            return data.get("result", {})
+
+        first = _fetch(0)
+        pages: List[Dict[str, Any]] = list(first.get("pages", []))
+        offsets = range(limit, first.get("total_count", 0) or 0, limit)
+        if offsets:
+            with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+                for result in pool.map(_fetch, offsets):
+                    pages.extend(result.get("pages", []))
+        return pages
 
     def delete_page(self, path: str, title: str = "Deleted") -> dict:
         """
@@ -90,7 +381,16 @@ class TelegraphClient:
         html_content = [
             {"tag": "p", "children": [" "]}  # минимальный блок, API примет
         ]  # пустая страница
-        result = self.client.edit_page(
-            path=path, title=title, author_name="", author_url="", content=html_content
-        )
+
+        def _call() -> dict:
+            with track_request("telegraph", "editPage"):
+                return self.client.edit_page(
+                    path=path,
+                    title=title,
+                    author_name="",
+                    author_url="",
+                    content=html_content,
+                )
+
+        result = call_sync(self.service, _call, self.retry_policy)
         return result
@@ -0,0 +1,115 @@
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+from core.credentials import TelegraphPool
+from core.telegraph import TelegraphClient
+from utils.telegraph2md import content_hash, telegraph_nodes_to_markdown
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = ".mirror.json"
+
+
+@dataclass
+class PullStats:
+    written: int = 0
+    skipped: int = 0
+    failed: List[str] = field(default_factory=list)
+
+
+def _load_index(out_dir: Path) -> Dict[str, Dict[str, Any]]:
+    index_path = out_dir / INDEX_FILE
+    if not index_path.exists():
+        return {}
+    try:
+        return json.loads(index_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning("Индекс зеркала повреждён, будет пересоздан: %s", e)
+        return {}
+
+
+def _save_index(out_dir: Path, index: Dict[str, Dict[str, Any]]) -> None:
+    tmp = out_dir / (INDEX_FILE + ".tmp")
+    tmp.write_text(json.dumps(index, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(out_dir / INDEX_FILE)
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(path)
+
+
+def pull_pages(
+    client: Union[TelegraphClient, TelegraphPool],
+    out_dir: Path,
+    jobs: int = 8,
+    limit: int = 50,
+) -> PullStats:
+    """
+    Зеркалирует все страницы аккаунта Telegraph в Markdown-файлы каталога out_dir.
+    Страницы скачиваются параллельно, каждая записывается на диск сразу после
+    получения; в памяти держится не больше ~2*jobs страниц одновременно.
+    Страницы, хеш содержимого которых совпадает с индексом зеркала, не перезаписываются.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index = _load_index(out_dir)
+    stats = PullStats()
+
+    def _fetch_and_store(page: Dict[str, Any]) -> bool:
+        path = page["path"]
+        data = client.get_page(path, return_content=True)
+        if not data.get("ok"):
+            raise RuntimeError(data.get("error") or data)
+        result = data["result"]
+        nodes = result.get("content") or []
+        digest = content_hash(nodes, result.get("title") or "")
+        md_file = out_dir / f"{path}.md"
+        known = index.get(path)
+        if known and known.get("hash") == digest and md_file.exists():
+            return False
+        text = telegraph_nodes_to_markdown(nodes, title=result.get("title"))
+        _write_atomic(md_file, text)
+        index[path] = {
+            "hash": digest,
+            "title": result.get("title"),
+            "url": result.get("url"),
+        }
+        return True
+
+    max_in_flight = max(1, jobs) * 2
+    pending: Dict[Future, str] = {}
+
+    def _collect(done) -> None:
+        for fut in done:
+            path = pending.pop(fut)
+            try:
+                if fut.result():
+                    stats.written += 1
+                    logger.debug("Сохранено: %s", path)
+                else:
+                    stats.skipped += 1
+            except Exception as e:
+                stats.failed.append(path)
+                logger.warning("Не удалось скачать %s: %s", path, e)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            for page in client.iter_pages(limit=limit):
+                if page.get("title") == "Deleted":
+                    continue
+                if len(pending) >= max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    _collect(done)
+                pending[pool.submit(_fetch_and_store, page)] = page["path"]
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+    finally:
+        _save_index(out_dir, index)
+
+    return stats
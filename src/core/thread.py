@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Dict, Iterable, List, Sequence, TypeVar, Union
+
+from telegram import Message
+from telegram.error import BadRequest
+
+from core.credentials import TelegramPool
+from core.telegram import TelegramClient
+from utils.telegram_entities import TelegramText
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+Part = Union[str, TelegramText]
+T = TypeVar("T")
+
+_END = object()
+# Место в первой части под "\n<ID>" при add_id
+ID_RESERVE = 16
+
+
+@dataclass
+class ThreadResult:
+    """ID сообщений цепочки по каналам (в порядке частей) и ошибки."""
+
+    messages: Dict[str, List[int]] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+async def prefetch(items: Iterable[T], size: int = 2) -> AsyncGenerator[T, None]:
+    """
+    Элементы синхронного генератора, подготовленные в отдельном потоке
+    на size вперёд: рендер и загрузка изображений следующих частей идут,
+    пока предыдущие отправляются.
+    """
+    queue: asyncio.Queue = asyncio.Queue(max(1, size))
+    iterator = iter(items)
+
+    async def produce() -> None:
+        try:
+            while (item := await asyncio.to_thread(next, iterator, _END)) is not _END:
+                await queue.put((item, None))
+        except Exception as e:
+            await queue.put((_END, e))
+            return
+        await queue.put((_END, None))
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        task.cancel()
+
+
+def _unchanged(result: object) -> bool:
+    """Правка без изменений: Telegram отвечает ошибкой, но сообщение актуально."""
+    return isinstance(result, BadRequest) and "not modified" in str(result).lower()
+
+
+async def send_thread(
+    client: Union[TelegramClient, TelegramPool],
+    chat_ids: Sequence[ChatId],
+    parts: Iterable[Part],
+    prefetch_parts: int = 2,
+    add_id: bool = False,
+) -> ThreadResult:
+    """
+    Отправляет части цепочкой ответов в каждый канал: первая — обычным
+    сообщением, каждая следующая — ответом на предыдущую. Часть ждёт только
+    message_id своей предыдущей части в том же канале; каналы независимы.
+    При ошибке цепочка в этом канале обрывается, остальные продолжаются.
+    add_id дописывает в первую часть её ID (как ADD_ID в CLI).
+    """
+    result = ThreadResult({str(c): [] for c in chat_ids})
+    queues: Dict[ChatId, asyncio.Queue] = {c: asyncio.Queue() for c in chat_ids}
+
+    async def distribute() -> None:
+        try:
+            async for part in prefetch(parts, prefetch_parts):
+                for queue in queues.values():
+                    queue.put_nowait(part)
+        except Exception as e:
+            logger.warning("Ошибка рендера цепочки: %s", e)
+            for chat_id in chat_ids:
+                result.errors.setdefault(str(chat_id), f"рендер: {e}")
+        finally:
+            for queue in queues.values():
+                queue.put_nowait(_END)
+
+    async def send_chat(chat_id: ChatId) -> None:
+        ids = result.messages[str(chat_id)]
+        while (part := await queues[chat_id].get()) is not _END:
+            if str(chat_id) in result.errors:
+                continue  # цепочка оборвана: остаток только вычитываем
+            res = await client.send_message(
+                chat_id, part, reply_to=ids[-1] if ids else None
+            )
+            if isinstance(res, Message):
+                ids.append(res.message_id)
+                if add_id and len(ids) == 1:
+                    await _add_id(client, chat_id, ids[0], part)
+            else:
+                result.errors[str(chat_id)] = f"часть {len(ids) + 1}: {res}"
+                logger.warning("Цепочка в %s оборвана: %s", chat_id, res)
+
+    await asyncio.gather(distribute(), *(send_chat(c) for c in chat_ids))
+    return result
+
+
+async def edit_thread(
+    client: Union[TelegramClient, TelegramPool],
+    chat_id: ChatId,
+    message_ids: Sequence[int],
+    parts: Iterable[Part],
+    prefetch_parts: int = 2,
+    add_id: bool = False,
+) -> ThreadResult:
+    """
+    Обновляет цепочку по новым частям: существующие сообщения редактируются
+    по порядку, новые части отправляются ответами на последнее, а лишние
+    сообщения (текст стал короче) удаляются.
+    """
+    result = ThreadResult({str(chat_id): []})
+    ids = result.messages[str(chat_id)]
+    async with aclosing(prefetch(parts, prefetch_parts)) as stream:
+        async for part in stream:
+            n = len(ids)
+            if n < len(message_ids):
+                text = part + f"\n{message_ids[0]}" if add_id and n == 0 else part
+                res = await client.edit_message(chat_id, message_ids[n], text)
+                if isinstance(res, Message) or _unchanged(res):
+                    ids.append(message_ids[n])
+                    continue
+            else:
+                res = await client.send_message(
+                    chat_id, part, reply_to=ids[-1] if ids else None
+                )
+                if isinstance(res, Message):
+                    ids.append(res.message_id)
+                    continue
+            result.errors[str(chat_id)] = f"часть {n + 1}: {res}"
+            logger.warning("Цепочка в %s обновлена не полностью: %s", chat_id, res)
+            ids.extend(message_ids[n:])  # необработанные сообщения остаются в цепочке
+            return result
+    extra = list(message_ids[len(ids) :])
+    if extra:
+        # Лишних сообщений немного: удаляем по одному, чтобы знать неудалённые
+        failed = await client.delete_messages(chat_id, extra, confirm=True)
+        if failed:
+            result.errors[str(chat_id)] = f"не удалены: {', '.join(map(str, failed))}"
+            ids.extend(failed)
+    return result
+
+
+async def _add_id(
+    client: Union[TelegramClient, TelegramPool],
+    chat_id: ChatId,
+    message_id: int,
+    part: Part,
+) -> None:
+    res = await client.edit_message(chat_id, message_id, part + f"\n{message_id}")
+    if not isinstance(res, Message):
+        logger.warning("ID не дописан в %s (%s): %s", message_id, chat_id, res)
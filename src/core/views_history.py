@@ -0,0 +1,137 @@
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import pandas as pd
+
+# Снимки только добавляются. views хранится компактно: целые run_id/page_id
+# в таблице WITHOUT ROWID, пути и заголовки — один раз в pages.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    taken_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_taken_at ON runs(taken_at);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    title TEXT,
+    url TEXT
+);
+CREATE TABLE IF NOT EXISTS views (
+    run_id INTEGER NOT NULL,
+    page_id INTEGER NOT NULL,
+    views INTEGER NOT NULL,
+    PRIMARY KEY (run_id, page_id)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class ViewsStats:
+    runs: int
+    start: Optional[float]
+    end: Optional[float]
+    # по страницам: path, title, url, views, delta, growth
+    pages: pd.DataFrame
+    # суммарные просмотры по дням окна
+    daily: pd.Series
+
+
+class ViewsStore:
+    """История просмотров страниц Telegraph (SQLite, append-only)."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def add_snapshot(
+        self, pages: Iterable[Dict[str, Any]], taken_at: Optional[float] = None
+    ) -> int:
+        """Сохраняет просмотры всех страниц одним снимком. Возвращает id снимка."""
+        rows = [p for p in pages if p.get("path") and p.get("title") != "Deleted"]
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs (taken_at) VALUES (?)", (taken_at or time.time(),)
+            )
+            run_id = int(cur.lastrowid or 0)
+            self.conn.executemany(
+                "INSERT INTO pages (path, title, url) VALUES (?, ?, ?)"
+                " ON CONFLICT(path) DO UPDATE SET title = excluded.title,"
+                " url = excluded.url",
+                ((p["path"], p.get("title"), p.get("url")) for p in rows),
+            )
+            self.conn.executemany(
+                "INSERT INTO views (run_id, page_id, views)"
+                " SELECT ?, id, ? FROM pages WHERE path = ?",
+                ((run_id, int(p.get("views") or 0), p["path"]) for p in rows),
+            )
+        return run_id
+
+    def _window_runs(self, since: float) -> pd.DataFrame:
+        """Снимки окна плюс последний снимок до него (база для приростов)."""
+        return pd.read_sql_query(
+            "SELECT id, taken_at FROM runs WHERE taken_at >= ?"
+            " OR id = (SELECT id FROM runs WHERE taken_at < ?"
+            " ORDER BY taken_at DESC LIMIT 1)"
+            " ORDER BY taken_at",
+            self.conn,
+            params=[since, since],
+        )
+
+    def stats(self, days: float = 7.0, now: Optional[float] = None) -> ViewsStats:
+        """
+        Прирост просмотров за окно days: по каждой странице — разница между
+        последним снимком и базовым (последним до окна или первым появлением).
+        """
+        since = (now or time.time()) - days * 86400
+        runs = self._window_runs(since)
+        empty = pd.DataFrame(
+            columns=["path", "title", "url", "views", "delta", "growth"]
+        )
+        if runs.empty:
+            return ViewsStats(0, None, None, empty, pd.Series(dtype="int64"))
+
+        run_ids = runs["id"].tolist()
+        # Читаем только целые столбцы; текст подтягивается после агрегации
+        views = pd.read_sql_query(
+            "SELECT run_id, page_id, views FROM views WHERE run_id BETWEEN ? AND ?",
+            self.conn,
+            params=[min(run_ids), max(run_ids)],
+        )
+        taken = runs.set_index("id")["taken_at"]
+        views = views.loc[views["run_id"].isin(run_ids)].assign(
+            taken_at=lambda df: df["run_id"].map(taken)
+        )
+        views = views.sort_values(["page_id", "taken_at"])
+
+        grouped = views.groupby("page_id")["views"]
+        per_page = pd.DataFrame({"first": grouped.first(), "views": grouped.last()})
+        per_page["delta"] = per_page["views"] - per_page["first"]
+        per_page["growth"] = per_page["delta"] / per_page["first"].where(
+            per_page["first"] > 0
+        )
+
+        meta = pd.read_sql_query("SELECT id, path, title, url FROM pages", self.conn)
+        per_page = per_page.join(meta.set_index("id"), how="left")
+
+        stamps = pd.to_datetime(views["taken_at"], unit="s")
+        totals = views["views"].groupby(stamps).sum()
+        daily = totals.resample("D").last().dropna().astype("int64")
+
+        return ViewsStats(
+            runs=len(runs),
+            start=float(runs["taken_at"].iloc[0]),
+            end=float(runs["taken_at"].iloc[-1]),
+            pages=per_page.loc[:, ["path", "title", "url", "views", "delta", "growth"]]
+            .sort_values("delta", ascending=False)
+            .reset_index(drop=True),
+            daily=daily,
+        )
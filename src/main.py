@@ -1,5 +1,10 @@
 # main.py
+import sys
+
 from cli import app
+from cli.logger_config import logger
+from core.preflight import PreflightError
+from utils.converting_md2html import MarkdownSourceError
 
 
 @app.command("help-all")
@@ -24,7 +29,11 @@ def help_all():
 
 def main():
     """Точка входа для pipx."""
-    app()
+    try:
+        app()
+    except (MarkdownSourceError, PreflightError) as e:
+        logger.error(f"❌{e}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
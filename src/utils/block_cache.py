@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Iterator, Optional, TypeVar
+
+import markdown as mdlib
+
+from core.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+BLOCK_CACHE_LOOKUPS = Counter(
+    "mdp_block_cache_total",
+    "Обращения к кешу отрендеренных блоков по этапам: hit, miss",
+    ("stage", "result"),
+)
+
+# Меняется при изменении правил конвертации: старые записи перестают совпадать
+CACHE_VERSION = 3
+MEMORY_ENTRIES = 4096
+# Больше записей в базе не храним: при закрытии удаляются давно не использованные
+MAX_ROWS = 200_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_used ON blocks (used_at);
+"""
+
+# Локальное изображение: результат зависит от файла и загрузки, такие блоки не кешируются
+_LOCAL_IMG_RE = re.compile(r"<img\b[^>]*\bsrc=\"(?!https?://)", re.IGNORECASE)
+
+
+def has_local_images(html: str) -> bool:
+    return bool(_LOCAL_IMG_RE.search(html))
+
+
+class BlockCache:
+    """
+    Результаты конвертации блоков верхнего уровня по хешу их исходника.
+    В памяти — LRU на MEMORY_ENTRIES записей; если задан path, записи
+    сохраняются в SQLite и переживают процесс (повторный `tg edit` большого
+    документа конвертирует только изменённые блоки).
+    Соединение открывается заново в дочерних процессах (пул `render build`).
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+
+    @property
+    def conn(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is None or self._pid != os.getpid():
+            return
+        try:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM blocks").fetchone()
+            if count > MAX_ROWS:
+                with self._conn:
+                    self._conn.execute(
+                        "DELETE FROM blocks WHERE key IN"
+                        " (SELECT key FROM blocks ORDER BY used_at LIMIT ?)",
+                        (count - MAX_ROWS,),
+                    )
+        finally:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def key(stage: str, *parts: str) -> str:
+        h = hashlib.sha256(f"{CACHE_VERSION}\0{mdlib.__version__}\0{stage}".encode())
+        for part in parts:
+            h.update(b"\0")
+            h.update(part.encode("utf-8", "surrogatepass"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                return value
+            conn = self.conn
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT value FROM blocks WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.debug("Кеш блоков недоступен: %s", e)
+                return None
+            if row is not None:
+                self._remember(key, row[0])
+                # Отметка использования: при обрезке до MAX_ROWS удаляются
+                # давно не нужные записи, а не просто самые старые. Попадания
+                # в память не отмечаются: запись попала туда через put или
+                # чтение из базы в этом процессе, её used_at уже свежий
+                self._touch(conn, key)
+                return row[0]
+        return None
+
+    @staticmethod
+    def _touch(conn: sqlite3.Connection, key: str) -> None:
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE blocks SET used_at = ? WHERE key = ?", (time.time(), key)
+                )
+        except sqlite3.Error as e:
+            logger.debug("Не удалось обновить отметку блока: %s", e)
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._remember(key, value)
+            conn = self.conn
+            if conn is None:
+                return
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO blocks (key, value, used_at)"
+                        " VALUES (?, ?, ?)",
+                        (key, value, time.time()),
+                    )
+            except sqlite3.Error as e:
+                logger.debug("Не удалось сохранить блок в кеш: %s", e)
+
+    def _remember(self, key: str, value: str) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+
+_cache = BlockCache()
+# Кеш, заданный use() для текущего контекста (например, своим Publisher)
+_scoped: ContextVar[Optional[BlockCache]] = ContextVar("mdp_block_cache", default=None)
+
+
+def configure(path: Optional[Path]) -> None:
+    """Включает сохранение кеша блоков в SQLite (None — только в памяти)."""
+    global _cache
+    _cache.close()
+    _cache = BlockCache(Path(path).expanduser() if path else None)
+
+
+def get_cache() -> BlockCache:
+    return _scoped.get() or _cache
+
+
+@contextmanager
+def use(cache: BlockCache) -> Iterator[None]:
+    """
+    Внутри блока рендер пользуется cache вместо общего кеша процесса.
+    Контекст наследуется asyncio.to_thread и задачами asyncio.
+    """
+    token = _scoped.set(cache)
+    try:
+        yield
+    finally:
+        _scoped.reset(token)
+
+
+def memoize(stage: str, parts: tuple[str, ...], render: Callable[[], T]) -> T:
+    """
+    Результат render() для блока из кеша или рендер с сохранением.
+    parts — всё, от чего зависит результат (исходник блока, контекст ссылок и т. п.);
+    значение хранится как JSON.
+    """
+    cache = get_cache()
+    key = cache.key(stage, *parts)
+    cached = cache.get(key)
+    if cached is not None:
+        BLOCK_CACHE_LOOKUPS.inc(stage=stage, result="hit")
+        return json.loads(cached)
+    BLOCK_CACHE_LOOKUPS.inc(stage=stage, result="miss")
+    result = render()
+    cache.put(key, json.dumps(result, ensure_ascii=False, separators=(",", ":")))
+    return result
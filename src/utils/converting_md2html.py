@@ -1,20 +1,478 @@
-import sys
+import hashlib
+import os
+import re
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import markdown as mdlib
 
-from cli.logger_config import logger
+from utils.block_cache import memoize
 
+MD_EXTENSIONS = ["extra", "sane_lists"]
 
-def md_to_html(path: str) -> str:
+# Markdown любого размера конвертируется по блокам верхнего уровня с кешем.
+# Файлы больше порога, кроме того, не собираются в памяти целиком: HTML
+# блоков сразу идёт в дальнейший рендер (санитизация, узлы Telegraph, части поста)
+STREAM_THRESHOLD_BYTES = 1024 * 1024
+
+_FENCE_RE = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+_LIST_RE = re.compile(r"^\s{0,3}([*+-]|\d+[.)])\s")
+# Определения ссылок `[id]: url` (но не сносок `[^id]:`)
+_REF_DEF_RE = re.compile(r"^\s{0,3}\[(?!\^)[^\]]+\]:\s*\S")
+# Определения сносок `[^id]: текст` (с продолжением на строках с отступом)
+_FOOTNOTE_DEF_RE = re.compile(r"^\s{0,3}\[\^[^\]]+\]:")
+# Определения аббревиатур `*[HTML]: расшифровка`
+_ABBR_DEF_RE = re.compile(r"^\s{0,3}\*\[([^\]]+)\]:")
+_FOOTNOTE_DIV = '<div class="footnote">'
+_FOOTNOTE_REF_RE = re.compile(r'<sup id="fnref\d*:([^"]*)"')
+# Абзац-метка после блока: по разделителю перед ней видно, что документ
+# целиком ставит после блока (convert() обрезает пробелы на концах)
+_BLOCK_END = "mdpblockend7f3c"
+_BLOCK_END_HTML = f"<p>{_BLOCK_END}</p>"
+_QUOTE_RE = re.compile(r"^\s{0,3}>")
+# Строка определения в списке определений `: текст`
+_DEFINITION_RE = re.compile(r"^\s{0,3}:[ ]{1,3}\S")
+# Начало блочного HTML и комментария: внутри них пустые строки не разрывают блок
+_HTML_BLOCK_RE = re.compile(r"^\s{0,3}<([a-zA-Z][a-zA-Z0-9-]*)(?=[\s/>]|$)")
+_HTML_COMMENT_RE = re.compile(r"^\s{0,3}<!--")
+# (`<hr>` всегда пустой и блок не открывает)
+_HTML_BLOCK_TAGS = frozenset(mdlib.Markdown().block_level_elements) - {"hr"}
+# Включение файла: отдельная строка `{!snippets/footer.md!}` вне блока кода.
+# Путь считается от включающего файла, включения могут быть вложенными
+INCLUDE_RE = re.compile(r"^\s{0,3}\{!\s*(.+?)\s*!\}\s*$")
+MAX_INCLUDE_DEPTH = 16
+# Локальные изображения во включаемом файле: путь переписывается от корневого документа
+_IMAGE_SRC_RE = re.compile(
+    r"(!\[[^\]]*\]\(\s*<?)([^)\s>]+)|(<img\s[^>]*src=[\"'])([^\"']+)", re.IGNORECASE
+)
+
+
+class MarkdownSourceError(OSError):
+    """Файл Markdown не найден или не читается."""
+
+
+def _resolve_md_file(path: str) -> Path:
     try:
         md_file = Path(path).expanduser().resolve()
-        if not md_file.exists():
-            logger.error(f"Файл markdown не найден: {md_file}")
-            sys.exit(1)
-        md_text = md_file.read_text(encoding="utf-8")
-    except Exception as e:
-        logger.error(f"Ошибка открытия файла *.md: {e}")
-        sys.exit(1)
-
-    return mdlib.markdown(md_text, extensions=["extra", "sane_lists"])
+    except (OSError, RuntimeError) as e:
+        raise MarkdownSourceError(f"Ошибка открытия файла *.md: {e}") from e
+    if not md_file.is_file():
+        raise MarkdownSourceError(f"Файл markdown не найден: {md_file}")
+    return md_file
+
+
+def iter_include_refs(text: str) -> Iterator[str]:
+    """Пути из строк `{!path!}` вне fenced-кода (как записаны, без повторов)."""
+    seen = set()
+    in_fence = False
+    fence = ""
+    for line in text.splitlines():
+        m = _FENCE_RE.match(line)
+        if in_fence:
+            if m and m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence):
+                in_fence = False
+            continue
+        if m:
+            in_fence, fence = True, m.group(1)
+            continue
+        inc = INCLUDE_RE.match(line)
+        if inc and inc.group(1) not in seen:
+            seen.add(inc.group(1))
+            yield inc.group(1)
+
+
+def _rebase_images(line: str, src_dir: Path, root_dir: Path) -> str:
+    def repl(m: "re.Match[str]") -> str:
+        prefix = m.group(1) or m.group(3)
+        src = m.group(2) or m.group(4)
+        if "://" in src or src.startswith(("data:", "/", "#")):
+            return m.group(0)
+        rebased = os.path.relpath(os.path.normpath(src_dir / src), root_dir)
+        return prefix + Path(rebased).as_posix()
+
+    return _IMAGE_SRC_RE.sub(repl, line)
+
+
+def _expand(md_file: Path, root_dir: Path, stack: Tuple[Path, ...]) -> Iterator[str]:
+    in_fence = False
+    fence = ""
+    try:
+        f = md_file.open(encoding="utf-8")
+    except OSError as e:
+        raise MarkdownSourceError(f"Ошибка открытия файла *.md: {e}") from e
+    with f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    line += "\n"
+                m = _FENCE_RE.match(line)
+                if in_fence:
+                    if (
+                        m
+                        and m.group(1)[0] == fence[0]
+                        and len(m.group(1)) >= len(fence)
+                    ):
+                        in_fence = False
+                elif m:
+                    in_fence, fence = True, m.group(1)
+                elif inc := INCLUDE_RE.match(line):
+                    target = _resolve_include(md_file, inc.group(1), stack)
+                    yield from _expand(target, root_dir, stack + (target,))
+                    continue
+                if md_file.parent != root_dir and not in_fence:
+                    line = _rebase_images(line, md_file.parent, root_dir)
+                yield line
+        except UnicodeDecodeError as e:
+            raise MarkdownSourceError(f"Ошибка чтения {md_file}: {e}") from e
+
+
+def _resolve_include(md_file: Path, spec: str, stack: Tuple[Path, ...]) -> Path:
+    target = (md_file.parent / spec).expanduser().resolve()
+    if target in stack:
+        chain = " → ".join(p.name for p in stack + (target,))
+        raise MarkdownSourceError(f"Циклическое включение: {chain}")
+    if len(stack) > MAX_INCLUDE_DEPTH:
+        raise MarkdownSourceError(f"Слишком глубокая вложенность включений: {md_file}")
+    if not target.is_file():
+        raise MarkdownSourceError(f"Включаемый файл не найден: {spec} ({md_file})")
+    return target
+
+
+def iter_md_lines(path: str) -> Iterator[str]:
+    """
+    Строки Markdown-файла (с переводом строки на конце) с подставленными включениями `{!path!}`.
+    Ссылки на локальные изображения во включённых файлах переписываются
+    относительно path, поэтому рендер и загрузка ищут их в нужном месте.
+    """
+    md_file = _resolve_md_file(path)
+    yield from _expand(md_file, md_file.parent, (md_file,))
+
+
+def md_includes(path: str) -> List[Path]:
+    """Все файлы, включённые в документ, в том числе через вложенные включения."""
+    md_file = _resolve_md_file(path)
+    found: List[Path] = []
+    queue = [md_file]
+    while queue:
+        current = queue.pop(0)
+        try:
+            text = current.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            continue
+        for spec in iter_include_refs(text):
+            target = (current.parent / spec).expanduser().resolve()
+            if target != md_file and target not in found:
+                found.append(target)
+                queue.append(target)
+    return found
+
+
+def read_md_source(path: str) -> str:
+    """Текст Markdown-документа с подставленными включениями."""
+    return "".join(iter_md_lines(path))
+
+
+def md_to_html(path: str) -> str:
+    """
+    HTML всего документа. Конвертируется по блокам верхнего уровня
+    (iter_md_to_html) независимо от размера: правка одного раздела
+    перерендеривает только его, остальные блоки берутся из кеша.
+    """
+    return "\n".join(iter_md_to_html(path)).rstrip("\n")
+
+
+def is_large_md(path: str) -> bool:
+    """Нужно ли рендерить файл потоково, не держа весь HTML в памяти."""
+    try:
+        return Path(path).expanduser().stat().st_size > STREAM_THRESHOLD_BYTES
+    except OSError:
+        return False
+
+
+class _Definitions:
+    """
+    Определения, действующие на весь документ: ссылки, аббревиатуры и сноски.
+    Собираются первым проходом и подставляются в блоки, которые их используют.
+    """
+
+    def __init__(self) -> None:
+        self.refs: List[str] = []
+        self.abbrs: Dict[str, str] = {}  # термин → строка определения
+        self.footnotes: List[str] = []  # определения сносок с продолжениями
+
+    def context(self, block: str, footnotes: bool = True) -> str:
+        """Определения, нужные блоку: ссылки и сноски, если в нём есть `[`."""
+        parts: List[str] = []
+        if "[" in block:
+            parts.extend(self.refs)
+            if footnotes and "[^" in block and self.footnotes:
+                parts.append("\n\n".join(self.footnotes))
+        parts.extend(line for term, line in self.abbrs.items() if term in block)
+        return "\n".join(parts)
+
+
+class _Literal:
+    """
+    Отслеживает fenced-код, блочный HTML (`<div>` … `</div>`) и комментарии
+    `<!-- … -->`: их строки не Markdown, а пустые строки внутри них
+    не разрывают блок — Markdown тоже обрабатывает их целиком.
+    """
+
+    def __init__(self) -> None:
+        self.fence = ""
+        self.tag = ""  # открытый блочный тег или "--" для комментария
+        self.depth = 0
+
+    @property
+    def open(self) -> bool:
+        return bool(self.fence or self.tag)
+
+    def feed(self, line: str) -> bool:
+        """Учитывает строку; True — строка относится к коду или HTML."""
+        if self.fence:
+            m = _FENCE_RE.match(line)
+            if (
+                m
+                and m.group(1)[0] == self.fence[0]
+                and len(m.group(1)) >= len(self.fence)
+            ):
+                self.fence = ""
+            return True
+        if not self.tag:
+            if m := _FENCE_RE.match(line):
+                self.fence = m.group(1)
+                return True
+            m = _HTML_BLOCK_RE.match(line)
+            if _HTML_COMMENT_RE.match(line):
+                self.tag = "--"
+            elif m and m.group(1).lower() in _HTML_BLOCK_TAGS:
+                self.tag, self.depth = m.group(1).lower(), 0
+            else:
+                return False
+        if self.tag == "--":
+            if "-->" in line:
+                self.tag = ""
+            return True
+        tag = re.escape(self.tag)
+        self.depth += len(re.findall(rf"<{tag}(?=[\s/>]|$)", line, re.IGNORECASE))
+        self.depth -= len(re.findall(rf"<{tag}\b[^<>]*/>", line, re.IGNORECASE))
+        self.depth -= len(re.findall(rf"</{tag}\s*>", line, re.IGNORECASE))
+        if self.depth <= 0:
+            self.tag = ""
+        return True
+
+
+def _text_lines(block: str) -> Iterator[str]:
+    """Строки блока вне fenced-кода и блочного HTML."""
+    literal = _Literal()
+    for line in block.split("\n"):
+        if not literal.feed(line):
+            yield line
+
+
+def _split_footnotes(block: str) -> Tuple[str, List[str]]:
+    """
+    Отделяет от блока определения сносок `[^id]: ...`, где бы они ни стояли.
+    Определение продолжается до следующего определения сноски или пустой
+    строки (строки без отступа подхватываются лениво), а после пустой
+    строки — абзацами с отступом. Возвращает остаток блока и определения.
+    """
+    body: List[str] = []
+    notes: List[List[str]] = []
+    note: Optional[List[str]] = None
+    literal = _Literal()
+    blank = False
+    for line in block.split("\n"):
+        inside = literal.open
+        is_literal = literal.feed(line)
+        if inside:
+            (body if note is None else note).append(line)
+            continue
+        if not line.strip():
+            if note is None:
+                body.append(line)
+            blank = True
+            continue
+        if not is_literal and _FOOTNOTE_DEF_RE.match(line):
+            note = [line]
+            notes.append(note)
+        elif note is not None and (not blank or line[:1] in (" ", "\t")):
+            if blank:
+                note.append("")
+            note.append(line)
+        else:
+            if note is not None:
+                note = None
+                body.append("")
+            body.append(line)
+        blank = False
+    return "\n".join(body).strip("\n"), ["\n".join(n) for n in notes]
+
+
+def _is_definitions(block: str) -> bool:
+    """Блок состоит только из определений (сами по себе они ничего не выводят)."""
+    return all(
+        _REF_DEF_RE.match(line) or _ABBR_DEF_RE.match(line)
+        for line in block.splitlines()
+        if line.strip()
+    )
+
+
+def _collect_definitions(path: str) -> _Definitions:
+    """
+    Первый проход: собирает определения ссылок `[id]: url`, аббревиатур
+    `*[HTML]: ...` и сносок `[^id]: ...` (вне fenced-кода).
+    """
+    defs = _Definitions()
+    for block in iter_md_blocks(path):
+        defs.footnotes.extend(_split_footnotes(block)[1])
+        for line in _text_lines(block):
+            if _REF_DEF_RE.match(line):
+                defs.refs.append(line)
+            elif m := _ABBR_DEF_RE.match(line):
+                defs.abbrs[m.group(1)] = line
+    return defs
+
+
+def _iter_chunks(path: str) -> Iterator[List[str]]:
+    """Куски документа между пустыми строками вне кода и блочного HTML."""
+    chunk: List[str] = []
+    literal = _Literal()
+    for raw in iter_md_lines(path):
+        line = raw.rstrip("\n")
+        if not literal.open and not line.strip():
+            if chunk:
+                yield chunk
+                chunk = []
+            continue
+        literal.feed(line)
+        chunk.append(line)
+    if chunk:
+        yield chunk
+
+
+def _iter_units(path: str) -> Iterator[List[str]]:
+    """
+    Куски документа; куски из одних определений приклеены к предыдущему:
+    сами они ничего не выводят, и кусок после них продолжает тот же элемент.
+    """
+    unit: List[str] = []
+    for chunk in _iter_chunks(path):
+        if unit and _is_definitions(_split_footnotes("\n".join(chunk))[0]):
+            unit.append("")
+            unit.extend(chunk)
+            continue
+        if unit:
+            yield unit
+        unit = chunk
+    if unit:
+        yield unit
+
+
+def _continues(block: List[str], chunk: List[str], after: Optional[List[str]]) -> bool:
+    """
+    Продолжает ли кусок после пустой строки предыдущий блок: отступ (код,
+    продолжение списка или сноски), следующий пункт списка, цитата после
+    цитаты, определения `: ...` (термин или список определений выше)
+    и термин списка определений (его определение — следующий кусок after).
+    """
+    first = chunk[0]
+    if first[:1] in (" ", "\t"):
+        return True
+    if _LIST_RE.match(block[0]) and _LIST_RE.match(first):
+        return True
+    if _QUOTE_RE.match(first) and any(_QUOTE_RE.match(line) for line in block):
+        return True
+    if any(_DEFINITION_RE.match(line) for line in chunk):
+        return True
+    if (
+        after
+        and _DEFINITION_RE.match(after[0])
+        and any(_DEFINITION_RE.match(line) for line in block)
+    ):
+        return True
+    return False
+
+
+def iter_md_blocks(path: str) -> Iterator[str]:
+    """
+    Построчно читает Markdown и выдаёт блоки верхнего уровня.
+    Граница блока — пустая строка вне fenced-кода и блочного HTML;
+    куски, которые Markdown склеивает с предыдущими (см. _continues),
+    остаются в составе предыдущего блока.
+    """
+    chunks = _iter_units(path)
+    block: List[str] = []
+    chunk = next(chunks, None)
+    while chunk is not None:
+        after = next(chunks, None)
+        if block and _continues(block, chunk, after):
+            block.append("")
+            block.extend(chunk)
+        else:
+            if block:
+                yield "\n".join(block)
+            block = chunk
+        chunk = after
+    if block:
+        yield "\n".join(block)
+
+
+def iter_md_to_html(path: str) -> Iterator[str]:
+    """
+    Потоковая конвертация: Markdown-блок → HTML-фрагмент.
+    Пиковая память пропорциональна самому большому блоку, а не всему документу.
+    Блок конвертируется, только если его нет в кеше: ключ — текст блока
+    и хеш определений документа, которые ему нужны. Ссылки на сноски
+    рендерятся в своих блоках, а сами сноски — один раз, в конце,
+    как при конвертации документа целиком. Фрагменты, склеенные через
+    перевод строки, совпадают с HTML документа целиком.
+    """
+    defs = _collect_definitions(path)
+    md = mdlib.Markdown(extensions=MD_EXTENSIONS)
+
+    def render(text: str, context: str, open_end: bool = False) -> str:
+        source = f"{text}\n\n{context}" if context else text
+        if context and open_end:
+            # незакрытый HTML поглотил бы определения, поставленные после него
+            source = f"{context}\n\n{text}"
+        digest = hashlib.sha256(context.encode("utf-8")).hexdigest() if context else ""
+        return memoize("html", (text, digest), lambda: md.reset().convert(source))
+
+    refs: Dict[str, int] = {}  # сколько раз встретилась ссылка на сноску
+
+    def number_ref(m: "re.Match[str]") -> str:
+        n = refs[m.group(1)] = refs.get(m.group(1), 0) + 1
+        return f'<sup id="fnref{n if n > 1 else ""}:{m.group(1)}"'
+
+    for block in iter_md_blocks(path):
+        body = _split_footnotes(block)[0]
+        if _is_definitions(body):
+            continue
+        literal = _Literal()
+        for line in body.split("\n"):
+            literal.feed(line)
+        context = defs.context(body)
+        if literal.open:
+            html = render(body, context, open_end=True)
+        else:
+            html = render(f"{body}\n\n{_BLOCK_END}", context)
+        if context and _FOOTNOTE_DIV in html:
+            html = html[: html.rfind(_FOOTNOTE_DIV)].rstrip()
+            # повторные ссылки нумеруются по всему документу: fnref2, fnref3…
+            html = _FOOTNOTE_REF_RE.sub(number_ref, html)
+        end = html.rfind(_BLOCK_END_HTML)
+        if end >= 0:
+            # После сырого HTML документ целиком ставит пустую строку:
+            # фрагмент сохраняет её переводом строки на конце
+            html = html[:end]
+            html = html[:-1] if html.endswith("\n") else html
+        if html.strip():
+            yield html
+    if defs.footnotes:
+        footnotes = "\n\n".join(defs.footnotes)
+        # обратные ссылки сноски — по одной на каждую ссылку на неё
+        repeated = "".join(f"[^{ref}]" * n for ref, n in refs.items() if n > 1)
+        text = f"{repeated}\n\n{footnotes}" if repeated else footnotes
+        html = render(text, defs.context(footnotes, footnotes=False))
+        yield html[max(html.find(_FOOTNOTE_DIV), 0) :]
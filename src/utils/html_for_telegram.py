@@ -1,9 +1,12 @@
 import re
 from pathlib import Path
+from typing import Iterable, Iterator
 
 from bs4 import BeautifulSoup
 
-from utils.upload_img import upload_to_imgbb
+from utils.block_cache import has_local_images, memoize
+from utils.converting_md2html import is_large_md, iter_md_to_html, md_to_html
+from utils.upload_img import upload_image, uploads_enabled
 
 # -----------------------------------------------------
 # Основной санитайзер
@@ -22,7 +25,6 @@ ALLOWED_TAGS = {
     "code",
     "pre",
     "blockquote",
-    "br",
 }
 
 TAG_MAP = {
@@ -76,12 +78,12 @@ def sanitize_html_for_telegram(
             img.decompose()
             continue
 
-        # локальные файлы → загрузка на ImgBB
+        # локальные файлы → загрузка на хостинг изображений
         if not str(src).startswith("http"):
-            if imgbb_api_key:
+            if uploads_enabled(imgbb_api_key):
                 local_path = Path(f"{base_path}/{src}")
                 try:
-                    url = upload_to_imgbb(str(local_path), imgbb_api_key)
+                    url = upload_image(str(local_path), imgbb_api_key)
                     img.replace_with(f"\n{url}\n")
                 except Exception as e:
                     img.replace_with(f"[Ошибка загрузки изображения: {e}]")
@@ -90,6 +92,10 @@ def sanitize_html_for_telegram(
         else:
             img.replace_with(f"\n{src}\n")
 
+    # --- Переносы строк: <br> в Telegram HTML не поддерживается
+    for br in soup.find_all("br"):
+        br.replace_with("\n")
+
     # --- Очистка недопустимых тегов
     for tag in soup.find_all(True):
         if tag.name not in ALLOWED_TAGS:
@@ -105,3 +111,41 @@ def sanitize_html_for_telegram(
     text = str(soup)
     text = re.sub(r"\n{3,}", "\n\n", text)
     return text.strip()
+
+
+def iter_sanitize_html_for_telegram(
+    html_blocks: Iterable[str], base_path: str | Path, imgbb_api_key: str | None = None
+) -> Iterator[str]:
+    """
+    Потоковый вариант sanitize_html_for_telegram: санитизирует HTML по блокам,
+    не строя дерево всего документа. Результат блока кешируется, кроме блоков
+    с локальными изображениями, которые загружаются на хостинг.
+    """
+    for block in html_blocks:
+        if uploads_enabled(imgbb_api_key) and has_local_images(block):
+            text = sanitize_html_for_telegram(block, base_path, imgbb_api_key)
+        else:
+            text = memoize(
+                "telegram",
+                (block,),
+                lambda: sanitize_html_for_telegram(block, base_path, imgbb_api_key),
+            )
+        if text:
+            yield text
+
+
+def md_file_to_telegram_html(md_path: str, imgbb_api_key: str | None = None) -> str:
+    """
+    Markdown-файл → HTML для Telegram.
+    Большие файлы конвертируются потоково по блокам верхнего уровня.
+    """
+    if is_large_md(md_path):
+        return "\n".join(
+            iter_sanitize_html_for_telegram(
+                iter_md_to_html(md_path), base_path=md_path, imgbb_api_key=imgbb_api_key
+            )
+        )
+    html = md_to_html(md_path)
+    return sanitize_html_for_telegram(
+        html, base_path=md_path, imgbb_api_key=imgbb_api_key
+    )
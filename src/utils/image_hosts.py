@@ -0,0 +1,282 @@
+import abc
+import hashlib
+import logging
+import mimetypes
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Mapping, Optional, Sequence
+
+import requests
+
+from core.metrics import record_upload, track_request
+from core.retry import RetryPolicy, call_sync, cooldown_remaining, get_breaker
+
+logger = logging.getLogger(__name__)
+
+IMGBB_UPLOAD_URL = "https://api.imgbb.com/1/upload"
+TELEGRAPH_UPLOAD_URL = "https://telegra.ph/upload"
+
+# Один повтор внутри хостинга: дальше быстрее переключиться на другой
+HOST_RETRY_POLICY = RetryPolicy(max_attempts=2, base_delay=0.5, max_delay=2.0)
+
+
+class ImageHost(abc.ABC):
+    """
+    Хостинг изображений: загружает локальный файл и возвращает публичную ссылку.
+    service — имя для повторов, circuit breaker и метрик.
+    """
+
+    name = "host"
+
+    def __init__(
+        self, timeout: float = 60.0, session: Optional[requests.Session] = None
+    ) -> None:
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    @property
+    def service(self) -> str:
+        return f"imghost:{self.name}"
+
+    @abc.abstractmethod
+    def _post(self, file_path: str) -> Any:
+        """Загружает файл (один запрос, без повторов) и возвращает ссылку."""
+
+    def upload(self, file_path: str, retry_policy: Optional[RetryPolicy] = None) -> str:
+        def _call() -> str:
+            with track_request(self.service, "upload"):
+                return self._post(file_path)
+
+        url = call_sync(self.service, _call, retry_policy or HOST_RETRY_POLICY)
+        record_upload(self.name, Path(file_path).stat().st_size)
+        return url
+
+
+class ImgBBHost(ImageHost):
+    name = "imgbb"
+
+    def __init__(self, api_key: str, timeout: float = 60.0) -> None:
+        super().__init__(timeout)
+        self.api_key = api_key
+
+    def _post(self, file_path: str) -> str:
+        with open(file_path, "rb") as f:
+            resp = self.session.post(
+                IMGBB_UPLOAD_URL,
+                params={"key": self.api_key},
+                files={"image": f},
+                timeout=self.timeout,
+            )
+        if resp.status_code >= 500 or resp.status_code == 429:
+            resp.raise_for_status()
+        data = resp.json()
+        if not data.get("success"):
+            raise RuntimeError(f"Ошибка загрузки {file_path}: {data}")
+        return data["data"]["url"]
+
+
+class TelegraphHost(ImageHost):
+    """Загрузка на telegra.ph (без токена; jpg, png, gif, mp4 до 5 МБ)."""
+
+    name = "telegraph"
+
+    def _post(self, file_path: str) -> str:
+        with open(file_path, "rb") as f:
+            resp = self.session.post(
+                TELEGRAPH_UPLOAD_URL, files={"file": f}, timeout=self.timeout
+            )
+        resp.raise_for_status()
+        data = resp.json()
+        if isinstance(data, list) and data and "src" in data[0]:
+            return "https://telegra.ph" + data[0]["src"]
+        raise RuntimeError(f"Telegraph upload error: {data}")
+
+
+class HTTPHost(ImageHost):
+    """
+    S3-совместимое или любое HTTP-хранилище: файл отправляется PUT по адресу
+    <upload_url>/<ключ>, ссылка — <public_url>/<ключ>. Ключ — хеш содержимого,
+    поэтому повторная загрузка того же файла перезаписывает тот же объект.
+    Подходит бакет с публичной записью или подписывающий прокси (MinIO, R2,
+    nginx с WebDAV); если сервер вернул JSON с url, используется он.
+    """
+
+    name = "http"
+
+    def __init__(
+        self,
+        upload_url: str,
+        public_url: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: float = 60.0,
+        name: str = "http",
+    ) -> None:
+        super().__init__(timeout)
+        self.upload_url = upload_url.rstrip("/")
+        self.public_url = (public_url or upload_url).rstrip("/")
+        self.headers = dict(headers or {})
+        self.name = name
+
+    @staticmethod
+    def object_key(file_path: str) -> str:
+        path = Path(file_path)
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()[:32]
+        return digest + path.suffix.lower()
+
+    def _post(self, file_path: str) -> str:
+        key = self.object_key(file_path)
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        with open(file_path, "rb") as f:
+            resp = self.session.put(
+                f"{self.upload_url}/{key}",
+                data=f,
+                headers={"Content-Type": content_type, **self.headers},
+                timeout=self.timeout,
+            )
+        resp.raise_for_status()
+        if "json" in resp.headers.get("Content-Type", ""):
+            url = resp.json().get("url")
+            if url:
+                return url
+        return f"{self.public_url}/{key}"
+
+
+class HostStats:
+    """Скользящая статистика хостинга: EWMA задержки и доля ошибок в окне."""
+
+    def __init__(self, window: int = 20, alpha: float = 0.3) -> None:
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.last_used = 0.0
+
+    def record(self, ok: bool, elapsed: float) -> None:
+        self.outcomes.append(ok)
+        self.last_used = time.monotonic()
+        if ok:
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency = self.alpha * elapsed + (1 - self.alpha) * self.latency
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class ImageHostSelector:
+    """
+    Выбирает хостинг для каждой загрузки: сначала здоровые (breaker замкнут,
+    нет retry_after, доля ошибок не выше max_error_rate) в порядке средней
+    задержки; ещё не опробованные хостинги считаются самыми быстрыми, чтобы
+    каждый был измерен. Хостинг с частыми ошибками снова пробуется, если к нему
+    не обращались probe_interval секунд. При ошибке загрузка сразу повторяется
+    на следующем.
+    """
+
+    def __init__(
+        self,
+        hosts: Sequence[ImageHost],
+        max_error_rate: float = 0.5,
+        window: int = 20,
+        probe_interval: float = 60.0,
+    ) -> None:
+        if not hosts:
+            raise ValueError("Не задан ни один хостинг изображений")
+        self.hosts = list(hosts)
+        self.max_error_rate = max_error_rate
+        self.probe_interval = probe_interval
+        self.stats: Dict[str, HostStats] = {
+            h.service: HostStats(window) for h in self.hosts
+        }
+        self._lock = threading.Lock()
+
+    def ranked(self) -> List[ImageHost]:
+        def score(item: tuple[int, ImageHost]) -> tuple[bool, bool, float, int]:
+            i, host = item
+            stats = self.stats[host.service]
+            blocked = (
+                cooldown_remaining(host.service) > 0
+                or get_breaker(host.service).state == "open"
+            )
+            failing = (
+                stats.error_rate > self.max_error_rate
+                and time.monotonic() - stats.last_used < self.probe_interval
+            )
+            return (
+                blocked,
+                failing,
+                stats.latency or 0.0,
+                i,
+            )
+
+        with self._lock:
+            return [host for _, host in sorted(enumerate(self.hosts), key=score)]
+
+    def upload(self, file_path: str) -> str:
+        errors: List[str] = []
+        for host in self.ranked():
+            start = time.perf_counter()
+            try:
+                url = host.upload(file_path)
+            except Exception as e:
+                with self._lock:
+                    self.stats[host.service].record(False, time.perf_counter() - start)
+                logger.warning("Хостинг %s не принял %s: %s", host.name, file_path, e)
+                errors.append(f"{host.name}: {e}")
+                continue
+            with self._lock:
+                self.stats[host.service].record(True, time.perf_counter() - start)
+            return url
+        raise RuntimeError(f"Не удалось загрузить {file_path}: {'; '.join(errors)}")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Текущая статистика по хостингам (для логов и отладки)."""
+        with self._lock:
+            return {
+                host.name: {
+                    "latency": self.stats[host.service].latency,
+                    "error_rate": self.stats[host.service].error_rate,
+                    "breaker": get_breaker(host.service).state,
+                }
+                for host in self.hosts
+            }
+
+
+def build_hosts(
+    names: Sequence[str],
+    imgbb_api_key: Optional[str] = None,
+    http_upload_url: Optional[str] = None,
+    http_public_url: Optional[str] = None,
+    http_token: Optional[str] = None,
+) -> List[ImageHost]:
+    """
+    Хостинги по именам (imgbb, telegraph, http) в порядке предпочтения.
+    http_token передаётся хостингу http как Authorization: Bearer.
+    Хостинги без нужных настроек пропускаются с предупреждением.
+    """
+    hosts: List[ImageHost] = []
+    for name in names:
+        name = name.strip().lower()
+        if name == "imgbb":
+            if imgbb_api_key:
+                hosts.append(ImgBBHost(imgbb_api_key))
+            else:
+                logger.debug("Хостинг imgbb пропущен: не задан IMGBB_API_KEY")
+        elif name == "telegraph":
+            hosts.append(TelegraphHost())
+        elif name == "http":
+            if http_upload_url:
+                headers = (
+                    {"Authorization": f"Bearer {http_token}"} if http_token else {}
+                )
+                hosts.append(HTTPHost(http_upload_url, http_public_url, headers))
+            else:
+                logger.warning("Хостинг http пропущен: не задан адрес загрузки")
+        elif name:
+            logger.warning("Неизвестный хостинг изображений: %s", name)
+    return hosts
@@ -0,0 +1,59 @@
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+
+def save_manifest(path: str | Path, data: Dict[str, Any]) -> Path:
+    """
+    Сохраняет манифест публикации (JSON) и возвращает путь к нему.
+    К данным добавляется время создания.
+    """
+    out = Path(path).expanduser()
+    out.parent.mkdir(parents=True, exist_ok=True)
+    payload = {"created_at": datetime.now().isoformat(timespec="seconds"), **data}
+    out.write_text(
+        json.dumps(payload, ensure_ascii=False, indent=2, default=str),
+        encoding="utf-8",
+    )
+    return out
+
+
+def load_manifest(path: str | Path) -> Dict[str, Any]:
+    """Читает ранее сохранённый манифест."""
+    return json.loads(Path(path).expanduser().read_text(encoding="utf-8"))
+
+
+def update_manifest_thread(
+    path: str | Path, md_path: str, chat_id: Union[int, str], thread: List[int]
+) -> bool:
+    """
+    Записывает новую цепочку сообщений (после правки она могла вырасти
+    или сократиться) в запись манифеста md_path, в том числе в пакетном
+    манифесте. False — подходящей записи нет.
+    """
+    out = Path(path).expanduser()
+    data = load_manifest(out)
+    records = data.get("publications") if isinstance(data, dict) else None
+    if not isinstance(records, list):
+        records = [data]
+    chat = str(chat_id)
+    updated = False
+    for record in records:
+        messages = record.get("messages") or {}
+        if record.get("md_path") != md_path or messages.get(chat) != thread[0]:
+            continue
+        threads = record.setdefault("threads", {})
+        if len(thread) > 1:
+            threads[chat] = thread
+        else:
+            threads.pop(chat, None)
+        if not threads:
+            del record["threads"]
+        updated = True
+    if updated:
+        out.write_text(
+            json.dumps(data, ensure_ascii=False, indent=2, default=str),
+            encoding="utf-8",
+        )
+    return updated
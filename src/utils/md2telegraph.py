@@ -1,19 +1,17 @@
 import html as html_module
+import logging
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
 
 from bs4 import BeautifulSoup, Tag
 from bs4.element import NavigableString, PageElement
-from rich.console import Console
-from rich.progress import track
 
-from cli.logger_config import logger
-from config import settings
-from utils.converting_md2html import md_to_html
+from utils.block_cache import has_local_images, memoize
+from utils.converting_md2html import is_large_md, iter_md_to_html, md_to_html
 from utils.extract_from_h1 import extract_title
-from utils.upload_img import upload_to_imgbb
+from utils.upload_img import upload_image, uploads_enabled
 
-console = Console()
+logger = logging.getLogger(__name__)
 
 # Разрешённые теги Telegraph (упрощённый набор)
 ALLOWED_TAGS = {
@@ -120,9 +118,8 @@ def _nodes_from_element(el: PageElement) -> List[Node]:
     return [node]
 
 
-def html_to_telegraph_nodes(html: str) -> List[Node]:
-    """Конвертирует HTML-фрагмент (строка) в список telegraph-узлов."""
-    soup = BeautifulSoup(html, "html.parser")
+def soup_to_telegraph_nodes(soup: BeautifulSoup) -> List[Node]:
+    """Конвертирует уже разобранный документ BS в список telegraph-узлов."""
     result: List[Node] = []
 
     # Проходим по верхнему уровню. Если есть body — используем body.contents
@@ -132,52 +129,121 @@ def html_to_telegraph_nodes(html: str) -> List[Node]:
     return result
 
 
+def html_to_telegraph_nodes(html: str) -> List[Node]:
+    """Конвертирует HTML-фрагмент (строка) в список telegraph-узлов."""
+    return soup_to_telegraph_nodes(BeautifulSoup(html, "html.parser"))
+
+
+def _find_local_images(soup: BeautifulSoup, md_dir: Path) -> List[tuple[Tag, Path]]:
+    """Находит локальные изображения документа (пропуская несуществующие)."""
+    found: List[tuple[Tag, Path]] = []
+    for img in soup.find_all("img"):
+        src = img.get("src", "")
+        if src and not str(src).startswith("http"):
+            local_path = Path(f"{md_dir}/{src}").resolve()
+            if not local_path.exists():
+                logger.warning("Пропущено: не найдено изображение %s", local_path)
+                continue
+            found.append((img, local_path))
+    return found
+
+
+def _upload_images(
+    images: Iterable[tuple[Tag, Path]], imgbb_api_key: Optional[str]
+) -> None:
+    """Загружает изображения на хостинг и подменяет src в тегах."""
+    for img_tag, local_path in images:
+        try:
+            new_url = upload_image(str(local_path), imgbb_api_key)
+            img_tag["src"] = new_url
+            logger.info("Загружено %s → %s", local_path, new_url)
+        except Exception as e:
+            logger.error("Ошибка загрузки %s: %s", local_path, e)
+
+
 def markdown_to_telegraph_nodes(
     md_path: str,
-    imgbb_api_key: Optional[str] = settings.IMGBB_API_KEY,
+    imgbb_api_key: Optional[str] = None,
+    upload: bool = True,
 ) -> tuple[List[Node], Optional[str]]:
     """
-    Markdown -> HTML -> загрузка локальных img на ImgBB -> замена src -> Telegraph nodes.
+    Markdown -> HTML -> загрузка локальных img на хостинг -> замена src -> Telegraph nodes.
+    upload=False оставляет локальные src как есть (для сравнения, не для публикации).
     """
+    if is_large_md(md_path):
+        title: Optional[str] = None
+        nodes: List[Node] = []
+        for block_nodes, block_title in iter_markdown_to_telegraph_nodes(
+            md_path, imgbb_api_key, upload
+        ):
+            title = title or block_title
+            nodes.extend(block_nodes)
+        if not nodes:
+            raise RuntimeError("Нет данных для публикации")
+        return nodes, title
+
     # 1) Markdown -> HTML
     html = md_to_html(md_path)
     title, html = extract_title(html)
     soup = BeautifulSoup(html, "html.parser")
 
     # 2) Найти локальные изображения
-    local_imgs: List[Path] = []
-    img_tags: List[Tag] = []
     md_dir = Path(md_path).parent if md_path else Path(".")
-
-    for img in soup.find_all("img"):
-        src = img.get("src", "")
-        if src and not str(src).startswith("http"):
-            local_path = Path(f"{md_dir}/{src}").resolve()
-            if not local_path.exists():
-                logger.warning("Пропущено: не найдено изображение %s", local_path)
-                continue
-            local_imgs.append(local_path)
-            img_tags.append(img)
-
-    # 3) Загрузка на ImgBB
-    if local_imgs:
-        if not imgbb_api_key:
-            raise RuntimeError("ImgBB API key не задан")
-        print(
-            f"📤 Найдено {len(local_imgs)} локальных изображений, загружаем на ImgBB..."
-        )
-        for img_tag, local_path in zip(
-            img_tags, track(local_imgs, description="Uploading")
-        ):
-            try:
-                new_url = upload_to_imgbb(str(local_path), imgbb_api_key)
-                img_tag["src"] = new_url
-                logger.info("Загружено %s → %s", local_path, new_url)
-            except Exception as e:
-                logger.error("Ошибка загрузки %s: %s", local_path, e)
-
-    # 4) HTML -> Telegraph nodes
-    nodes = html_to_telegraph_nodes(str(soup))
+    images = _find_local_images(soup, md_dir)
+
+    # 3) Загрузка на хостинг изображений
+    if images and upload:
+        if not uploads_enabled(imgbb_api_key):
+            raise RuntimeError(
+                "Не задан хостинг изображений (IMGBB_API_KEY или MDP_IMAGE_HOSTS)"
+            )
+        logger.info("Найдено %s локальных изображений, загрузка", len(images))
+        _upload_images(images, imgbb_api_key)
+
+    # 4) HTML -> Telegraph nodes (используем уже разобранное дерево)
+    nodes = soup_to_telegraph_nodes(soup)
     if not nodes:
         raise RuntimeError("Нет данных для публикации")
     return nodes, title
+
+
+def _block_nodes(
+    html: str, md_dir: Path, imgbb_api_key: Optional[str], upload: bool = True
+) -> List[Node]:
+    soup = BeautifulSoup(html, "html.parser")
+    images = _find_local_images(soup, md_dir)
+    if images and upload:
+        if not uploads_enabled(imgbb_api_key):
+            raise RuntimeError(
+                "Не задан хостинг изображений (IMGBB_API_KEY или MDP_IMAGE_HOSTS)"
+            )
+        _upload_images(images, imgbb_api_key)
+    return soup_to_telegraph_nodes(soup)
+
+
+def iter_markdown_to_telegraph_nodes(
+    md_path: str,
+    imgbb_api_key: Optional[str] = None,
+    upload: bool = True,
+) -> Iterator[tuple[List[Node], Optional[str]]]:
+    """
+    Потоковый вариант markdown_to_telegraph_nodes: выдаёт (nodes, title) по блокам.
+    title не None только для блока, из которого извлечён заголовок страницы.
+    Каждый HTML-блок разбирается BeautifulSoup не более одного раза; узлы блоков
+    без загружаемых изображений берутся из кеша.
+    """
+    md_dir = Path(md_path).parent if md_path else Path(".")
+    title_found = False
+    for html in iter_md_to_html(md_path):
+        title: Optional[str] = None
+        if not title_found:
+            title, html = extract_title(html)
+            title_found = title is not None
+        if upload and has_local_images(html):
+            nodes = _block_nodes(html, md_dir, imgbb_api_key)
+        else:
+            nodes = memoize(
+                "telegraph", (html,), lambda: _block_nodes(html, md_dir, None, False)
+            )
+        if nodes or title:
+            yield nodes, title
@@ -0,0 +1,61 @@
+from itertools import chain, islice
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+
+def _parse_token(token: str) -> List[range]:
+    """Разбирает одиночный ID (`123`) или диапазон (`100-250`)."""
+    token = token.strip()
+    if not token:
+        return []
+    if "-" in token:
+        start_s, end_s = token.split("-", 1)
+        start, end = int(start_s), int(end_s)
+        if start > end:
+            start, end = end, start
+        return [range(start, end + 1)]
+    return [range(int(token), int(token) + 1)]
+
+
+def parse_message_ranges(specs: Iterable[str]) -> List[range]:
+    """
+    Как parse_message_ids, но без разворачивания диапазонов: отсортированные
+    непересекающиеся диапазоны ID (`1-1000000` остаётся одним range).
+    """
+    ranges: List[range] = []
+    for spec in specs:
+        path = Path(spec).expanduser()
+        if path.is_file():
+            for line in path.read_text(encoding="utf-8").splitlines():
+                line = line.split("#", 1)[0]
+                for token in line.replace(",", " ").split():
+                    ranges.extend(_parse_token(token))
+            continue
+        for token in spec.split(","):
+            try:
+                ranges.extend(_parse_token(token))
+            except ValueError:
+                raise ValueError(f"Некорректный ID или диапазон: {token!r}")
+    merged: List[range] = []
+    for r in sorted(ranges, key=lambda r: r.start):
+        if merged and r.start <= merged[-1].stop:
+            last = merged.pop()
+            r = range(last.start, max(last.stop, r.stop))
+        merged.append(r)
+    return merged
+
+
+def parse_message_ids(specs: Iterable[str]) -> List[int]:
+    """
+    Преобразует список спецификаций в отсортированный список уникальных ID.
+    Поддерживаются: `123`, `1,2,3`, `100-250` и пути к файлам с ID
+    (по одному ID / диапазону на строку, `#` — комментарий).
+    """
+    return list(chain.from_iterable(parse_message_ranges(specs)))
+
+
+def chunked(items: Iterable[int], size: int) -> Iterator[List[int]]:
+    """Лениво делит последовательность на части не длиннее size."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -3,7 +3,7 @@ from pathlib import Path
 
 from bs4 import BeautifulSoup
 
-from utils.upload_img import upload_to_imgbb
+from utils.upload_img import upload_image, uploads_enabled
 
 # -----------------------------------------------------
 # Основной санитайзер
@@ -76,12 +76,12 @@ def sanitize_html_for_telegram(
             img.decompose()
             continue
 
-        # локальные файлы → загрузка на ImgBB
+        # локальные файлы → загрузка на хостинг изображений
         if not str(src).startswith("http"):
-            if imgbb_api_key:
+            if uploads_enabled(imgbb_api_key):
                 local_path = Path(f"{base_path}/{src}")
                 try:
-                    url = upload_to_imgbb(str(local_path), imgbb_api_key)
+                    url = upload_image(str(local_path), imgbb_api_key)
                     img.replace_with(f"\n{url}\n")
                 except Exception as e:
                     img.replace_with(f"[Ошибка загрузки изображения: {e}]")
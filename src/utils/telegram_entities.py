@@ -0,0 +1,356 @@
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, Comment, Tag
+from bs4.element import NavigableString
+from telegram import Chat, Message, MessageEntity
+
+from utils.converting_md2html import is_large_md, iter_md_to_html, md_to_html
+from utils.upload_img import upload_image, uploads_enabled
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Bot API считаются в UTF-16 code units (так же, как offset/length сущностей)
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+ENTITY_TYPES = {
+    "b": MessageEntity.BOLD,
+    "strong": MessageEntity.BOLD,
+    "h1": MessageEntity.BOLD,
+    "h2": MessageEntity.BOLD,
+    "h3": MessageEntity.BOLD,
+    "h4": MessageEntity.BOLD,
+    "h5": MessageEntity.BOLD,
+    "h6": MessageEntity.BOLD,
+    "i": MessageEntity.ITALIC,
+    "em": MessageEntity.ITALIC,
+    "u": MessageEntity.UNDERLINE,
+    "ins": MessageEntity.UNDERLINE,
+    "s": MessageEntity.STRIKETHROUGH,
+    "strike": MessageEntity.STRIKETHROUGH,
+    "del": MessageEntity.STRIKETHROUGH,
+    "code": MessageEntity.CODE,
+    "pre": MessageEntity.PRE,
+    "blockquote": MessageEntity.BLOCKQUOTE,
+}
+
+
+def utf16_len(text: str) -> int:
+    """Длина строки в UTF-16 code units (символы вне BMP, например эмодзи, — две)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def utf16_offsets(text: str) -> List[int]:
+    """offsets[i] — смещение i-го символа строки в UTF-16 (длина len(text) + 1)."""
+    offsets = [0] * (len(text) + 1)
+    for i, ch in enumerate(text):
+        offsets[i + 1] = offsets[i] + (2 if ord(ch) > 0xFFFF else 1)
+    return offsets
+
+
+def _moved(entity: MessageEntity, offset: int, length: int) -> MessageEntity:
+    return MessageEntity(
+        entity.type,
+        offset,
+        length,
+        url=entity.url,
+        user=entity.user,
+        language=entity.language,
+        custom_emoji_id=entity.custom_emoji_id,
+    )
+
+
+@dataclass(frozen=True)
+class TelegramText:
+    """Текст сообщения и его разметка сущностями — без HTML и parse_mode."""
+
+    text: str
+    entities: Tuple[MessageEntity, ...] = ()
+
+    @property
+    def utf16_length(self) -> int:
+        return utf16_len(self.text)
+
+    def __add__(self, suffix: str) -> "TelegramText":
+        """Дописывает обычный текст в конец (например, ID сообщения)."""
+        return TelegramText(self.text + suffix, self.entities)
+
+    def concat(self, other: "TelegramText", sep: str = "") -> "TelegramText":
+        """Склеивает два текста через sep, сдвигая сущности второго."""
+        shift = utf16_len(self.text + sep)
+        moved = (_moved(e, e.offset + shift, e.length) for e in other.entities)
+        return TelegramText(self.text + sep + other.text, self.entities + tuple(moved))
+
+    def slice(
+        self, start: int, end: int, offsets: Optional[List[int]] = None
+    ) -> "TelegramText":
+        """
+        Часть текста [start, end) в индексах строки. Сущности на границе
+        обрезаются и остаются в обеих частях. offsets — готовый utf16_offsets(text).
+        """
+        offsets = offsets or utf16_offsets(self.text)
+        lo, hi = offsets[start], offsets[end]
+        entities = []
+        for e in self.entities:
+            s, t = max(e.offset, lo), min(e.offset + e.length, hi)
+            if t > s:
+                entities.append(_moved(e, s - lo, t - s))
+        return TelegramText(self.text[start:end], tuple(entities))
+
+    def to_html(self) -> str:
+        """HTML-представление (так же его строит python-telegram-bot для text_html)."""
+        message = Message(
+            0,
+            datetime.fromtimestamp(0, timezone.utc),
+            Chat(0, Chat.PRIVATE),
+            text=self.text,
+            entities=self.entities,
+        )
+        return message.text_html
+
+    def to_payload(self) -> Dict[str, Any]:
+        return {"text": self.text, "entities": [e.to_dict() for e in self.entities]}
+
+    @classmethod
+    def from_payload(cls, data: Dict[str, Any]) -> "TelegramText":
+        entities = tuple(
+            MessageEntity.de_json(e, None) for e in data.get("entities") or []
+        )
+        return cls(data["text"], tuple(e for e in entities if e is not None))
+
+
+class _Builder:
+    """
+    Накапливает текст и сущности. Смещения считаются в индексах Python-строки
+    и переводятся в UTF-16 один раз в build().
+    Пустые строки схлопываются так же, как в HTML-режиме (не больше одной подряд).
+    """
+
+    def __init__(self) -> None:
+        self.parts: List[str] = []
+        self.length = 0
+        self.newlines = 0  # сколько \n подряд в конце текста
+        self.spans: List[Tuple[str, int, int, Dict[str, str]]] = []
+        # Сколько символов уже отдано drain() и последний из них
+        self.base = 0
+        self.last = ""
+
+    def last_char(self) -> str:
+        return self.parts[-1][-1] if self.parts else self.last
+
+    def write(self, text: str, raw: bool = False) -> None:
+        if not self.length:
+            text = text.lstrip()
+        if not text:
+            return
+        if not raw:
+            # Не больше двух \n подряд, в том числе на стыке с уже записанным
+            lead = len(text) - len(text.lstrip("\n"))
+            keep = min(lead, max(0, 2 - self.newlines))
+            text = "\n" * keep + re.sub(r"\n{3,}", "\n\n", text[lead:])
+            if not text:
+                return
+        self.parts.append(text)
+        self.length += len(text)
+        stripped = text.rstrip("\n")
+        trailing = len(text) - len(stripped)
+        self.newlines = self.newlines + trailing if not stripped else trailing
+
+    def trim_spaces(self) -> None:
+        """Убирает пробелы в конце текущей строки."""
+        while self.parts and self.parts[-1].endswith(" "):
+            last = self.parts[-1].rstrip(" ")
+            self.length -= len(self.parts[-1]) - len(last)
+            if last:
+                self.parts[-1] = last
+            else:
+                self.parts.pop()
+
+    def span(self, kind: str, start: int, **extra: str) -> None:
+        if self.length > start:
+            self.spans.append((kind, start, self.length, extra))
+
+    def build(self) -> TelegramText:
+        return self._text("".join(self.parts).rstrip())
+
+    def drain(self) -> TelegramText:
+        """
+        Текст, записанный после прошлого drain(), вместе с переводами строк
+        перед ним. Хвостовые переводы строк остаются в буфере и отделят
+        следующий блок так же, как при сборке целиком.
+        """
+        written = "".join(self.parts)
+        body = written.rstrip()
+        result = self._text(body)
+        tail = written[len(body) :]
+        self.parts = [tail] if tail else []
+        self.base += len(body)
+        self.last = body[-1:] or self.last
+        self.spans = []
+        return result
+
+    def _text(self, text: str) -> TelegramText:
+        offsets = utf16_offsets(text)
+        entities: List[MessageEntity] = []
+        for kind, start, end, extra in self.spans:
+            start, end = start - self.base, min(end - self.base, len(text))
+            # Пробелы и переводы строк по краям сущности не размечаем
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            if end > start:
+                entities.append(
+                    MessageEntity(
+                        kind,
+                        offsets[start],
+                        offsets[end] - offsets[start],
+                        url=extra.get("url"),
+                        language=extra.get("language"),
+                    )
+                )
+        entities.sort(key=lambda e: (e.offset, -e.length))
+        return TelegramText(text, tuple(entities))
+
+
+class _Converter:
+    def __init__(self, base_dir: Path, imgbb_api_key: Optional[str]) -> None:
+        self.base_dir = base_dir
+        self.imgbb_api_key = imgbb_api_key
+        self.out = _Builder()
+
+    def _image(self, img: Tag) -> str:
+        src = str(img.get("src") or "")
+        if not src:
+            return ""
+        if src.startswith("http"):
+            return f"\n{src}\n"
+        if not uploads_enabled(self.imgbb_api_key):
+            return f"[локальное изображение: {src}]"
+        try:
+            url = upload_image(str(self.base_dir / src), self.imgbb_api_key)
+            return f"\n{url}\n"
+        except Exception as e:
+            return f"[Ошибка загрузки изображения: {e}]"
+
+    def walk(self, node: Tag, inline: bool = False, in_pre: bool = False) -> None:
+        out = self.out
+        for child in node.children:
+            if isinstance(child, Comment):
+                continue
+            if isinstance(child, NavigableString):
+                text = str(child)
+                if inline:
+                    text = re.sub(r"\s+", " ", text)
+                    if out.last_char() in (" ", "\n", ""):
+                        text = text.lstrip(" ")
+                out.write(text, raw=in_pre)
+                continue
+            if not isinstance(child, Tag):
+                continue
+            name = child.name
+            if name == "br":
+                out.write("\n")
+            elif name == "img":
+                out.write(self._image(child))
+            elif name in ("ul", "ol"):
+                self.list(child, depth=0)
+            elif name == "li":
+                self.walk(child, inline=True)
+            else:
+                kind = ENTITY_TYPES.get(name)
+                extra: Dict[str, str] = {}
+                if name == "a":
+                    href = str(child.get("href") or "")
+                    kind = MessageEntity.TEXT_LINK if href else None
+                    if href:
+                        extra["url"] = href
+                elif name == "code" and in_pre:
+                    kind = None  # язык и разметку задаёт <pre>
+                elif name == "pre":
+                    code = child.find("code")
+                    classes = code.get("class") or [] if isinstance(code, Tag) else []
+                    for cls in classes:
+                        if cls.startswith("language-"):
+                            extra["language"] = cls.removeprefix("language-")
+                start = out.length
+                self.walk(child, inline=inline, in_pre=in_pre or name == "pre")
+                if kind:
+                    out.span(kind, start, **extra)
+
+    def list(self, tag: Tag, depth: int) -> None:
+        """Списки — строками «• текст» / «1. текст», вложенные — с отступом."""
+        out = self.out
+        number = int(str(tag.get("start") or 1)) if tag.name == "ol" else 0
+        for li in tag.find_all("li", recursive=False):
+            out.trim_spaces()
+            if out.length and out.last_char() != "\n":
+                out.write("\n")
+            prefix = f"{number}. " if number else "• "
+            out.write("  " * depth + prefix, raw=True)
+            number += 1 if number else 0
+            for child in li.children:
+                if isinstance(child, Tag) and child.name in ("ul", "ol"):
+                    self.list(child, depth + 1)
+                else:
+                    wrapper = BeautifulSoup("", "html.parser")
+                    wrapper.append(child.__copy__())
+                    self.walk(wrapper, inline=True)
+            out.trim_spaces()
+
+
+def html_to_telegram_text(
+    html_blocks: List[str], base_dir: Path, imgbb_api_key: Optional[str] = None
+) -> TelegramText:
+    """HTML, полученный из Markdown, → текст и сущности Telegram."""
+    converter = _Converter(base_dir, imgbb_api_key)
+    for i, html in enumerate(html_blocks):
+        if i:
+            converter.out.write("\n")
+        converter.walk(BeautifulSoup(html, "html.parser"))
+    return converter.out.build()
+
+
+def iter_html_to_telegram_text(
+    html_blocks: Iterable[str], base_dir: Path, imgbb_api_key: Optional[str] = None
+) -> Iterator[TelegramText]:
+    """
+    Потоковый вариант html_to_telegram_text: TelegramText по блокам.
+    Текст блока начинается с переводов строк, отделяющих его от предыдущего,
+    поэтому склейка блоков без разделителя совпадает с конвертацией целиком.
+    """
+    converter = _Converter(base_dir, imgbb_api_key)
+    for i, html in enumerate(html_blocks):
+        if i:
+            converter.out.write("\n")
+        converter.walk(BeautifulSoup(html, "html.parser"))
+        text = converter.out.drain()
+        if text.text.strip():
+            yield text
+
+
+def md_file_to_telegram_text(
+    md_path: str, imgbb_api_key: Optional[str] = None
+) -> TelegramText:
+    """
+    Markdown-файл → текст и MessageEntity для отправки без parse_mode.
+    Большие файлы конвертируются потоково по блокам верхнего уровня.
+    """
+    base_dir = Path(md_path).expanduser().parent
+    blocks = list(iter_md_to_html(md_path)) if is_large_md(md_path) else None
+    result = html_to_telegram_text(
+        blocks or [md_to_html(md_path)], base_dir, imgbb_api_key
+    )
+    if result.utf16_length > MESSAGE_LIMIT:
+        logger.warning(
+            "Сообщение %s длиннее лимита Telegram: %s из %s (UTF-16)",
+            md_path,
+            result.utf16_length,
+            MESSAGE_LIMIT,
+        )
+    return result
@@ -0,0 +1,262 @@
+import html
+import re
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from utils.telegram_entities import (
+    MESSAGE_LIMIT,
+    TelegramText,
+    utf16_len,
+    utf16_offsets,
+)
+
+Part = Union[str, TelegramText]
+
+_TOKEN_RE = re.compile(r"(<[^>]*>)|([^<]+)")
+_TAG_NAME_RE = re.compile(r"</?\s*([a-zA-Z][\w-]*)")
+_LINE_RE = re.compile(r"[^\n]*\n|[^\n]+")
+# Разделитель блоков HTML-сообщения (блоки TelegramText несут разделитель сами)
+HTML_SEP = "\n"
+
+
+def html_text_length(text: str) -> int:
+    """Длина HTML-сообщения, как её считает Telegram: видимый текст в UTF-16."""
+    return sum(
+        utf16_len(html.unescape(chunk)) for _, chunk in _TOKEN_RE.findall(text) if chunk
+    )
+
+
+def _best_cut(text: str, start: int, end: int) -> int:
+    """
+    Граница части в text[start:end]: после пустой строки, иначе после перевода
+    строки, иначе после пробела — но не раньше середины, чтобы части не мельчали.
+    -1, если подходящей границы нет.
+    """
+    floor = start + (end - start) // 2
+    for sep in ("\n\n", "\n", " "):
+        i = text.rfind(sep, floor, end)
+        if i >= 0:
+            return i + len(sep)
+    return -1
+
+
+def _fit(offsets: List[int], start: int, room: int) -> int:
+    """Наибольший end >= start, при котором text[start:end] не длиннее room в UTF-16."""
+    end = start
+    limit = offsets[start] + room
+    while end + 1 < len(offsets) and offsets[end + 1] <= limit:
+        end += 1
+    return end
+
+
+def split_telegram_text(
+    text: TelegramText, limit: int = MESSAGE_LIMIT
+) -> List[TelegramText]:
+    """Делит TelegramText на части не длиннее limit; сущности на стыках обрезаются."""
+    offsets = utf16_offsets(text.text)
+    n = len(text.text)
+    parts: List[TelegramText] = []
+    start = 0
+    while start < n:
+        end = _fit(offsets, start, limit)
+        cut = n if end == n else _best_cut(text.text, start, end)
+        if cut < 0:
+            cut = max(end, start + 1)
+        stop = cut
+        while stop > start and text.text[stop - 1].isspace():
+            stop -= 1
+        if stop > start:
+            parts.append(text.slice(start, stop, offsets))
+        start = cut
+        while start < n and text.text[start].isspace():
+            start += 1
+    return parts
+
+
+class _HTMLSplitter:
+    """
+    Один проход по HTML: текст копится в текущую часть, пока помещается.
+    Часть режется по последней границе блоков (перевод строки вне тегов,
+    лучше пустая строка), если она не раньше середины части; иначе внутри
+    текста — тогда открытые теги закрываются и открываются заново
+    в следующей части.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.parts: List[str] = []
+        self.stack: List[Tuple[str, str]] = []  # (имя, открывающий тег)
+        self.out: List[str] = []
+        self.length = 0
+        # Границы блоков в текущей части: (позиция в out, длина до неё, пустая ли строка)
+        self.breaks: List[Tuple[int, int, bool]] = []
+        self.newline = False  # вывод оканчивается переводом строки
+
+    def flush(self) -> None:
+        if self.length:
+            # Теги, открытые в самом конце части, переходят в следующую пустыми
+            k = 0
+            while k < len(self.stack) and self.out[-1 - k] == self.stack[-1 - k][1]:
+                k += 1
+            open_tags = self.stack[: len(self.stack) - k]
+            closing = "".join(f"</{name}>" for name, _ in reversed(open_tags))
+            self.parts.append(
+                ("".join(self.out[: len(self.out) - k]) + closing).strip()
+            )
+        self.out = [tag for _, tag in self.stack]
+        self.length = 0
+        self.breaks = []
+
+    def block_break(self) -> Optional[Tuple[int, int]]:
+        """Последняя граница блоков не раньше середины части, пустая строка — первой."""
+        floor = self.limit // 2
+        for blank in (True, False):
+            for index, length, is_blank in reversed(self.breaks):
+                if length < floor:
+                    break
+                if is_blank or not blank:
+                    return index, length
+        return None
+
+    def carry(self, index: int, length: int) -> None:
+        """Часть заканчивается на границе блоков, остаток — в следующую."""
+        tail, rest = self.out[index:], self.length - length
+        # На границе блоков открытых тегов нет: закрывать нечего
+        self.parts.append("".join(self.out[:index]).strip())
+        self.out, self.length, self.breaks = tail, rest, []
+
+    def tag(self, token: str) -> None:
+        match = _TAG_NAME_RE.match(token)
+        if match is None:
+            self.out.append(html.escape(token, quote=False))
+            return
+        name = match.group(1).lower()
+        if token.startswith("</"):
+            for i in range(len(self.stack) - 1, -1, -1):
+                if self.stack[i][0] == name:
+                    del self.stack[i]
+                    break
+        elif not token.endswith("/>"):
+            self.stack.append((name, token))
+        self.out.append(token)
+        self.newline = False
+
+    def text(self, chunk: str) -> None:
+        if self.stack:
+            self.line(chunk)
+            self.newline = chunk.endswith("\n")
+            return
+        for line in _LINE_RE.findall(chunk):
+            self.line(line)
+            if line.endswith("\n"):
+                blank = self.newline and line == "\n"
+                self.breaks.append((len(self.out), self.length, blank))
+            self.newline = line.endswith("\n")
+
+    def line(self, chunk: str) -> None:
+        plain = html.unescape(chunk)
+        offsets = utf16_offsets(plain)
+        start, n = 0, len(plain)
+        while start < n:
+            room = self.limit - self.length
+            end = _fit(offsets, start, room)
+            if end == n:
+                self.out.append(html.escape(plain[start:], quote=False))
+                self.length += offsets[n] - offsets[start]
+                return
+            boundary = self.block_break()
+            if boundary is not None:
+                self.carry(*boundary)
+                continue
+            cut = _best_cut(plain, start, end)
+            if cut < 0:
+                if self.length:
+                    self.flush()  # без границы в остатке места: новая часть
+                    continue
+                cut = max(end, start + 1)
+            self.out.append(html.escape(plain[start:cut].rstrip(), quote=False))
+            self.length += offsets[cut] - offsets[start]
+            self.flush()
+            start = cut
+            while start < n and plain[start].isspace():
+                start += 1
+
+    def feed(self, source: str) -> List[str]:
+        for tag, chunk in _TOKEN_RE.findall(source):
+            if tag:
+                self.tag(tag)
+            else:
+                self.text(chunk)
+        self.flush()
+        return [part for part in self.parts if part]
+
+
+def split_telegram_html(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Делит HTML для parse_mode=HTML на части не длиннее limit с балансом тегов."""
+    return _HTMLSplitter(limit).feed(text)
+
+
+def _length(part: Part) -> int:
+    if isinstance(part, TelegramText):
+        return part.utf16_length
+    return html_text_length(part)
+
+
+def _sep(part: Part) -> str:
+    return "" if isinstance(part, TelegramText) else HTML_SEP
+
+
+def _join(head: Part, tail: Part) -> Part:
+    if isinstance(head, TelegramText) and isinstance(tail, TelegramText):
+        return head.concat(tail)
+    if isinstance(head, str) and isinstance(tail, str):
+        return head + HTML_SEP + tail
+    raise TypeError("Блоки сообщения в разных форматах: HTML и TelegramText")
+
+
+def _lstrip(part: Part) -> Part:
+    """Часть начинается без переводов строк, отделявших блок от предыдущего."""
+    if isinstance(part, TelegramText):
+        n = len(part.text) - len(part.text.lstrip())
+        return part.slice(n, len(part.text)) if n else part
+    return part.lstrip()
+
+
+def _split(part: Part, limit: int) -> Sequence[Part]:
+    if isinstance(part, TelegramText):
+        return split_telegram_text(part, limit)
+    return split_telegram_html(part, limit)
+
+
+def pack_message_parts(
+    blocks: Iterable[Part], limit: int = MESSAGE_LIMIT
+) -> Iterator[Part]:
+    """
+    Собирает блоки верхнего уровня в сообщения не длиннее limit.
+    Блоки (абзацы, списки, блоки кода) не разрываются, пока помещаются
+    в сообщение целиком; слишком длинный блок режется внутри.
+    Генератор ленивый: первая часть готова, как только набрана.
+    """
+    current: Optional[Part] = None
+    length = 0
+    for block in blocks:
+        size = _length(block)
+        if size > limit:
+            # Начало длинного блока дописывается в текущую часть
+            head = _lstrip(block) if current is None else _join(current, block)
+            pieces = _split(head, limit)
+            if not pieces:
+                current = None
+                continue
+            yield from pieces[:-1]
+            current, length = pieces[-1], _length(pieces[-1])
+            continue
+        if current is None:
+            current, length = _lstrip(block), size
+        elif length + len(_sep(block)) + size <= limit:
+            current = _join(current, block)
+            length += len(_sep(block)) + size
+        else:
+            yield current
+            current, length = _lstrip(block), size
+    if current is not None:
+        yield current
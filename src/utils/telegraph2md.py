@@ -0,0 +1,159 @@
+import hashlib
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+Node = Union[str, Dict[str, Any]]
+
+# Обратное соответствие тегов Telegraph → Markdown-обрамление для inline-элементов
+INLINE_WRAP = {
+    "b": "**",
+    "strong": "**",
+    "i": "*",
+    "em": "*",
+    "s": "~~",
+}
+
+HEADINGS = {"h3": "### ", "h4": "#### "}
+
+# Символы, которые Markdown в обычном тексте принял бы за разметку
+_MD_SPECIAL_RE = re.compile(r"([\\`*_\[\]])")
+
+
+def content_hash(nodes: Sequence[Node], title: Optional[str] = None) -> str:
+    """
+    Стабильный хеш содержимого страницы (канонический JSON узлов);
+    с title — вместе с заголовком, чтобы правка одного заголовка тоже меняла хеш.
+    """
+    data: Any = nodes if title is None else {"title": title, "content": nodes}
+    payload = json.dumps(
+        data, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _escape(text: str) -> str:
+    return _MD_SPECIAL_RE.sub(r"\\\1", text)
+
+
+def _children(node: Dict[str, Any]) -> List[Node]:
+    return node.get("children") or []
+
+
+def _attr(node: Dict[str, Any], name: str) -> str:
+    return (node.get("attrs") or {}).get(name, "") or ""
+
+
+def _inline(nodes: List[Node], raw: bool = False) -> str:
+    """
+    Преобразует список inline-узлов в строку Markdown. Текст экранируется,
+    кроме raw (содержимое кода выводится как есть).
+    """
+    parts: List[str] = []
+    for node in nodes:
+        if isinstance(node, str):
+            parts.append(node if raw else _escape(node))
+            continue
+        tag = node.get("tag", "")
+        if tag == "code":
+            parts.append(f"`{_inline(_children(node), raw=True)}`")
+            continue
+        inner = _inline(_children(node), raw)
+        if tag in INLINE_WRAP:
+            mark = INLINE_WRAP[tag]
+            parts.append(f"{mark}{inner}{mark}" if inner.strip() else inner)
+        elif tag == "u":
+            parts.append(f"<u>{inner}</u>")
+        elif tag == "a":
+            href = _attr(node, "href")
+            parts.append(f"[{inner}]({href})" if href else inner)
+        elif tag == "img":
+            parts.append(f"![{_attr(node, 'alt')}]({_attr(node, 'src')})")
+        elif tag == "br":
+            parts.append("  \n")
+        else:
+            parts.append(inner)
+    return "".join(parts)
+
+
+def _list(node: Dict[str, Any], depth: int) -> str:
+    lines: List[str] = []
+    ordered = node.get("tag") == "ol"
+    indent = "    " * depth
+    for i, item in enumerate(_children(node), start=1):
+        if not isinstance(item, dict) or item.get("tag") != "li":
+            continue
+        marker = f"{i}." if ordered else "-"
+        text_nodes: List[Node] = []
+        nested: List[str] = []
+        for child in _children(item):
+            if isinstance(child, dict) and child.get("tag") in ("ul", "ol"):
+                nested.append(_list(child, depth + 1))
+            elif isinstance(child, dict) and child.get("tag") == "p":
+                text_nodes.extend(_children(child))
+            else:
+                text_nodes.append(child)
+        lines.append(f"{indent}{marker} {_inline(text_nodes).strip()}")
+        lines.extend(nested)
+    return "\n".join(lines)
+
+
+def _block(node: Node) -> str:
+    """Преобразует узел верхнего уровня в Markdown-блок."""
+    if isinstance(node, str):
+        return node.strip()
+
+    tag = node.get("tag", "")
+    children = _children(node)
+
+    if tag in HEADINGS:
+        return HEADINGS[tag] + _inline(children).strip()
+    if tag == "p":
+        return _inline(children).strip()
+    if tag == "hr":
+        return "---"
+    if tag in ("ul", "ol"):
+        return _list(node, 0)
+    if tag == "pre":
+        code = _inline(
+            [
+                c
+                for n in children
+                for c in (_children(n) if isinstance(n, dict) else [n])
+            ],
+            raw=True,
+        )
+        return f"```\n{code.rstrip()}\n```"
+    if tag in ("blockquote", "aside"):
+        inner = "\n\n".join(b for b in (_block(c) for c in children) if b)
+        if not inner:
+            inner = _inline(children)
+        return "\n".join(f"> {line}" if line else ">" for line in inner.splitlines())
+    if tag == "figure":
+        parts: List[str] = []
+        for child in children:
+            if isinstance(child, dict) and child.get("tag") == "figcaption":
+                caption = _inline(_children(child)).strip()
+                if caption:
+                    parts.append(f"*{caption}*")
+            else:
+                parts.append(_block(child))
+        return "\n\n".join(p for p in parts if p)
+    if tag in ("iframe", "video"):
+        return f'<{tag} src="{_attr(node, "src")}"></{tag}>'
+    return _inline([node]).strip()
+
+
+def telegraph_nodes_to_markdown(nodes: List[Node], title: Optional[str] = None) -> str:
+    """
+    Telegraph nodes -> Markdown (обратное преобразование к markdown_to_telegraph_nodes).
+    Заголовок страницы выводится как `# title`, чтобы extract_title нашёл его снова.
+    """
+    blocks: List[str] = []
+    if title:
+        blocks.append(f"# {title}")
+    for node in nodes:
+        block = _block(node)
+        if block:
+            blocks.append(block)
+    return "\n\n".join(blocks) + "\n"
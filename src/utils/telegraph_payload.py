@@ -0,0 +1,115 @@
+import json
+from typing import Any, Dict, Iterable, List, Union
+
+Node = Union[str, Dict[str, Any]]
+
+# Ограничение Telegraph на размер content (JSON) одной страницы
+TELEGRAPH_CONTENT_LIMIT = 64 * 1024
+# Запас под навигационные ссылки «назад / далее» на страницах-продолжениях
+NAV_RESERVE_BYTES = 512
+# Подписи навигационных ссылок между частями
+NAV_PREV = "← Назад"
+NAV_NEXT = "Далее →"
+
+
+def dump_node(node: Any) -> str:
+    """Сериализует узел так же компактно, как это сделал бы Telegraph API."""
+    return json.dumps(node, ensure_ascii=False, separators=(",", ":"))
+
+
+class TelegraphPayloadBuilder:
+    """
+    Собирает content для Telegraph, сериализуя каждый узел ровно один раз
+    и считая размер итогового JSON по мере добавления.
+    Когда очередной узел верхнего уровня не помещается в лимит, начинается
+    новая страница — разрез всегда проходит по границе блока.
+    """
+
+    def __init__(
+        self, limit: int = TELEGRAPH_CONTENT_LIMIT, reserve: int = NAV_RESERVE_BYTES
+    ) -> None:
+        self.limit = limit - reserve
+        self._pages: List[List[str]] = [[]]
+        self._sizes: List[int] = [2]  # "[]"
+        self.oversized: List[int] = []  # номера страниц с узлом больше лимита
+
+    def add(self, node: Node) -> None:
+        fragment = dump_node(node)
+        size = len(fragment.encode("utf-8"))
+        current = self._pages[-1]
+        extra = size + (1 if current else 0)  # запятая-разделитель
+        if current and self._sizes[-1] + extra > self.limit:
+            self._pages.append([])
+            self._sizes.append(2)
+            current = self._pages[-1]
+            extra = size
+        if size + 2 > self.limit:
+            self.oversized.append(len(self._pages) - 1)
+        current.append(fragment)
+        self._sizes[-1] += extra
+
+    def extend(self, nodes: Iterable[Node]) -> "TelegraphPayloadBuilder":
+        for node in nodes:
+            self.add(node)
+        return self
+
+    @property
+    def page_count(self) -> int:
+        return len(self._pages) if self._pages[0] else 0
+
+    @property
+    def sizes(self) -> List[int]:
+        """Размер JSON каждой страницы в байтах (без навигации)."""
+        return list(self._sizes[: self.page_count])
+
+    def payloads(self) -> List[List[str]]:
+        """Сериализованные фрагменты узлов по страницам."""
+        return [list(p) for p in self._pages[: self.page_count]]
+
+
+def join_payload(fragments: List[str], *extra_nodes: Node) -> str:
+    """Склеивает заранее сериализованные фрагменты (и служебные узлы) в JSON-массив."""
+    return "[" + ",".join([*fragments, *(dump_node(n) for n in extra_nodes)]) + "]"
+
+
+def nav_node(prev_url: str | None = None, next_url: str | None = None) -> Node:
+    """Абзац со ссылками на предыдущую / следующую часть."""
+    children: List[Node] = []
+    if prev_url:
+        children.append(
+            {"tag": "a", "attrs": {"href": prev_url}, "children": [NAV_PREV]}
+        )
+    if next_url:
+        if children:
+            children.append(" | ")
+        children.append(
+            {"tag": "a", "attrs": {"href": next_url}, "children": [NAV_NEXT]}
+        )
+    return {"tag": "p", "children": children}
+
+
+def _nav_links(node: Node) -> Dict[str, str] | None:
+    """Ссылки навигационного абзаца {подпись: href} или None, если это не навигация."""
+    if not isinstance(node, dict) or node.get("tag") != "p":
+        return None
+    links: Dict[str, str] = {}
+    for child in node.get("children") or []:
+        if isinstance(child, str):
+            if child.strip(" |"):
+                return None
+            continue
+        label = "".join(c for c in child.get("children") or [] if isinstance(c, str))
+        if child.get("tag") != "a" or label not in (NAV_PREV, NAV_NEXT):
+            return None
+        links[label] = (child.get("attrs") or {}).get("href", "")
+    return links or None
+
+
+def is_nav_node(node: Node) -> bool:
+    return _nav_links(node) is not None
+
+
+def nav_next_url(nodes: List[Node]) -> str | None:
+    """Ссылка «далее» из навигации страницы-части (навигация — последний узел)."""
+    links = _nav_links(nodes[-1]) if nodes else None
+    return (links or {}).get(NAV_NEXT) or None
@@ -1,15 +1,105 @@
-import requests
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple
 
+from core.retry import RetryPolicy
+from utils.image_hosts import ImageHost, ImageHostSelector, ImgBBHost
 
-def upload_to_imgbb(file_path: str, api_key: str) -> str:
+# Файлы, уже загруженные этим процессом: (путь, размер, mtime_ns) → url.
+# Одно изображение, встреченное в документе несколько раз, загружается однажды.
+_uploaded: Dict[Tuple[str, int, int], str] = {}
+
+# Хостинги, заданные configure(); без них загрузка идёт на ImgBB по переданному ключу
+_selector: Optional[ImageHostSelector] = None
+_imgbb_selectors: Dict[str, ImageHostSelector] = {}
+# Хостинги, заданные use_selector() для текущего контекста
+_scoped: ContextVar[Optional[ImageHostSelector]] = ContextVar(
+    "mdp_image_hosts", default=None
+)
+_offline: ContextVar[bool] = ContextVar("mdp_uploads_offline", default=False)
+
+
+def configure(hosts: Optional[Sequence[ImageHost]]) -> None:
+    """Задаёт хостинги изображений в порядке предпочтения (None — только ImgBB)."""
+    global _selector
+    _selector = ImageHostSelector(hosts) if hosts else None
+
+
+def get_selector(api_key: Optional[str] = None) -> Optional[ImageHostSelector]:
+    scoped = _scoped.get()
+    if scoped is not None:
+        return scoped
+    if _selector is not None:
+        return _selector
+    if not api_key:
+        return None
+    if api_key not in _imgbb_selectors:
+        _imgbb_selectors[api_key] = ImageHostSelector([ImgBBHost(api_key)])
+    return _imgbb_selectors[api_key]
+
+
+@contextmanager
+def use_selector(selector: ImageHostSelector) -> Iterator[None]:
+    """Внутри блока изображения загружаются через selector, а не configure()."""
+    token = _scoped.set(selector)
+    try:
+        yield
+    finally:
+        _scoped.reset(token)
+
+
+@contextmanager
+def offline() -> Iterator[None]:
+    """Внутри блока локальные изображения не загружаются (офлайн-рендер)."""
+    token = _offline.set(True)
+    try:
+        yield
+    finally:
+        _offline.reset(token)
+
+
+def uploads_enabled(api_key: Optional[str] = None) -> bool:
+    """Можно ли загружать локальные изображения: есть хостинг и не офлайн-режим."""
+    return not _offline.get() and get_selector(api_key) is not None
+
+
+def _file_key(file_path: str) -> Tuple[str, int, int]:
+    path = Path(file_path).resolve()
+    st = path.stat()
+    return str(path), st.st_size, st.st_mtime_ns
+
+
+def uploaded_url(file_path: str) -> Optional[str]:
+    """Ссылка на файл, если он уже загружался в этом процессе."""
+    try:
+        return _uploaded.get(_file_key(file_path))
+    except OSError:
+        return None
+
+
+def upload_image(file_path: str, api_key: Optional[str] = None) -> str:
+    """
+    Загружает локальный файл на самый быстрый из исправных хостингов
+    (с переключением на следующий при ошибке) и возвращает ссылку.
+    api_key используется, только если хостинги не заданы через configure().
+    """
+    key = _file_key(file_path)
+    if key in _uploaded:
+        return _uploaded[key]
+    selector = get_selector(api_key)
+    if selector is None:
+        raise RuntimeError("Не задан ни один хостинг изображений")
+    url = _uploaded[key] = selector.upload(file_path)
+    return url
+
+
+def upload_to_imgbb(
+    file_path: str, api_key: str, retry_policy: Optional[RetryPolicy] = None
+) -> str:
     """Загружает локальный файл на ImgBB и возвращает прямую ссылку на изображение."""
-    with open(file_path, "rb") as f:
-        resp = requests.post(
-            "https://api.imgbb.com/1/upload",
-            params={"key": api_key},
-            files={"image": f},
-        )
-    data = resp.json()
-    if not data.get("success"):
-        raise RuntimeError(f"Ошибка загрузки {file_path}: {data}")
-    return data["data"]["url"]
+    key = _file_key(file_path)
+    if key in _uploaded:
+        return _uploaded[key]
+    url = _uploaded[key] = ImgBBHost(api_key).upload(file_path, retry_policy)
+    return url